@@ -5,24 +5,28 @@ Mishloach Manot Management System - Main Application
 Flask application for managing residents, orders, and package deliveries
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, Response, stream_with_context, render_template, request, redirect, url_for, session, flash, jsonify
 import os
 import sys
-from werkzeug.utils import secure_filename
-import pandas as pd
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import io
-import csv as csv_module
 from datetime import datetime
+import uuid
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.config import Config
-from app.auth import login_required, verify_user, update_last_login, get_db_connection
+from app.auth import login_required, verify_user, update_last_login
+from app.db import get_cursor, pool_stats
+from app import metrics, schema_cache
+from app.reports import refresh_reports, report_freshness
+from app.dashboard import get_dashboard_stats
+from app.jobs import submit_job, get_job
+from app.events import stream_job_events
+from app.profiling import profile_view, get_profile, list_profiles
+from app.etl_ledger import history as etl_history_runs, list_runs as list_etl_runs, run_kinds as etl_run_kinds
+from app.pipelines import run_residents_upload, run_orders_upload, run_orders_import, run_database_function
 from app.utils import (
-    execute_function, get_table_data, get_view_data, export_to_csv,
+    get_table_data, get_view_data, stream_view_csv,
     get_function_parameters, get_all_functions, get_all_views, get_all_tables
 )
 
@@ -31,6 +35,7 @@ app = Flask(__name__,
             template_folder='../templates',
             static_folder='../static')
 app.config.from_object(Config)
+metrics.init_app(app)
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -92,35 +97,99 @@ def logout():
 @login_required
 def dashboard():
     """Main dashboard"""
-    from psycopg2.extras import RealDictCursor
-    conn = psycopg2.connect(Config.DATABASE_URL)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    try:
-        # Get statistics
-        cur.execute("SELECT COUNT(*) as count FROM person")
-        total_residents = cur.fetchone()['count']
-        
-        cur.execute('SELECT COUNT(*) as count FROM "Order"')
-        total_orders = cur.fetchone()['count']
-        
-        cur.execute("SELECT COUNT(*) as count FROM outerapporder WHERE status = 'waiting'")
-        pending_orders = cur.fetchone()['count']
-        
-        cur.execute("SELECT COUNT(*) as count FROM person WHERE autoreturn = true")
-        autoreturn_count = cur.fetchone()['count']
-        
-        stats = {
-            'total_residents': total_residents,
-            'total_orders': total_orders,
-            'pending_orders': pending_orders,
-            'autoreturn_count': autoreturn_count
-        }
-        
-        return render_template('dashboard.html', stats=stats)
-    finally:
-        cur.close()
-        conn.close()
+    stats = get_dashboard_stats(fresh=request.args.get('refresh') == '1')
+    return render_template('dashboard.html', stats=stats)
+
+
+# ============================================================
+# BACKGROUND JOBS
+# ============================================================
+
+def wants_json():
+    """API clients (Accept: application/json) get JSON instead of a redirect"""
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def job_started(job_id):
+    """Response for a queued job: 202 + job id (API) or the job status page"""
+    if wants_json():
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('get_job_api', job_id=job_id)
+        }), 202
+    return redirect(url_for('job_status', job_id=job_id))
+
+
+def start_upload_job(kind, pipeline):
+    """Validate the uploaded file, save it under UPLOAD_FOLDER and queue the pipeline"""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        flash('לא נבחר קובץ', 'danger')
+        return redirect(request.url)
+
+    if not Config.allowed_file(file.filename):
+        flash('סוג קובץ לא נתמך. השתמש ב-CSV או Excel', 'danger')
+        return redirect(request.url)
+
+    # secure_filename drops Hebrew characters, so the saved name is random
+    # and the original name travels with the job
+    ext = os.path.splitext(file.filename)[1].lower()
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f'{uuid.uuid4().hex}{ext}')
+    file.save(path)
+
+    # "ייבוא מחדש": import even an unchanged file, reload already loaded rows
+    force = request.form.get('force') == '1'
+    job_id = submit_job(kind, pipeline, path, file.filename, force,
+                        filename=file.filename, params={'force': force} if force else None,
+                        cleanup_path=path)
+    return job_started(job_id)
+
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """Progress page of a background job"""
+    job = get_job(job_id)
+    if job is None:
+        flash(f'עבודה {job_id} לא נמצאה', 'danger')
+        return redirect(url_for('dashboard'))
+    return render_template('job.html', job=job)
+
+
+def job_json(job_id):
+    """Job row with JSON-friendly values (None if missing)"""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job = dict(job)
+    job['progress'] = float(job['progress'])
+    for key in ('created_at', 'started_at', 'finished_at', 'updated_at'):
+        if job[key] is not None:
+            job[key] = job[key].isoformat()
+    return job
+
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def get_job_api(job_id):
+    """Job state: status, stage, progress, row counts, messages, final stats"""
+    job = job_json(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/jobs/<int:job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events: job updates and ETL batch progress (LISTEN/NOTIFY)"""
+    if get_job(job_id) is None:
+        return jsonify({'error': 'job not found'}), 404
+    return Response(
+        stream_with_context(stream_job_events(job_id, job_json)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 # ============================================================
@@ -130,308 +199,67 @@ def dashboard():
 @app.route('/upload-residents', methods=['GET', 'POST'])
 @login_required
 def upload_residents():
-    """Upload residents CSV/Excel file"""
-    
-    def safe_int(value, default=0):
-        """Safely convert value to int, return default if conversion fails"""
-        if pd.isna(value):
-            return default
-        if isinstance(value, (int, float)):
-            return int(value)
-        if isinstance(value, str):
-            # Try to extract number from string
-            value = value.strip().lower()
-            # Check if it's a "no value" string
-            no_value_strings = ['אין', 'אין דירה', 'ללא', 'ללא דירה', 'none', '']
-            if value in no_value_strings:
-                return default
-            # Try to convert to int
-            try:
-                return int(float(value))
-            except (ValueError, TypeError):
-                return default
-        return default
-    
+    """Upload residents CSV/Excel file (processed as a background job)"""
     if request.method == 'POST':
-        if 'file' not in request.files:
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        file = request.files['file']
-        if file.filename == '':
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        if file and Config.allowed_file(file.filename):
-            try:
-                # Read the file
-                if file.filename.endswith('.csv'):
-                    df = pd.read_csv(file, encoding='utf-8-sig')
-                else:
-                    df = pd.read_excel(file)
-                
-                # Clean column names
-                df.columns = df.columns.str.strip()
-                original_columns = list(df.columns)
-                
-                # Auto-map column names
-                column_mapping = {
-                    # Various forms of lastname
-                    'last_name': 'lastname',
-                    'lastname': 'lastname',
-                    'family_name': 'lastname',
-                    'surname': 'lastname',
-                    
-                    # Various forms of father_name
-                    'father_first_name': 'father_name',
-                    'father_name': 'father_name',
-                    'first_name': 'father_name',
-                    'firstname': 'father_name',
-                    
-                    # Various forms of mother_name
-                    'mother_first_name': 'mother_name',
-                    'mother_name': 'mother_name',
-                    
-                    # Various forms of street
-                    'street': 'streetname',
-                    'streetname': 'streetname',
-                    'street_name': 'streetname',
-                    
-                    # Various forms of building number
-                    'building_number': 'buildingnumber',
-                    'buildingnumber': 'buildingnumber',
-                    'house_number': 'buildingnumber',
-                    'housenumber': 'buildingnumber',
-                    
-                    # Various forms of entrance
-                    'entrance': 'entrance',
-                    
-                    # Various forms of apartment number
-                    'apartment_number': 'apartmentnumber',
-                    'apartmentnumber': 'apartmentnumber',
-                    'apartment': 'apartmentnumber',
-                    'flat_number': 'apartmentnumber',
-                    
-                    # Phone numbers
-                    'phone': 'phone',
-                    'home_phone': 'phone',
-                    'homephone': 'phone',
-                    'telephone': 'phone',
-                    
-                    'mobile': 'mobile',
-                    'mobile1': 'mobile',
-                    'cell': 'mobile',
-                    'cellphone': 'mobile',
-                    
-                    'mobile2': 'mobile2',
-                    
-                    # Email
-                    'email': 'email',
-                    'mail': 'email',
-                    
-                    # Code
-                    'code': 'code',
-                    'id': 'code',
-                    
-                    # Standing order
-                    'standing_order': 'standing_order',
-                    'rating': 'standing_order',
-                }
-                
-                # Rename columns based on mapping
-                mapped_columns = {}
-                new_column_names = []
-                for orig_col in df.columns:
-                    mapped_col = column_mapping.get(orig_col.lower(), orig_col)
-                    new_column_names.append(mapped_col)
-                    if mapped_col != orig_col:
-                        mapped_columns[orig_col] = mapped_col
-                
-                df.columns = new_column_names
-                
-                # Log column mapping
-                if mapped_columns:
-                    print("🔄 מיפוי עמודות:")
-                    for orig, mapped in mapped_columns.items():
-                        print(f"   {orig} → {mapped}")
-                
-                # Replace "אין" and empty strings with None
-                replace_values = ['אין', 'אין דירה', 'ללא', 'ללא דירה', 'nan', 'NaN', '', 'None', 'none']
-                for col in df.columns:
-                    if col in ['lastname', 'father_name', 'mother_name', 'streetname', 
-                              'buildingnumber', 'entrance', 'apartmentnumber', 'phone', 'mobile', 'mobile2', 'email']:
-                        df[col] = df[col].replace(replace_values, None)
-                        df[col] = df[col].apply(lambda x: None if pd.isna(x) or 
-                                                 (isinstance(x, str) and x.strip().lower() in [v.lower() for v in replace_values]) 
-                                                 else x)
-                
-                # Connect to database
-                conn = get_db_connection()
-                cur = conn.cursor()
-                
-                # Clear raw table
-                cur.execute("TRUNCATE TABLE raw_residents_csv RESTART IDENTITY")
-                conn.commit()
-                
-                # Insert data
-                rows_inserted = 0
-                for _, row in df.iterrows():
-                    cur.execute("""
-                        INSERT INTO raw_residents_csv 
-                        (code, lastname, father_name, mother_name, streetname, 
-                         buildingnumber, entrance, apartmentnumber, phone, mobile, 
-                         mobile2, email, standing_order)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        row.get('code'),
-                        row.get('lastname'),
-                        row.get('father_name'),
-                        row.get('mother_name'),
-                        row.get('streetname'),
-                        row.get('buildingnumber'),
-                        row.get('entrance'),
-                        row.get('apartmentnumber'),
-                        row.get('phone'),
-                        row.get('mobile'),
-                        row.get('mobile2'),
-                        row.get('email'),
-                        safe_int(row.get('standing_order', 0))
-                    ))
-                    rows_inserted += 1
-                
-                conn.commit()
-                
-                # Show mapping message if any
-                if mapped_columns:
-                    mapping_msg = "🔄 מיפוי עמודות אוטומטי:\n" + "\n".join([f"• {o} → {m}" for o, m in list(mapped_columns.items())[:5]])
-                    if len(mapped_columns) > 5:
-                        mapping_msg += f"\n• ועוד {len(mapped_columns) - 5}..."
-                    flash(mapping_msg, 'info')
-                
-                flash(f'✅ שלב 1: {rows_inserted} שורות נטענו לטבלת raw', 'info')
-                
-                # Run ETL process - Stage 1: raw to temp
-                print("Running raw_to_temp_stage()...")
-                cur.execute("SELECT raw_to_temp_stage()")
-                result1 = cur.fetchone()
-                conn.commit()
-                
-                temp_count = result1['raw_to_temp_stage'] if result1 else 0
-                flash(f'✅ שלב 2: {temp_count} שורות הועברו לטבלת temp', 'info')
-                
-                # Run ETL process - Stage 2: temp to person
-                print("Running process_residents_csv()...")
-                cur.execute("SELECT process_residents_csv()")
-                result2 = cur.fetchone()
-                conn.commit()
-                
-                processed_count = result2['process_residents_csv'] if result2 else 0
-                flash(f'✅ שלב 3: {processed_count} תושבים עובדו בהצלחה!', 'success')
-                
-                # Get statistics
-                cur.execute("""
-                    SELECT 
-                        COUNT(*) FILTER (WHERE status = 'הופץ') as inserted,
-                        COUNT(*) FILTER (WHERE status = 'אוחד') as merged,
-                        COUNT(*) FILTER (WHERE status = 'נדחה') as skipped,
-                        COUNT(*) FILTER (WHERE status = 'התאמה חלקית') as partial_match
-                    FROM temp_residents_csv
-                """)
-                stats = cur.fetchone()
-                
-                if stats:
-                    flash(f"""📊 סטטיסטיקות:
-                    • נוספו: {stats['inserted'] or 0}
-                    • אוחדו: {stats['merged'] or 0}
-                    • נדחו: {stats['skipped'] or 0}
-                    • התאמה חלקית: {stats['partial_match'] or 0}
-                    """, 'info')
-                
-                # If many were skipped, show warning
-                if stats and stats['skipped'] > 0:
-                    flash(f'⚠️ {stats["skipped"]} תושבים נדחו! בדוק ב-"דיבאג ETL" למה', 'warning')
-                
-                # Check final person count
-                cur.execute("SELECT COUNT(*) as total FROM person")
-                total = cur.fetchone()
-                flash(f'👥 סה"כ תושבים במערכת: {total["total"]}', 'success')
-                
-                cur.close()
-                conn.close()
-                
-                return redirect(url_for('dashboard'))
-                
-            except Exception as e:
-                flash(f'שגיאה בעיבוד הקובץ: {str(e)}', 'danger')
-                print(f"Error in upload_residents: {e}")
-                import traceback
-                traceback.print_exc()
-                return redirect(request.url)
-        else:
-            flash('סוג קובץ לא נתמך. השתמש ב-CSV או Excel', 'danger')
-            return redirect(request.url)
-    
+        return start_upload_job('residents_upload', run_residents_upload)
+
     return render_template('upload_residents.html')
 
 
+
 @app.route('/debug-etl')
 @login_required
 def debug_etl():
     """Debug ETL process"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     try:
-        # RAW count
-        cur.execute("SELECT COUNT(*) as count FROM raw_residents_csv")
-        raw_count = cur.fetchone()['count']
-        
-        # RAW sample
-        cur.execute("SELECT * FROM raw_residents_csv LIMIT 1")
-        raw_sample = cur.fetchone()
+        with get_cursor() as cur:
+            # RAW count
+            cur.execute("SELECT COUNT(*) as count FROM raw_residents_csv")
+            raw_count = cur.fetchone()['count']
         
-        # TEMP count
-        cur.execute("SELECT COUNT(*) as count FROM temp_residents_csv")
-        temp_count = cur.fetchone()['count']
+            # RAW sample
+            cur.execute("SELECT * FROM raw_residents_csv LIMIT 1")
+            raw_sample = cur.fetchone()
         
-        # TEMP stats
-        cur.execute("""
-            SELECT 
-                COUNT(*) FILTER (WHERE status = 'אוחד') as merged,
-                COUNT(*) FILTER (WHERE status = 'הופץ') as inserted,
-                COUNT(*) FILTER (WHERE status = 'התאמה חלקית') as partial,
-                COUNT(*) FILTER (WHERE status = 'נדחה') as skipped,
-                COUNT(*) FILTER (WHERE status IS NULL OR status = '') as pending
-            FROM temp_residents_csv
-        """)
-        temp_stats = cur.fetchone()
+            # TEMP count
+            cur.execute("SELECT COUNT(*) as count FROM temp_residents_csv")
+            temp_count = cur.fetchone()['count']
         
-        # PERSON count
-        cur.execute("SELECT COUNT(*) as count FROM person")
-        person_count = cur.fetchone()['count']
+            # TEMP stats
+            cur.execute("""
+                SELECT 
+                    COUNT(*) FILTER (WHERE status = 'אוחד') as merged,
+                    COUNT(*) FILTER (WHERE status = 'הופץ') as inserted,
+                    COUNT(*) FILTER (WHERE status = 'התאמה חלקית') as partial,
+                    COUNT(*) FILTER (WHERE status = 'נדחה') as skipped,
+                    COUNT(*) FILTER (WHERE status IS NULL OR status = '') as pending
+                FROM temp_residents_csv
+            """)
+            temp_stats = cur.fetchone()
         
-        # PERSON sample (last added)
-        cur.execute("SELECT * FROM person ORDER BY personid DESC LIMIT 1")
-        person_sample = cur.fetchone()
+            # PERSON count
+            cur.execute("SELECT COUNT(*) as count FROM person")
+            person_count = cur.fetchone()['count']
         
-        # Archive records (last 10)
-        cur.execute("""
-            SELECT * FROM person_archive 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        """)
-        archive_records = cur.fetchall()
+            # PERSON sample (last added)
+            cur.execute("SELECT * FROM person ORDER BY personid DESC LIMIT 1")
+            person_sample = cur.fetchone()
         
-        # Get skipped records sample (if any)
-        cur.execute("""
-            SELECT * FROM temp_residents_csv 
-            WHERE status = 'נדחה'
-            LIMIT 5
-        """)
-        skipped_sample = cur.fetchall()
+            # Archive records (last 10)
+            cur.execute("""
+                SELECT * FROM person_archive 
+                ORDER BY created_at DESC 
+                LIMIT 10
+            """)
+            archive_records = cur.fetchall()
         
-        cur.close()
-        conn.close()
+            # Get skipped records sample (if any)
+            cur.execute("""
+                SELECT * FROM temp_residents_csv 
+                WHERE status = 'נדחה'
+                LIMIT 5
+            """)
+            skipped_sample = cur.fetchall()
         
         return render_template('debug_etl.html',
                              raw_count=raw_count,
@@ -448,6 +276,32 @@ def debug_etl():
         return redirect(url_for('dashboard'))
 
 
+@app.route('/etl-history')
+@login_required
+def etl_history():
+    """ETL run ledger: stage timings per run, regressions against earlier runs"""
+    kinds = etl_run_kinds()
+    kind = request.args.get('kind') or (kinds[0] if kinds else 'residents')
+    limit = min(request.args.get('limit', 30, type=int), 200)
+    runs, stage_names = etl_history_runs(kind, limit)
+    return render_template('etl_history.html', kinds=kinds, kind=kind,
+                           runs=runs, stage_names=stage_names)
+
+
+@app.route('/api/etl-runs')
+@login_required
+def get_etl_runs_api():
+    """ETL runs with their stages (?kind=residents&limit=50)"""
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    runs = list_etl_runs(request.args.get('kind'), limit)
+    for run in runs:
+        for row in [run] + run['stages']:
+            for key in ('started_at', 'finished_at'):
+                if row.get(key) is not None:
+                    row[key] = row[key].isoformat()
+    return jsonify({'runs': runs})
+
+
 # ============================================================
 # UPLOAD OUTER ORDERS
 # ============================================================
@@ -455,153 +309,20 @@ def debug_etl():
 @app.route('/upload-orders', methods=['GET', 'POST'])
 @login_required
 def upload_orders():
-    """Upload outer orders CSV file"""
+    """Upload outer orders CSV file (processed as a background job)"""
     if request.method == 'POST':
-        if 'file' not in request.files:
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        file = request.files['file']
-        if file.filename == '':
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        if file and Config.allowed_file(file.filename):
-            try:
-                # Read CSV
-                if file.filename.endswith('.csv'):
-                    df = pd.read_csv(file, encoding='utf-8-sig')
-                else:
-                    df = pd.read_excel(file)
-                
-                # Clean column names
-                df.columns = df.columns.str.strip()
-                
-                # Map rating to package_size
-                rating_map = {
-                    1: 'סמלי',
-                    2: 'מכובד',
-                    3: 'מפואר',
-                    '1': 'סמלי',
-                    '2': 'מכובד',
-                    '3': 'מפואר'
-                }
-                
-                # Connect to database
-                conn = get_db_connection()
-                cur = conn.cursor()
-                
-                rows_inserted = 0
-                for _, row in df.iterrows():
-                    # Extract order_code as sender_code
-                    sender_code = str(row.get('order_code', ''))
-                    
-                    # Extract guest_list as invitees
-                    invitees = str(row.get('guest_list', ''))
-                    
-                    # Map rating to package_size
-                    rating = row.get('rating')
-                    package_size = rating_map.get(rating, rating_map.get(str(rating), 'סמלי'))
-                    
-                    cur.execute("""
-                        INSERT INTO outerapporder 
-                        (sender_code, invitees, package_size, origin, created_at, status)
-                        VALUES (%s, %s, %s, %s, NOW(), 'waiting')
-                    """, (
-                        sender_code,
-                        invitees,
-                        package_size,
-                        'external_app'
-                    ))
-                    rows_inserted += 1
-                
-                conn.commit()
-                
-                # Run distribution
-                cur.execute("SELECT distribute_all_outer_orders()")
-                result = cur.fetchone()
-                distributed = result[0] if result else 0
-                conn.commit()
-                
-                flash(f'הקובץ הועלה בהצלחה! {rows_inserted} הזמנות נטענו, {distributed} הופצו', 'success')
-                
-                cur.close()
-                conn.close()
-                
-                return redirect(url_for('dashboard'))
-                
-            except Exception as e:
-                flash(f'שגיאה בעיבוד הקובץ: {str(e)}', 'danger')
-                return redirect(request.url)
-        else:
-            flash('סוג קובץ לא נתמך. השתמש ב-CSV או Excel', 'danger')
-            return redirect(request.url)
-    
+        return start_upload_job('orders_upload', run_orders_upload)
+
     return render_template('upload_orders.html')
 
 
 @app.route('/import-orders-direct', methods=['GET', 'POST'])
 @login_required
 def import_orders_direct():
-    """Import orders directly from CSV (order_code + guest_list)"""
-    from app.import_orders import import_orders_from_csv
-    
+    """Import orders directly from CSV (order_code + guest_list), as a background job"""
     if request.method == 'POST':
-        if 'file' not in request.files:
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        file = request.files['file']
-        if file.filename == '':
-            flash('לא נבחר קובץ', 'danger')
-            return redirect(request.url)
-        
-        if file and Config.allowed_file(file.filename):
-            try:
-                conn = get_db_connection()
-                stats = import_orders_from_csv(file, conn)
-                conn.close()
-                
-                # Build success message
-                messages = [
-                    f'✅ {stats["total_orders"]} הזמנות עובדו',
-                    f'✅ {stats["successful_pairs"]} זוגות שולח-מקבל נוצרו בהצלחה!',
-                ]
-                
-                if stats['failed_pairs'] > 0:
-                    messages.append(f'⚠️ {stats["failed_pairs"]} זוגות נכשלו')
-                
-                if stats['missing_senders']:
-                    count = len(stats['missing_senders'])
-                    sample = ', '.join(str(c) for c in stats['missing_senders'][:5])
-                    if count > 5:
-                        sample += f'... ועוד {count-5}'
-                    messages.append(f'⚠️ שולחים חסרים ({count}): {sample}')
-                
-                if stats['missing_receivers']:
-                    count = len(stats['missing_receivers'])
-                    sample = ', '.join(str(c) for c in stats['missing_receivers'][:5])
-                    if count > 5:
-                        sample += f'... ועוד {count-5}'
-                    messages.append(f'⚠️ מקבלים חסרים ({count}): {sample}')
-                
-                for msg in messages:
-                    if '✅' in msg:
-                        flash(msg, 'success')
-                    elif '⚠️' in msg:
-                        flash(msg, 'warning')
-                    else:
-                        flash(msg, 'info')
-                
-                return redirect(url_for('dashboard'))
-                
-            except Exception as e:
-                flash(f'שגיאה בייבוא הזמנות: {str(e)}', 'danger')
-                return redirect(request.url)
-        else:
-            flash('סוג קובץ לא נתמך. השתמש ב-CSV או Excel', 'danger')
-            return redirect(request.url)
-    
+        return start_upload_job('orders_import', run_orders_import)
+
     return render_template('import_orders_direct.html')
 
 
@@ -629,14 +350,16 @@ def run_procedures():
                 if param_value:
                     params.append(param_value)
             
-            # Execute function
-            result = execute_function(func_name, params if params else None)
-            
-            flash(f'הפונקציה {func_name} הורצה בהצלחה! תוצאה: {result}', 'success')
-            
+            # Profile mode: EXPLAIN ANALYZE in a transaction that is rolled back
+            profile = request.form.get('profile') == '1'
+            job_id = submit_job('function_profile' if profile else 'function',
+                                run_database_function, func_name, params, profile, session.get('username'),
+                                params={'function': func_name, 'args': params, 'profile': profile})
+            return job_started(job_id)
+
         except Exception as e:
             flash(f'שגיאה בהרצת הפונקציה: {str(e)}', 'danger')
-    
+
     return render_template('run_procedures.html', functions=functions)
 
 
@@ -663,25 +386,31 @@ def view_tables():
     return render_template('view_tables.html', tables=tables)
 
 
+def paging_args():
+    """Pagination / sort / search / filter query parameters shared by tables and views"""
+    filters = {
+        key[len('filter['):-1]: value
+        for key, value in request.args.items()
+        if key.startswith('filter[') and key.endswith(']') and value != ''
+    }
+    return {
+        'limit': int(request.args.get('limit', 50)),
+        'offset': int(request.args.get('offset', 0)),
+        'search': request.args.get('search') or None,
+        'order_by': request.args.get('order_by') or None,
+        'cursor': request.args.get('cursor') or None,
+        'before': request.args.get('before') or None,
+        'exact_count': request.args.get('exact_count', '').lower() in ('1', 'true', 'yes'),
+        'filters': filters or None,
+    }
+
+
 @app.route('/api/table-data/<table_name>')
 @login_required
 def get_table_data_api(table_name):
     """API to get table data with pagination"""
     try:
-        limit = int(request.args.get('limit', 50))
-        offset = int(request.args.get('offset', 0))
-        search = request.args.get('search', '')
-        order_by = request.args.get('order_by', '')
-        
-        result = get_table_data(
-            table_name,
-            limit=limit,
-            offset=offset,
-            search=search if search else None,
-            order_by=order_by if order_by else None
-        )
-        
-        return jsonify(result)
+        return jsonify(get_table_data(table_name, **paging_args()))
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -695,16 +424,17 @@ def get_table_data_api(table_name):
 def reports():
     """Reports page"""
     views = get_all_views()
-    return render_template('reports.html', views=views)
+    freshness = {row['view_name']: row for row in report_freshness()}
+    return render_template('reports.html', views=views, freshness=freshness)
 
 
 @app.route('/api/view-data/<view_name>')
 @login_required
 def get_view_data_api(view_name):
-    """API to get view data"""
+    """API to get view data with pagination (same parameters as /api/table-data)"""
     try:
-        data = get_view_data(view_name)
-        return jsonify({'data': data})
+        live = request.args.get('live', '').lower() in ('1', 'true', 'yes')
+        return jsonify(get_view_data(view_name, live=live, **paging_args()))
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -712,37 +442,157 @@ def get_view_data_api(view_name):
 @app.route('/api/export-view/<view_name>')
 @login_required
 def export_view(view_name):
-    """Export view to CSV"""
+    """Export view to CSV (streamed in batches)"""
     try:
-        data = get_view_data(view_name)
-        
-        if not data:
+        live = request.args.get('live', '').lower() in ('1', 'true', 'yes')
+        chunks = stream_view_csv(view_name, live=live)
+        # Runs the query; nothing is yielded for an empty view
+        first = next(chunks, None)
+
+        if first is None:
             flash('אין נתונים לייצוא', 'warning')
             return redirect(url_for('reports'))
-        
-        # Get column names
-        columns = list(data[0].keys())
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv_module.DictWriter(output, fieldnames=columns)
-        writer.writeheader()
-        writer.writerows(data)
-        
-        # Create BytesIO object
-        csv_data = io.BytesIO(output.getvalue().encode('utf-8-sig'))
-        
-        return send_file(
-            csv_data,
+
+        def generate():
+            try:
+                yield first
+                yield from chunks
+            finally:
+                # Client went away mid-download - give the connection back
+                chunks.close()
+
+        filename = f'{view_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return Response(
+            generate(),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'{view_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
         )
     except Exception as e:
         flash(f'שגיאה בייצוא: {str(e)}', 'danger')
         return redirect(url_for('reports'))
 
 
+@app.route('/api/reports/refresh', methods=['POST'])
+@login_required
+def refresh_reports_api():
+    """Refresh the materialized report copies (all, or ?view=<name>)"""
+    try:
+        refreshed = refresh_reports(request.args.get('view') or None)
+        return jsonify({'success': True, 'refreshed': refreshed})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/reports/profile', methods=['POST'])
+@login_required
+def profile_report_api():
+    """EXPLAIN ANALYZE the report ?view=<name> (the live view unless live=0)"""
+    try:
+        live = request.args.get('live', '1').lower() in ('1', 'true', 'yes')
+        profile_id = profile_view(request.args.get('view', ''), live=live,
+                                  created_by=session.get('username'))
+        return jsonify({'success': True, 'profile_id': profile_id,
+                        'url': url_for('query_profile', profile_id=profile_id)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+
+# ============================================================
+# QUERY PROFILES
+# ============================================================
+
+@app.route('/profiles')
+@login_required
+def query_profiles():
+    """Saved EXPLAIN ANALYZE profiles of functions and reports"""
+    profiles = list_profiles(request.args.get('target') or None)
+    return render_template('profiles.html', profiles=profiles, profile=None)
+
+
+@app.route('/profiles/<int:profile_id>')
+@login_required
+def query_profile(profile_id):
+    """One profile: timings, top plan nodes by time, nested statements, full plan"""
+    profile = get_profile(profile_id)
+    if profile is None:
+        flash(f'פרופיל {profile_id} לא נמצא', 'danger')
+        return redirect(url_for('query_profiles'))
+    return render_template('profiles.html', profile=profile, profiles=None)
+
+
+@app.route('/api/profiles/<int:profile_id>')
+@login_required
+def get_profile_api(profile_id):
+    """Profile row with the full plan (JSON)"""
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'profile not found'}), 404
+    profile['created_at'] = profile['created_at'].isoformat()
+    for key in ('planning_ms', 'execution_ms', 'total_ms'):
+        if profile[key] is not None:
+            profile[key] = float(profile[key])
+    return jsonify(profile)
+
+
+# ============================================================
+# MONITORING
+# ============================================================
+
+@app.route('/api/pool-stats')
+@login_required
+def get_pool_stats():
+    """API to get database connection pool statistics"""
+    return jsonify(pool_stats())
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """
+    Request / query timings in the Prometheus text format
+
+    Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>";
+    without a configured token the endpoint needs a logged-in session.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    if not token:
+        return login_required(render_prometheus_metrics)()
+    if request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    return render_prometheus_metrics()
+
+
+def render_prometheus_metrics():
+    return Response(metrics.render_prometheus(pool_stats()),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/query-stats')
+@login_required
+def get_query_stats():
+    """API to get the most expensive statements and the slow query log"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'slow_query_ms': Config.SLOW_QUERY_MS,
+        'queries': metrics.query_stats(limit),
+        'slow_queries': metrics.slow_queries(),
+    })
+
+
+@app.route('/api/schema-cache')
+@login_required
+def get_schema_cache_stats():
+    """API to get schema metadata cache statistics"""
+    return jsonify(schema_cache.stats())
+
+
+@app.route('/api/schema-cache/refresh', methods=['POST'])
+@login_required
+def refresh_schema_cache():
+    """Drop cached tables / views / functions / columns (e.g. after a manual migration)"""
+    schema_cache.refresh()
+    return jsonify({'success': True, **schema_cache.stats()})
+
+
 # ============================================================
 # ERROR HANDLERS
 # ============================================================
@@ -0,0 +1,225 @@
+"""
+Bulk loading of resident files into raw_residents_csv
+טעינה מרוכזת של קובץ תושבים לטבלת raw
+
+Shared by the upload-residents route and scripts/etl_residents.py. Rows are
+streamed to PostgreSQL with COPY FROM STDIN; if COPY is not available on the
+connection the same rows are sent with batched execute_values instead.
+The input may be one DataFrame or the chunks from app/ingest.py; each chunk
+is loaded as it arrives, all in one transaction.
+
+Every raw row carries row_hash (app/ingest.py). Rows that a previous import
+merged or inserted are remembered in resident_row_hashes
+(migrations/18_idempotent_uploads.sql) and dropped after loading when
+skip_loaded is set.
+"""
+
+import time
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from app.cleaning import standing_order_values
+from app.ingest import row_hash
+
+
+RAW_RESIDENT_COLUMNS = (
+    'code', 'lastname', 'father_name', 'mother_name', 'streetname',
+    'buildingnumber', 'entrance', 'apartmentnumber', 'phone', 'mobile',
+    'mobile2', 'email', 'standing_order', 'row_hash',
+)
+
+# temp_residents_csv statuses whose rows need not be loaded again
+LOADED_STATUSES = ('הופץ', 'אוחד')
+
+NO_VALUE_STRINGS = {'אין', 'אין דירה', 'ללא', 'ללא דירה', 'none', ''}
+
+EXECUTE_VALUES_PAGE_SIZE = 1000
+
+
+def safe_int(value, default=0):
+    """Safely convert value to int, return default if conversion fails"""
+    if value is None or pd.isna(value):
+        return default
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in NO_VALUE_STRINGS:
+            return default
+        try:
+            return int(float(value))
+        except (ValueError, TypeError):
+            return default
+    return default
+
+
+def to_text(value):
+    """Convert a cell to the text stored in raw_residents_csv (None for empty)"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        if pd.isna(value):
+            return None
+        # Numeric columns come back from pandas as floats (e.g. 123.0)
+        if value.is_integer():
+            return str(int(value))
+    if pd.isna(value):
+        return None
+    return str(value)
+
+
+def iter_raw_rows(df):
+    """raw_residents_csv tuples (iterator) from a cleaned DataFrame, row_hash last"""
+    empty = [None] * len(df)
+    columns = [[to_text(v) for v in df[col].tolist()] if col in df.columns else empty
+               for col in RAW_RESIDENT_COLUMNS[:-2]]
+    # Converted for the whole column at once (safe_int semantics)
+    columns.append(standing_order_values(df['standing_order'])
+                   if 'standing_order' in df.columns else [0] * len(df))
+    return (row + (row_hash(row),) for row in zip(*columns))
+
+
+def _copy_field(value):
+    """Format a value for COPY ... FROM STDIN (text format)"""
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class _CopyStream:
+    """File-like object that renders rows for COPY on demand"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = ''
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._buffer += '\t'.join(_copy_field(v) for v in row) + '\n'
+            self.count += 1
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copy_rows(cur, rows):
+    stream = _CopyStream(rows)
+    cur.copy_expert(
+        f"COPY raw_residents_csv ({', '.join(RAW_RESIDENT_COLUMNS)}) FROM STDIN",
+        stream
+    )
+    return stream.count
+
+
+def _execute_values_rows(cur, rows):
+    rows = list(rows)
+    execute_values(
+        cur,
+        f"INSERT INTO raw_residents_csv ({', '.join(RAW_RESIDENT_COLUMNS)}) VALUES %s",
+        rows,
+        page_size=EXECUTE_VALUES_PAGE_SIZE
+    )
+    return len(rows)
+
+
+def skip_loaded_rows(cur):
+    """Delete raw rows an earlier import already merged / inserted; returns the count"""
+    cur.execute("""
+        DELETE FROM raw_residents_csv r
+        USING resident_row_hashes h
+        WHERE r.row_hash = h.row_hash
+    """)
+    return cur.rowcount
+
+
+def remember_loaded_rows(cur, run_id=None):
+    """Record the hashes of the temp rows process_residents_csv merged / inserted"""
+    cur.execute("""
+        INSERT INTO resident_row_hashes (row_hash, run_id)
+        SELECT DISTINCT src_row_id, %s
+        FROM temp_residents_csv
+        WHERE src_row_id IS NOT NULL AND status = ANY(%s)
+        ON CONFLICT (row_hash) DO NOTHING
+    """, (run_id, list(LOADED_STATUSES)))
+    return cur.rowcount
+
+
+def load_raw_residents(conn, data, truncate=True, on_chunk=None, skip_loaded=False):
+    """
+    Load cleaned residents rows into raw_residents_csv
+
+    Args:
+        conn: database connection
+        data: DataFrame, or iterable of DataFrames (chunks), with (a subset of) RAW_RESIDENT_COLUMNS
+        truncate: clear raw_residents_csv before loading
+        on_chunk: called with the running row count after each chunk
+        skip_loaded: drop rows an earlier import already merged / inserted
+
+    Returns:
+        dict: rows loaded, skipped (already loaded), chunks, method used
+        ('copy' / 'execute_values'), seconds and rows_per_sec
+    """
+    started = time.perf_counter()
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    cur = conn.cursor()
+    rows = 0
+    chunk_count = 0
+    method = 'copy'
+    skipped = 0
+
+    try:
+        if truncate:
+            cur.execute("TRUNCATE TABLE raw_residents_csv RESTART IDENTITY")
+
+        for df in chunks:
+            cur.execute("SAVEPOINT bulk_load")
+            try:
+                rows += _copy_rows(cur, iter_raw_rows(df))
+            except psycopg2.Error as e:
+                print(f"COPY failed, falling back to execute_values: {e}")
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_load")
+                rows += _execute_values_rows(cur, iter_raw_rows(df))
+                method = 'execute_values'
+            cur.execute("RELEASE SAVEPOINT bulk_load")
+            chunk_count += 1
+            if on_chunk is not None:
+                on_chunk(rows)
+
+        if skip_loaded:
+            skipped = skip_loaded_rows(cur)
+            rows -= skipped
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    seconds = time.perf_counter() - started
+    # Throughput of the load itself, skipped rows included
+    rows_per_sec = round((rows + skipped) / seconds) if seconds > 0 else rows
+    print(f"Loaded {rows} rows into raw_residents_csv via {method} "
+          f"in {seconds:.2f}s ({rows_per_sec} rows/sec)"
+          + (f", {skipped} already loaded rows skipped" if skipped else ''))
+
+    return {
+        'rows': rows,
+        'skipped': skipped,
+        'chunks': chunk_count,
+        'method': method,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': rows_per_sec,
+    }
@@ -0,0 +1,69 @@
+"""
+In-process TTL cache for Mishloach Manot System
+
+Small thread-safe key/value cache for data that is read on every page load
+but rarely changes (catalog metadata, dashboard counters). Values are loaded
+on first use, served from memory until they expire, and can be dropped
+early with invalidate().
+"""
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe cache whose entries expire ttl seconds after loading"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (value, loaded at)
+        self._generation = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'last_invalidated': None,
+        }
+
+    def get(self, key, loader):
+        """
+        Cached value for key, calling loader() on a miss or after expiry
+
+        The loader runs outside the lock. A value loaded while the cache was
+        being invalidated is returned to its caller but not stored, so a
+        stale result never outlives the invalidation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._stats['hits'] += 1
+                return entry[0]
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (value, time.monotonic())
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when key is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self._generation += 1
+            self._stats['invalidations'] += 1
+            self._stats['last_invalidated'] = time.time()
+
+    def stats(self):
+        """Snapshot of cache counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['ttl'] = self.ttl
+            return stats
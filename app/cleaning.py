@@ -0,0 +1,133 @@
+"""
+Cleaning of resident files
+ניקוי ערכים בקבצי תושבים
+
+Shared by the residents upload job (app/pipelines.py) and
+scripts/etl_residents.py. Every step works on whole columns:
+
+    * map_resident_columns  – known column spellings → raw_residents_csv names
+    * clean_resident_values – "אין" / "ללא" / empty cells → None in the text columns
+    * standing_order_values – standing_order as ints (0 for anything not a number)
+
+The sentinel set is lowercased once at import; a cell is compared after
+strip().lower() through the pandas string accessor instead of a Python
+lambda per cell.
+"""
+import numpy as np
+import pandas as pd
+
+# Auto-map column names of residents files
+RESIDENT_COLUMN_MAPPING = {
+    # Various forms of lastname
+    'last_name': 'lastname',
+    'lastname': 'lastname',
+    'family_name': 'lastname',
+    'surname': 'lastname',
+
+    # Various forms of father_name
+    'father_first_name': 'father_name',
+    'father_name': 'father_name',
+    'first_name': 'father_name',
+    'firstname': 'father_name',
+
+    # Various forms of mother_name
+    'mother_first_name': 'mother_name',
+    'mother_name': 'mother_name',
+
+    # Various forms of street
+    'street': 'streetname',
+    'streetname': 'streetname',
+    'street_name': 'streetname',
+
+    # Various forms of building number
+    'building_number': 'buildingnumber',
+    'buildingnumber': 'buildingnumber',
+    'house_number': 'buildingnumber',
+    'housenumber': 'buildingnumber',
+
+    # Various forms of entrance
+    'entrance': 'entrance',
+
+    # Various forms of apartment number
+    'apartment_number': 'apartmentnumber',
+    'apartmentnumber': 'apartmentnumber',
+    'apartment': 'apartmentnumber',
+    'flat_number': 'apartmentnumber',
+
+    # Phone numbers
+    'phone': 'phone',
+    'home_phone': 'phone',
+    'homephone': 'phone',
+    'telephone': 'phone',
+
+    'mobile': 'mobile',
+    'mobile1': 'mobile',
+    'cell': 'mobile',
+    'cellphone': 'mobile',
+
+    'mobile2': 'mobile2',
+
+    # Email
+    'email': 'email',
+    'mail': 'email',
+
+    # Code
+    'code': 'code',
+    'id': 'code',
+
+    # Standing order
+    'standing_order': 'standing_order',
+    'rating': 'standing_order',
+}
+
+# Cell values that mean "no value" in residents files
+RESIDENT_EMPTY_VALUES = ['אין', 'אין דירה', 'ללא', 'ללא דירה', 'nan', 'NaN', '', 'None', 'none']
+
+# Compared after strip().lower()
+EMPTY_VALUES_LOWER = frozenset(v.lower() for v in RESIDENT_EMPTY_VALUES)
+
+RESIDENT_TEXT_COLUMNS = ['lastname', 'father_name', 'mother_name', 'streetname',
+                         'buildingnumber', 'entrance', 'apartmentnumber', 'phone', 'mobile', 'mobile2', 'email']
+
+
+def map_resident_columns(df):
+    """Rename known column spellings in place; returns {original: mapped}"""
+    df.columns = df.columns.str.strip()
+
+    mapped_columns = {}
+    new_column_names = []
+    for orig_col in df.columns:
+        mapped_col = RESIDENT_COLUMN_MAPPING.get(orig_col.lower(), orig_col)
+        new_column_names.append(mapped_col)
+        if mapped_col != orig_col:
+            mapped_columns[orig_col] = mapped_col
+
+    df.columns = new_column_names
+    return mapped_columns
+
+
+def empty_mask(series):
+    """True where a cell is missing or one of the "no value" strings"""
+    mask = series.isna()
+    if series.dtype == object:
+        # Non-string cells become NaN in the accessor and never match
+        mask |= series.str.strip().str.lower().isin(EMPTY_VALUES_LOWER)
+    return mask
+
+
+def clean_resident_values(df):
+    """Replace "אין" / empty strings etc. with None in the text columns (in place)"""
+    for col in df.columns.intersection(RESIDENT_TEXT_COLUMNS):
+        series = df[col]
+        if series.dtype == object:
+            df[col] = series.mask(empty_mask(series), None)
+
+
+def standing_order_values(series, default=0):
+    """
+    standing_order column as a list of ints, like bulk_load.safe_int per cell:
+    numbers are truncated, anything else ("ללא", text, empty) is default
+    """
+    numbers = pd.to_numeric(series, errors='coerce')
+    numbers = numbers.where(np.isfinite(numbers), default)
+    return numbers.astype('int64').tolist()
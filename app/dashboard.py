@@ -0,0 +1,68 @@
+"""
+Dashboard statistics
+סטטיסטיקות לוח הבקרה
+
+All landing-page counters come from one aggregate query and are kept in a
+TTLCache for DASHBOARD_CACHE_TTL seconds. Uploads, distribution and imports
+call invalidate_dashboard_stats() so their results show up immediately.
+"""
+import time
+
+from app.cache import TTLCache
+from app.config import Config
+from app.db import get_cursor
+
+_cache = TTLCache(Config.DASHBOARD_CACHE_TTL)
+
+DASHBOARD_STATS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM person) AS total_residents,
+        (SELECT COUNT(*) FROM person WHERE autoreturn = true) AS autoreturn_count,
+        (SELECT COUNT(*) FROM "Order") AS total_orders,
+        (SELECT COUNT(*) FROM outerapporder WHERE status = 'waiting') AS pending_orders,
+        (SELECT COUNT(*) FROM raw_residents_csv) AS raw_count,
+        t.temp_count,
+        t.merged,
+        t.inserted,
+        t.partial,
+        t.skipped,
+        t.pending
+    FROM (
+        SELECT
+            COUNT(*) AS temp_count,
+            COUNT(*) FILTER (WHERE status = 'אוחד') AS merged,
+            COUNT(*) FILTER (WHERE status = 'הופץ') AS inserted,
+            COUNT(*) FILTER (WHERE status = 'התאמה חלקית') AS partial,
+            COUNT(*) FILTER (WHERE status = 'נדחה') AS skipped,
+            COUNT(*) FILTER (WHERE status IS NULL OR status = '') AS pending
+        FROM temp_residents_csv
+    ) t
+"""
+
+
+def _load_stats():
+    with get_cursor() as cur:
+        cur.execute(DASHBOARD_STATS_QUERY)
+        stats = dict(cur.fetchone())
+    stats['computed_at'] = time.time()
+    return stats
+
+
+def get_dashboard_stats(fresh=False):
+    """
+    Landing-page counters (residents, orders, pending, ETL state)
+
+    Args:
+        fresh: skip the cache and recompute
+
+    Returns:
+        dict: counters plus computed_at (epoch seconds)
+    """
+    if fresh:
+        _cache.invalidate()
+    return _cache.get('stats', _load_stats)
+
+
+def invalidate_dashboard_stats():
+    """Drop cached counters after data changed (upload / distribution / import)"""
+    _cache.invalidate()
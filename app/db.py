@@ -0,0 +1,272 @@
+"""
+Database connection pool for Mishloach Manot System
+
+A single process-wide pool shared by routes and helpers. Connections are
+checked out through the get_connection() / get_cursor() context managers and
+always returned to the pool, so a page pays the TCP + auth handshake at most
+once per pooled connection instead of once per helper call.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import Json
+
+from app.config import Config
+from app.metrics import TimedCursor
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became available within the pool timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe connection pool with blocking checkout and health checks"""
+
+    def __init__(self, dsn, minconn, maxconn, timeout, healthcheck_interval):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, last returned at)
+        self._open = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'healthcheck_failures': 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._open += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, cursor_factory=TimedCursor)
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to the pool timeout"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._cond:
+            waited = False
+            while not self._idle and self._open >= self.maxconn:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'No database connection available after {self.timeout}s '
+                        f'(pool size {self.maxconn})'
+                    )
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._open += 1
+
+            waited_ms = (time.monotonic() - started) * 1000
+            self._stats['checkouts'] += 1
+            self._stats['waits'] += int(waited)
+            self._stats['total_wait_ms'] += waited_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited_ms)
+            self._stats['in_use'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._stats['in_use'])
+
+        try:
+            if conn is None:
+                return self._connect()
+            if conn.closed or (time.monotonic() - last_used >= self.healthcheck_interval
+                               and not self._is_alive(conn)):
+                with self._cond:
+                    self._stats['healthcheck_failures'] += 1
+                if not conn.closed:
+                    conn.close()
+                return self._connect()
+            return conn
+        except Exception:
+            self._release_slot(closed=True)
+            raise
+
+    def putconn(self, conn):
+        """Return a connection, rolling back any transaction left open"""
+        if not conn.closed:
+            status = conn.info.transaction_status
+            try:
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    conn.close()
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+
+        if conn.closed:
+            self._release_slot(closed=True)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+        self._release_slot(closed=False)
+
+    def _release_slot(self, closed):
+        with self._cond:
+            self._stats['in_use'] -= 1
+            if closed:
+                self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['open_connections'] = self._open
+            stats['idle_connections'] = len(self._idle)
+        checkouts = stats['checkouts'] or 1
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / checkouts, 3)
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        stats['min_size'] = self.minconn
+        stats['max_size'] = self.maxconn
+        stats['saturation'] = round(stats['in_use'] / self.maxconn, 3)
+        return stats
+
+    def closeall(self):
+        """Close idle connections; checked-out ones are closed when returned"""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._open -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    Config.DATABASE_URL,
+                    minconn=Config.DB_POOL_MIN,
+                    maxconn=Config.DB_POOL_MAX,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    healthcheck_interval=Config.DB_POOL_HEALTHCHECK_INTERVAL,
+                )
+    return _pool
+
+
+def close_pool():
+    """Close the process-wide pool (used on shutdown and in tests)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def get_connection():
+    """Check out a pooled connection (timed RealDictCursor) for the duration of a block"""
+    db_pool = get_pool()
+    conn = db_pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        db_pool.putconn(conn)
+
+
+@contextmanager
+def get_cursor(commit=False):
+    """Pooled cursor; commits on success when commit=True"""
+    with get_connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        finally:
+            cur.close()
+
+
+@contextmanager
+def advisory_lock(name, on_wait=None):
+    """
+    Hold the session advisory lock hashtext(name) for the block
+
+    The lock lives on its own pooled connection, outside any transaction.
+    If another session holds it, on_wait() is called and the block waits
+    for it.
+    """
+    with get_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS locked", (name,))
+        locked = cur.fetchone()['locked']
+        conn.commit()
+        if not locked:
+            if on_wait is not None:
+                on_wait()
+            cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (name,))
+            conn.commit()
+        try:
+            yield
+        finally:
+            try:
+                cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+                conn.commit()
+                cur.close()
+            except psycopg2.Error:
+                # Closing the session releases the lock; never pool it still held
+                conn.close()
+
+
+def _json_default(value):
+    # numpy scalars, Decimal, dates
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def json_param(value):
+    """JSONB query parameter; numpy scalars, Decimal and dates are converted, Hebrew kept as is"""
+    return Json(value, dumps=lambda obj: json.dumps(obj, default=_json_default, ensure_ascii=False))
+
+
+def pool_stats():
+    """Pool statistics, or an empty snapshot if the pool was never opened"""
+    if _pool is None:
+        return {'initialized': False}
+    stats = _pool.stats()
+    stats['initialized'] = True
+    return stats
@@ -0,0 +1,373 @@
+"""
+ETL run ledger
+יומן הרצות ETL
+
+Every import path – the upload jobs (app/pipelines.py) and the
+scripts/etl_*.py command line tools – records a run in etl_runs
+(migrations/16_etl_runs.sql) and one etl_run_stages row per stage: wall
+time, SQL time (metrics.db_clock), rows in / out and rows per status.
+
+    with EtlRun.start('residents', 'cli', path=filepath) as run:
+        with run.stage('raw_to_temp_stage', rows_in=raw_rows) as stage:
+            stage.rows_out = ...
+        run.stats = {...}
+
+Ledger writes go through their own pooled connection and never fail the
+import: errors are printed and the run goes on unrecorded.
+
+The ledger also makes uploads idempotent (migrations/18_idempotent_uploads.sql):
+previous_import() finds an earlier successful run of the same file (by
+sha256) so the import can be skipped, and interrupted_run() finds a run of
+the same file that died part way, so the import can resume from it – as
+long as the staging table still holds that run's rows (record_temp,
+migrations/21_resume_fingerprint.sql).
+
+history() compares each stage with the median of the previous runs of the
+same kind, per 1000 rows, so a stage that slows down as the city's data
+grows stands out even when file sizes differ.
+"""
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from statistics import median
+
+from app import metrics
+from app.db import get_cursor, json_param
+from app.jobs import WORKER_ID, worker_alive
+
+# A stage is flagged when its time per 1000 rows reaches this multiple of
+# the median of the previous BASELINE_RUNS runs of the same kind ...
+REGRESSION_RATIO = 1.5
+BASELINE_RUNS = 5
+# ... and it took at least this long (short stages are mostly noise)
+REGRESSION_MIN_MS = 50
+
+
+def file_digest(path, block_size=1 << 20):
+    """(sha256 hex digest, size in bytes) of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest(), os.path.getsize(path)
+
+
+class StageRecord:
+    """Counters a stage fills in while it runs"""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.status_counts = None
+        self.status = 'succeeded'
+        self.error = None
+        self.duration_ms = None
+        self.db_ms = None
+        self.queries = 0
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'status': self.status,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'status_counts': self.status_counts,
+            'duration_ms': self.duration_ms,
+            'db_ms': self.db_ms,
+            'queries': self.queries,
+            'error': self.error,
+        }
+
+
+class EtlRun:
+    """One import run; stages are timed with run.stage(name)"""
+
+    def __init__(self, kind, source, filename=None, file_hash=None, file_size=None, job_id=None):
+        self.id = None
+        self.kind = kind
+        self.source = source
+        self.filename = filename
+        self.file_hash = file_hash
+        self.file_size = file_size
+        self.job_id = job_id
+        self.status = 'running'
+        self.resumed_from = None
+        self.stats = None
+        self.stages = []
+        self._started = time.perf_counter()
+
+    @classmethod
+    def start(cls, kind, source, path=None, filename=None, job_id=None):
+        """
+        Record a new run
+
+        Args:
+            kind: residents / orders / orders_import
+            source: 'web' (upload job) or 'cli' (scripts/)
+            path: imported file, hashed for the ledger
+            filename: name shown in the history (defaults to the path's)
+            job_id: background job running the import
+        """
+        file_hash = file_size = None
+        if path:
+            file_hash, file_size = file_digest(path)
+            filename = filename or os.path.basename(path)
+
+        run = cls(kind, source, filename, file_hash, file_size, job_id)
+        row = run._write("""
+            INSERT INTO etl_runs (kind, source, job_id, filename, file_hash, file_size, worker, persons_before)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, (SELECT COUNT(*) FROM person))
+            RETURNING id
+        """, (kind, source, job_id, filename, file_hash, file_size, WORKER_ID), fetch=True)
+        if row:
+            run.id = row['id']
+        return run
+
+    def _write(self, sql, params, fetch=False):
+        if not fetch and self.id is None:
+            return None
+        try:
+            with get_cursor(commit=True) as cur:
+                cur.execute(sql, params)
+                return cur.fetchone() if fetch else None
+        except Exception as e:
+            print(f"⚠️ ETL ledger write failed: {e}")
+            return None
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the block as one stage; set rows_out / status_counts on the yielded record"""
+        record = StageRecord(name, rows_in)
+        started_at = datetime.now()
+        started = time.perf_counter()
+        try:
+            with metrics.db_clock() as clock:
+                yield record
+        except BaseException as e:
+            record.status = 'failed'
+            record.error = str(e)
+            raise
+        finally:
+            record.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            record.db_ms = round(clock.seconds * 1000, 1)
+            record.queries = clock.queries
+            self.stages.append(record)
+            self._write("""
+                INSERT INTO etl_run_stages
+                (run_id, seq, stage, status, rows_in, rows_out, status_counts,
+                 duration_ms, db_ms, queries, error, started_at, finished_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (self.id, len(self.stages), name, record.status, record.rows_in, record.rows_out,
+                  json_param(record.status_counts) if record.status_counts is not None else None,
+                  record.duration_ms, record.db_ms, record.queries, record.error,
+                  started_at, datetime.now()))
+
+    @property
+    def duration_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    @property
+    def db_ms(self):
+        return round(sum(record.db_ms for record in self.stages), 1)
+
+    def _close(self, status, error=None):
+        self.status = status
+        self._write("""
+            UPDATE etl_runs
+            SET status = %s, error = %s, stats = %s, duration_ms = %s, db_ms = %s,
+                persons_after = (SELECT COUNT(*) FROM person), finished_at = NOW()
+            WHERE id = %s
+        """, (status, error, json_param(self.stats) if self.stats is not None else None,
+              self.duration_ms, self.db_ms, self.id))
+
+    def finish(self):
+        self._close('succeeded')
+
+    def fail(self, error):
+        self._close('failed', str(error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.fail(exc)
+        elif self.status == 'running':
+            self.finish()
+        return False
+
+    def _earlier(self, sql, params):
+        if self.id is None or not self.file_hash:
+            return None
+        try:
+            with get_cursor() as cur:
+                cur.execute(sql, params)
+                row = cur.fetchone()
+        except Exception as e:
+            print(f"⚠️ ETL ledger lookup failed: {e}")
+            return None
+        return dict(row) if row else None
+
+    def previous_import(self):
+        """Latest earlier successful run of the same kind and file (sha256), or None"""
+        return self._earlier("""
+            SELECT id, source, job_id, filename, started_at
+            FROM etl_runs
+            WHERE kind = %s AND file_hash = %s AND status = 'succeeded' AND id < %s
+            ORDER BY id DESC
+            LIMIT 1
+        """, (self.kind, self.file_hash, self.id))
+
+    def skip(self, previous):
+        """Close the run as skipped: previous (see previous_import) already imported the file"""
+        self.stats = {'skipped': True, 'previous_run_id': previous['id']}
+        self._close('skipped')
+
+    def interrupted_run(self):
+        """
+        The run this one can resume, or None
+
+        That is the latest earlier run of the same kind (skipped runs aside)
+        if it imported the same file, did not finish and recorded a
+        temp_fingerprint (see record_temp). A run still marked running
+        counts only once its worker process has exited; it is marked failed.
+        """
+        previous = self._earlier("""
+            SELECT id, file_hash, status, worker, resumed_from, temp_fingerprint
+            FROM etl_runs
+            WHERE kind = %s AND status <> 'skipped' AND id < %s
+            ORDER BY id DESC
+            LIMIT 1
+        """, (self.kind, self.id))
+
+        if (previous is None or previous['file_hash'] != self.file_hash
+                or previous['status'] == 'succeeded' or not previous['temp_fingerprint']):
+            return None
+        if previous['status'] == 'running':
+            if worker_alive(previous['worker']):
+                return None
+            self._write("""
+                UPDATE etl_runs
+                SET status = 'failed', error = 'interrupted (worker process exited)', finished_at = NOW()
+                WHERE id = %s AND status = 'running'
+            """, (previous['id'],))
+        return previous
+
+    def record_temp(self, fingerprint):
+        """
+        Record the staging table's fingerprint (temp_residents_fingerprint())
+
+        A later run resumes this one only while the staging table still has it.
+        """
+        self._write("UPDATE etl_runs SET temp_fingerprint = %s WHERE id = %s", (fingerprint, self.id))
+
+    def resume(self, previous):
+        """Record that this run continues previous (see interrupted_run)"""
+        self.resumed_from = previous['id']
+        self._write("""
+            UPDATE etl_runs SET resumed_from = %s, temp_fingerprint = %s WHERE id = %s
+        """, (previous['id'], previous['temp_fingerprint'], self.id))
+
+    def summary_lines(self):
+        """One printable line per stage (command line tools)"""
+        lines = []
+        for record in self.stages:
+            rows = record.rows_out if record.rows_out is not None else record.rows_in
+            line = (f"  {record.name:<28} {record.duration_ms / 1000:8.3f}s"
+                    f"  (SQL {record.db_ms / 1000:.3f}s)")
+            if rows is not None:
+                line += f"  {rows} rows"
+            lines.append(line)
+        lines.append(f"  {'total':<28} {self.duration_ms / 1000:8.3f}s")
+        return lines
+
+
+# ====================
+# History
+# ====================
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def list_runs(kind=None, limit=50):
+    """Latest runs (newest first), each with its stages in order"""
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT * FROM etl_runs
+            WHERE %(kind)s::text IS NULL OR kind = %(kind)s
+            ORDER BY started_at DESC, id DESC
+            LIMIT %(limit)s
+        """, {'kind': kind, 'limit': limit})
+        runs = [dict(row) for row in cur.fetchall()]
+        if not runs:
+            return []
+
+        cur.execute("""
+            SELECT * FROM etl_run_stages
+            WHERE run_id = ANY(%s)
+            ORDER BY run_id, seq
+        """, ([run['id'] for run in runs],))
+        stages = {}
+        for row in cur.fetchall():
+            stages.setdefault(row['run_id'], []).append(dict(row))
+
+    for run in runs:
+        for key in ('duration_ms', 'db_ms'):
+            run[key] = _number(run[key])
+        run['stages'] = stages.get(run['id'], [])
+        for stage in run['stages']:
+            stage['duration_ms'] = _number(stage['duration_ms'])
+            stage['db_ms'] = _number(stage['db_ms'])
+    return runs
+
+
+def _ms_per_1k(stage):
+    rows = stage['rows_in'] if stage['rows_in'] is not None else stage['rows_out']
+    if not rows:
+        return stage['duration_ms']
+    return stage['duration_ms'] * 1000 / rows
+
+
+def history(kind, limit=30):
+    """
+    Runs of one kind with every stage compared to earlier runs
+
+    Each stage gets ms_per_1k (time per 1000 rows in), baseline (median of
+    the previous BASELINE_RUNS successful runs) and ratio / regressed.
+
+    Returns:
+        (runs newest first, stage names in run order)
+    """
+    runs = list_runs(kind, limit + BASELINE_RUNS)
+    names = []
+    previous = {}
+    for run in reversed(runs):
+        for stage in run['stages']:
+            name = stage['stage']
+            if name not in names:
+                names.append(name)
+            value = _ms_per_1k(stage)
+            earlier = previous.get(name, [])[-BASELINE_RUNS:]
+            baseline = median(earlier) if earlier else None
+            stage['ms_per_1k'] = round(value, 2)
+            stage['baseline'] = round(baseline, 2) if baseline is not None else None
+            stage['ratio'] = round(value / baseline, 2) if baseline else None
+            stage['regressed'] = bool(
+                stage['ratio'] and stage['ratio'] >= REGRESSION_RATIO
+                and stage['duration_ms'] >= REGRESSION_MIN_MS
+            )
+            if stage['status'] == 'succeeded':
+                previous.setdefault(name, []).append(value)
+        run['stage_map'] = {stage['stage']: stage for stage in run['stages']}
+    return runs[:limit], names
+
+
+def run_kinds():
+    """Kinds that have at least one run"""
+    with get_cursor() as cur:
+        cur.execute("SELECT DISTINCT kind FROM etl_runs ORDER BY kind")
+        return [row['kind'] for row in cur.fetchall()]
@@ -0,0 +1,168 @@
+"""
+Live ETL / job events
+אירועי התקדמות בזמן אמת
+
+One LISTEN connection per process receives the etl_progress (ETL stages)
+and job_events (jobs table updates) notifications from migration 15 and
+fans them out to subscribers, one queue each. /api/jobs/<id>/events turns
+a subscription into a Server-Sent Events stream.
+"""
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+from app.config import Config
+
+CHANNELS = ('etl_progress', 'job_events')
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+# Seconds subscribe() waits for the listener to be connected
+LISTEN_WAIT = 5
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_listener = None
+_listener_lock = threading.Lock()
+_listening = threading.Event()
+
+
+def _publish(channel, payload):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    event['channel'] = channel
+    with _subscribers_lock:
+        targets = list(_subscribers)
+    # A copy each: a stream must not change what the others receive
+    for q in targets:
+        q.put(dict(event))
+
+
+def _listen(dsn):
+    """Relay notifications to subscribers; reconnect on failure"""
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            for channel in CHANNELS:
+                cur.execute(f'LISTEN {channel}')
+            _listening.set()
+            backoff = 1
+
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    _publish(notify.channel, notify.payload)
+        except Exception as e:
+            print(f"⚠️ Event listener error: {e} - retrying in {backoff}s")
+        finally:
+            _listening.clear()
+            if conn is not None:
+                conn.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def ensure_listener():
+    """Start the notification listener thread once per process; True if this call started it"""
+    global _listener
+    if _listener is not None:
+        return False
+    with _listener_lock:
+        if _listener is not None:
+            return False
+        _listener = threading.Thread(
+            target=_listen, args=(Config.DATABASE_URL,),
+            name='event-listener', daemon=True
+        )
+        _listener.start()
+        return True
+
+
+def subscribe():
+    """Queue that receives every event (dict with 'channel') from now on"""
+    started = ensure_listener()
+    q = queue.Queue()
+    with _subscribers_lock:
+        _subscribers.add(q)
+    # Right after the listener starts, notifications sent before its LISTEN
+    # would be lost - give it a moment to connect. Only the subscriber that
+    # started it waits: later ones must not block while the database is down.
+    if started:
+        _listening.wait(LISTEN_WAIT)
+    return q
+
+
+def unsubscribe(q):
+    with _subscribers_lock:
+        _subscribers.discard(q)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def stream_job_events(job_id, get_job):
+    """
+    SSE stream of one job: a 'snapshot' (the job row) first, then 'job'
+    (jobs table update) / 'etl' (ETL stage batch) events as they are
+    notified, ending with a final 'snapshot' once the job has finished
+
+    Args:
+        job_id: job to follow
+        get_job: function returning the current job row (snapshot + end check)
+
+    Yields:
+        str: text/event-stream chunks
+    """
+    q = subscribe()
+    try:
+        # Subscribed before the snapshot, so (once the listener is connected)
+        # nothing in between is lost; the heartbeat re-check covers the rest
+        job = get_job(job_id)
+        if job is None:
+            yield _sse('error', {'error': 'job not found'})
+            return
+        yield _sse('snapshot', job)
+        if job['status'] in ('succeeded', 'failed'):
+            return
+
+        while True:
+            try:
+                event = q.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                # The listener may have been reconnecting while the job ended
+                job = get_job(job_id)
+                if job is None or job['status'] in ('succeeded', 'failed'):
+                    yield _sse('snapshot', job)
+                    return
+                continue
+
+            if event.get('job_id') != job_id:
+                continue
+            channel = event.get('channel')
+            data = {key: value for key, value in event.items() if key != 'channel'}
+            if channel == 'etl_progress':
+                yield _sse('etl', data)
+                continue
+
+            yield _sse('job', data)
+            if data.get('status') in ('succeeded', 'failed'):
+                yield _sse('snapshot', get_job(job_id))
+                return
+    finally:
+        unsubscribe(q)
@@ -7,36 +7,30 @@ This module handles importing orders from a CSV file containing:
 - guest_list: pipe-separated list of receiver codes (e.g., "270|364|849|387")
 """
 
-import pandas as pd
+from psycopg2.extras import execute_values
 from datetime import datetime
 
+from app.ingest import iter_upload_chunks
+from app.metrics import TimedTupleCursor
 
-def import_orders_from_csv(file, conn):
+
+def import_orders_from_csv(file, conn, filename=None, chunksize=None):
     """
     Import orders from CSV file
     
+    The file is read in chunks (app/ingest.py); each chunk's pairs are
+    inserted as it arrives, and everything commits together at the end.
+    
     Args:
-        file: uploaded file object
+        file: uploaded file object (or path)
         conn: database connection
+        filename: original file name (default: file.filename)
+        chunksize: rows per chunk (default INGEST_CHUNK_SIZE)
     
     Returns:
         dict: statistics about the import
     """
-    # Read CSV
-    if file.filename.endswith('.csv'):
-        df = pd.read_csv(file, encoding='utf-8-sig')
-    else:
-        df = pd.read_excel(file)
-    
-    # Clean column names
-    df.columns = df.columns.str.strip()
-    
-    # Required columns
-    required_cols = ['order_code', 'guest_list']
-    missing_cols = [col for col in required_cols if col not in [c.lower() for c in df.columns]]
-    
-    if missing_cols:
-        raise ValueError(f"חסרות עמודות חובה: {', '.join(missing_cols)}")
+    chunks = iter_upload_chunks(file, filename, chunksize)
     
     # Normalize column names
     column_mapping = {
@@ -48,13 +42,6 @@ def import_orders_from_csv(file, conn):
         'payment_method': 'payment_method',
     }
     
-    new_column_names = []
-    for orig_col in df.columns:
-        mapped_col = column_mapping.get(orig_col.strip().lower(), orig_col)
-        new_column_names.append(mapped_col)
-    
-    df.columns = new_column_names
-    
     # Statistics
     stats = {
         'total_orders': 0,
@@ -64,110 +51,111 @@ def import_orders_from_csv(file, conn):
         'missing_senders': [],
         'missing_receivers': []
     }
+    missing_senders = set()
+    missing_receivers = set()
     
-    cur = conn.cursor()
-    
-    # Get all person codes for validation
-    cur.execute("SELECT code FROM person")
-    valid_codes = {row[0] for row in cur.fetchall()}
+    # Plain tuple cursor (pool connections default to RealDictCursor)
+    cur = conn.cursor(cursor_factory=TimedTupleCursor)
     
-    # Process each order
-    for _, row in df.iterrows():
-        order_code = str(row.get('order_code', '')).strip()
-        guest_list = str(row.get('guest_list', '')).strip()
-        
-        if not order_code or not guest_list:
-            continue
-        
-        stats['total_orders'] += 1
-        
-        # Check if sender exists
-        try:
-            sender_code = int(order_code)
-        except (ValueError, TypeError):
-            continue
-        
-        if sender_code not in valid_codes:
-            if sender_code not in stats['missing_senders']:
-                stats['missing_senders'].append(sender_code)
-            continue
-        
-        # Get sender's personid
-        cur.execute("SELECT personid FROM person WHERE code = %s", (sender_code,))
-        sender_result = cur.fetchone()
-        
-        if not sender_result:
-            if sender_code not in stats['missing_senders']:
-                stats['missing_senders'].append(sender_code)
-            continue
-        
-        sender_id = sender_result[0]
+    try:
+        personid_by_code = None
+        order_date = datetime.now()
         
-        # Parse guest list
-        guest_codes = [g.strip() for g in guest_list.split('|') if g.strip()]
-        
-        for guest_code in guest_codes:
-            try:
-                receiver_code = int(guest_code)
-            except (ValueError, TypeError):
-                stats['failed_pairs'] += 1
-                continue
-            
-            stats['total_pairs'] += 1
-            
-            # Check if receiver exists
-            if receiver_code not in valid_codes:
-                if receiver_code not in stats['missing_receivers']:
-                    stats['missing_receivers'].append(receiver_code)
-                stats['failed_pairs'] += 1
-                continue
-            
-            # Get receiver's personid
-            cur.execute("SELECT personid FROM person WHERE code = %s", (receiver_code,))
-            receiver_result = cur.fetchone()
+        for df in chunks:
+            if personid_by_code is None:
+                # Required columns (checked on the first chunk's header)
+                required_cols = ['order_code', 'guest_list']
+                missing_cols = [col for col in required_cols if col not in [c.lower() for c in df.columns]]
+                
+                if missing_cols:
+                    raise ValueError(f"חסרות עמודות חובה: {', '.join(missing_cols)}")
+                
+                # Resolve all person codes once
+                cur.execute("SELECT code, personid FROM person WHERE code IS NOT NULL")
+                personid_by_code = dict(cur.fetchall())
             
-            if not receiver_result:
-                if receiver_code not in stats['missing_receivers']:
-                    stats['missing_receivers'].append(receiver_code)
-                stats['failed_pairs'] += 1
-                continue
+            df.columns = [column_mapping.get(col.strip().lower(), col) for col in df.columns]
             
-            receiver_id = receiver_result[0]
+            order_codes = df['order_code'].tolist() if 'order_code' in df.columns else [''] * len(df)
+            guest_lists = df['guest_list'].tolist() if 'guest_list' in df.columns else [''] * len(df)
             
-            # Check if order already exists
-            cur.execute("""
-                SELECT order_id 
-                FROM "Order" 
-                WHERE delivery_sender_id = %s 
-                  AND delivery_getter_id = %s
-            """, (sender_id, receiver_id))
+            pairs = []
             
-            if cur.fetchone():
-                # Order already exists, skip
-                stats['failed_pairs'] += 1
-                continue
+            # Process each order
+            for order_value, guest_value in zip(order_codes, guest_lists):
+                order_code = str(order_value).strip()
+                guest_list = str(guest_value).strip()
+                
+                if not order_code or not guest_list:
+                    continue
+                
+                stats['total_orders'] += 1
+                
+                # Check if sender exists
+                try:
+                    sender_code = int(order_code)
+                except (ValueError, TypeError):
+                    continue
+                
+                sender_id = personid_by_code.get(sender_code)
+                if sender_id is None:
+                    if sender_code not in missing_senders:
+                        missing_senders.add(sender_code)
+                        stats['missing_senders'].append(sender_code)
+                    continue
+                
+                # Parse guest list
+                guest_codes = [g.strip() for g in guest_list.split('|') if g.strip()]
+                
+                for guest_code in guest_codes:
+                    try:
+                        receiver_code = int(guest_code)
+                    except (ValueError, TypeError):
+                        stats['failed_pairs'] += 1
+                        continue
+                    
+                    stats['total_pairs'] += 1
+                    
+                    # Check if receiver exists
+                    receiver_id = personid_by_code.get(receiver_code)
+                    if receiver_id is None:
+                        if receiver_code not in missing_receivers:
+                            missing_receivers.add(receiver_code)
+                            stats['missing_receivers'].append(receiver_code)
+                        stats['failed_pairs'] += 1
+                        continue
+                    
+                    pairs.append((sender_id, receiver_id))
             
-            # Create order
-            try:
-                cur.execute("""
+            # Create the chunk's orders in one statement; pairs that already exist
+            # (in the table, earlier in this chunk or in an earlier chunk) are
+            # skipped by ux_order_sender_getter
+            if pairs:
+                inserted = execute_values(
+                    cur,
+                    """
                     INSERT INTO "Order" (
                         delivery_sender_id,
                         delivery_getter_id,
                         order_date,
                         origin_type
-                    ) VALUES (%s, %s, %s, %s)
-                """, (
-                    sender_id,
-                    receiver_id,
-                    datetime.now(),
-                    'csv_import'
-                ))
-                
-                stats['successful_pairs'] += 1
-            except Exception as e:
-                print(f"שגיאה ביצירת הזמנה: {e}")
-                stats['failed_pairs'] += 1
-    
-    conn.commit()
+                    ) VALUES %s
+                    ON CONFLICT DO NOTHING
+                    RETURNING id
+                    """,
+                    [(sender_id, receiver_id, order_date, 'csv_import')
+                     for sender_id, receiver_id in pairs],
+                    page_size=len(pairs),
+                    fetch=True
+                )
+                stats['successful_pairs'] += len(inserted)
+                stats['failed_pairs'] += len(pairs) - len(inserted)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
     
     return stats
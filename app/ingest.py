@@ -0,0 +1,122 @@
+"""
+Chunked reading of uploaded files
+קריאת קבצים בחלקים
+
+Uploads and the ETL scripts used to read the whole file into one DataFrame
+before touching the database. iter_upload_chunks() yields INGEST_CHUNK_SIZE
+rows at a time instead, so peak memory depends on the chunk size and not on
+the file size:
+
+    * CSV  – pandas read_csv(chunksize=...), every cell read as text
+    * XLSX – openpyxl read_only row iteration
+    * XLS  – no streaming reader exists; read whole and sliced into chunks
+
+Every chunk has the header's column names (stripped). A file with a header
+and no rows yields one empty chunk so callers can still check the columns.
+
+row_hash() fingerprints one loaded row, so a re-upload can skip the rows
+that are already in the database.
+"""
+import hashlib
+import itertools
+
+import pandas as pd
+
+from app.config import Config
+
+
+def _file_kind(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.xls'):
+        return 'xls'
+    return 'xlsx'
+
+
+def _header(values):
+    """Column names like pandas: stripped, 'Unnamed: i' for blanks, duplicates numbered"""
+    names = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = str(value).strip() if value is not None else f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _csv_chunks(source, chunksize):
+    reader = pd.read_csv(source, encoding='utf-8-sig', dtype=str, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk
+
+
+def _xlsx_chunks(source, chunksize):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = _header(next(rows, ()))
+        width = len(columns)
+        # Blank lines are skipped (like read_csv); short rows are padded
+        rows = (row[:width] + (None,) * (width - len(row))
+                for row in rows if any(v is not None for v in row))
+
+        yielded = False
+        while True:
+            batch = list(itertools.islice(rows, chunksize))
+            if not batch and yielded:
+                return
+            yield pd.DataFrame(batch, columns=columns)
+            yielded = True
+            if len(batch) < chunksize:
+                return
+    finally:
+        workbook.close()
+
+
+def _xls_chunks(source, chunksize):
+    df = pd.read_excel(source)
+    df.columns = df.columns.astype(str).str.strip()
+    if df.empty:
+        yield df
+        return
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize].reset_index(drop=True)
+
+
+def iter_upload_chunks(source, filename=None, chunksize=None):
+    """
+    Read a CSV / Excel file in DataFrame chunks
+
+    Args:
+        source: path or binary file object
+        filename: original name, decides the format (default: source when it is a path)
+        chunksize: rows per chunk (default INGEST_CHUNK_SIZE)
+
+    Yields:
+        DataFrame: up to chunksize rows
+    """
+    if filename is None:
+        filename = source if isinstance(source, str) else getattr(source, 'filename', '')
+    chunksize = chunksize or Config.INGEST_CHUNK_SIZE
+
+    kind = _file_kind(filename)
+    if kind == 'csv':
+        return _csv_chunks(source, chunksize)
+    if kind == 'xls':
+        return _xls_chunks(source, chunksize)
+    return _xlsx_chunks(source, chunksize)
+
+
+def row_hash(values):
+    """md5 of a row's values joined by \\x1f, None as '' (SQL: md5(concat_ws(chr(31), ...)) without NULLs)"""
+    text = '\x1f'.join('' if value is None else str(value) for value in values)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
@@ -0,0 +1,211 @@
+"""
+Background jobs
+עבודות רקע
+
+Uploads and long database functions run on a small in-process thread pool
+instead of inside the HTTP request. Every job has a row in the jobs table
+(migrations/14_jobs.sql) holding its stage, progress, messages and final
+stats, so any worker process can answer /api/jobs/<id>.
+
+A job function receives a JobContext as its first argument and returns a
+stats dict:
+
+    def run_something(ctx, path):
+        ctx.stage('load', 10)
+        ...
+        ctx.message('✅ done', 'success')
+        return {'rows': n}
+
+    job_id = submit_job('something', run_something, path)
+"""
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+from app.db import get_cursor, json_param
+
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+# Minimum seconds between two row-progress writes of the same job
+PROGRESS_INTERVAL = 0.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobContext:
+    """Handle a running job uses to report stage, progress and messages"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last_progress = 0.0
+
+    def _update(self, assignments, params):
+        with get_cursor(commit=True) as cur:
+            cur.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = NOW() WHERE id = %s",
+                params + [self.job_id]
+            )
+
+    def stage(self, name, progress=None):
+        """Enter a new stage (progress in percent, optional)"""
+        print(f"⚙️ Job {self.job_id}: {name}")
+        if progress is None:
+            self._update("stage = %s", [name])
+        else:
+            self._update("stage = %s, progress = %s", [name, progress])
+
+    def progress(self, rows_done=None, rows_total=None, progress=None, force=False):
+        """Row counts / percent; throttled to one write per PROGRESS_INTERVAL"""
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        self._update(
+            "rows_done = COALESCE(%s, rows_done), rows_total = COALESCE(%s, rows_total), "
+            "progress = COALESCE(%s, progress)",
+            [rows_done, rows_total, progress]
+        )
+
+    def message(self, text, category='info'):
+        """Add a user-facing message (shown like a flash message)"""
+        self._update("messages = messages || %s", [json_param([{'category': category, 'text': text}])])
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                recover_interrupted_jobs()
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.JOB_WORKERS, thread_name_prefix='job'
+                )
+    return _executor
+
+
+def _mark_failed(job_id, error):
+    """Record a job's failure; if that write fails, retry with a short error (never leave it running)"""
+    for text in (error, error[:1000]):
+        try:
+            with get_cursor(commit=True) as cur:
+                cur.execute("""
+                    UPDATE jobs
+                    SET status = 'failed', error = %s, finished_at = NOW(), updated_at = NOW()
+                    WHERE id = %s
+                """, (text, job_id))
+            return
+        except Exception as e:
+            print(f"⚠️ Could not mark job {job_id} as failed: {e}")
+
+
+def _run(job_id, func, args, cleanup_path):
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            UPDATE jobs SET status = 'running', started_at = NOW(), updated_at = NOW()
+            WHERE id = %s
+        """, (job_id,))
+
+    try:
+        stats = func(JobContext(job_id), *args)
+        with get_cursor(commit=True) as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'succeeded', stage = 'done', progress = 100, stats = %s,
+                    finished_at = NOW(), updated_at = NOW()
+                WHERE id = %s
+            """, (json_param(stats), job_id))
+    except Exception as e:
+        print(f"❌ Job {job_id} failed: {e}")
+        traceback.print_exc()
+        _mark_failed(job_id, str(e))
+    finally:
+        if cleanup_path and os.path.exists(cleanup_path):
+            os.remove(cleanup_path)
+
+
+def submit_job(kind, func, *args, filename=None, params=None, cleanup_path=None):
+    """
+    Queue func(ctx, *args) on the job pool
+
+    Args:
+        kind: job type shown in the UI (residents_upload, ...)
+        filename: original upload name, if any
+        params: JSON-able description of the job input
+        cleanup_path: file deleted when the job finishes (saved upload)
+
+    Returns:
+        int: job id
+    """
+    executor = _get_executor()
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            INSERT INTO jobs (kind, filename, params, worker)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (kind, filename, json_param(params), WORKER_ID))
+        job_id = cur.fetchone()['id']
+
+    executor.submit(_run, job_id, func, args, cleanup_path)
+    return job_id
+
+
+def get_job(job_id):
+    """Job row as a dict, or None"""
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM jobs WHERE id = %s", (job_id,))
+        return cur.fetchone()
+
+
+def wait_for_job(job_id, timeout=60, interval=0.1):
+    """Poll until the job has finished; returns the job row (TimeoutError otherwise)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job['status'] in ('succeeded', 'failed'):
+            return job
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+        time.sleep(interval)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def worker_alive(worker):
+    """False only for a host:pid worker of this host whose process has exited"""
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    return _process_alive(int(pid))
+
+
+def recover_interrupted_jobs():
+    """Mark jobs of dead processes on this host as failed (they will never finish)"""
+    host = socket.gethostname()
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            SELECT id, worker FROM jobs
+            WHERE status IN ('queued', 'running') AND worker LIKE %s
+        """, (f'{host}:%',))
+        dead = [row['id'] for row in cur.fetchall()
+                if row['worker'] != WORKER_ID and not worker_alive(row['worker'])]
+        if dead:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'failed', error = 'interrupted (worker process exited)',
+                    finished_at = NOW(), updated_at = NOW()
+                WHERE id = ANY(%s)
+            """, (dead,))
+            print(f"⚠️ Marked {len(dead)} interrupted jobs as failed")
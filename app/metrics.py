@@ -0,0 +1,399 @@
+"""
+Request and query timing
+מדידת זמני בקשות ושאילתות
+
+Two sources feed one in-process registry:
+
+  * init_app() – before/after_request hooks time every Flask request
+    (by endpoint, method and status) and add a Server-Timing header that
+    splits the request into SQL time and everything else (Python, pandas,
+    templates).
+  * TimedCursor – the cursor class of every pooled connection (app/db.py);
+    TimedTupleCursor where tuples are wanted instead of dicts.
+    Each execute / executemany / COPY is recorded under the statement's
+    fingerprint (literals and numbers replaced by ?, whitespace collapsed)
+    with its duration, row count and call site (first frame outside the
+    database helpers).
+
+db_clock() sums the SQL time of the current thread while active, so code
+outside a request (ETL stages, app/etl_ledger.py) can split its time too.
+
+Statements slower than SLOW_QUERY_MS are printed and kept in a ring buffer
+of SLOW_QUERY_LOG_SIZE entries. render_prometheus() formats everything for
+/metrics in the Prometheus text exposition format.
+"""
+import bisect
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from flask import request
+from psycopg2.extras import RealDictCursor
+
+from app.config import Config
+
+# Histogram upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Distinct statements tracked; later new ones are counted under 'other'
+MAX_FINGERPRINTS = 500
+
+# Statement text → (fingerprint id, fingerprint); most statements repeat verbatim
+_FINGERPRINT_CACHE_SIZE = 2000
+_fingerprint_cache = {}
+
+_lock = threading.Lock()
+_requests = {}      # (endpoint, method, status) -> Histogram
+_queries = {}       # fingerprint id -> QueryStats
+_slow_queries = deque(maxlen=Config.SLOW_QUERY_LOG_SIZE)
+_request_state = threading.local()
+_clocks = threading.local()
+_started_at = time.time()
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_APP_DIR)
+_relative_paths = {}
+# Frames skipped when looking for the call site (execute_values etc. live in psycopg2)
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_APP_DIR, 'db.py')}
+_SKIP_PREFIX = os.path.dirname(psycopg2.__file__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+# execute_values pages: VALUES (...), (...), ... (tuples may hold NOW())
+_TUPLE = r'\((?:[^()]|\(\))*\)'
+_VALUES_RE = re.compile(rf'(\bVALUES\s*{_TUPLE})(?:\s*,\s*{_TUPLE})+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+class Histogram:
+    """Per-bucket counts + sum (made cumulative when rendered)"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class QueryStats:
+    """Timings of one statement fingerprint"""
+
+    __slots__ = ('fingerprint', 'histogram', 'rows', 'max_seconds', 'call_sites')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.histogram = Histogram()
+        self.rows = 0
+        self.max_seconds = 0.0
+        self.call_sites = {}
+
+    def as_dict(self, fingerprint_id):
+        h = self.histogram
+        return {
+            'id': fingerprint_id,
+            'query': self.fingerprint,
+            'calls': h.count,
+            'total_ms': round(h.total * 1000, 3),
+            'avg_ms': round(h.total * 1000 / h.count, 3) if h.count else 0,
+            'max_ms': round(self.max_seconds * 1000, 3),
+            'rows': self.rows,
+            'call_sites': dict(sorted(self.call_sites.items(), key=lambda kv: -kv[1])),
+        }
+
+
+def fingerprint(sql):
+    """Statement text with literals replaced: one entry per query shape"""
+    text = _STRING_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = text.replace('%s', '?')
+    text = _IN_LIST_RE.sub('IN (...)', text)
+    text = _VALUES_RE.sub(r'\1, ...', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def call_site():
+    """'file.py:line function' of the first caller outside the database helpers"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename not in _SKIP_FILES and not filename.startswith(_SKIP_PREFIX):
+            path = _relative_paths.get(filename)
+            if path is None:
+                path = _relative_paths[filename] = os.path.relpath(filename, _ROOT)
+            return f"{path}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _fingerprint_id(sql):
+    cached = _fingerprint_cache.get(sql)
+    if cached is None:
+        text = fingerprint(sql)
+        cached = (hashlib.md5(text.encode('utf-8')).hexdigest()[:12], text)
+        if len(_fingerprint_cache) >= _FINGERPRINT_CACHE_SIZE:
+            _fingerprint_cache.clear()
+        _fingerprint_cache[sql] = cached
+    return cached
+
+
+def record_query(sql, seconds, rows, site):
+    """Add one statement execution to the registry (and the slow log)"""
+    fingerprint_id, text = _fingerprint_id(sql)
+
+    with _lock:
+        stats = _queries.get(fingerprint_id)
+        if stats is None:
+            if len(_queries) >= MAX_FINGERPRINTS:
+                fingerprint_id, text = 'other', 'other'
+                stats = _queries.get('other')
+            if stats is None:
+                stats = _queries[fingerprint_id] = QueryStats(text)
+        stats.histogram.observe(seconds)
+        stats.rows += max(rows, 0)
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        if site in stats.call_sites or len(stats.call_sites) < 10:
+            stats.call_sites[site] = stats.call_sites.get(site, 0) + 1
+
+    state = _request_state
+    if getattr(state, 'started', None) is not None:
+        state.db_seconds += seconds
+        state.queries += 1
+
+    for clock in getattr(_clocks, 'active', ()):
+        clock.seconds += seconds
+        clock.queries += 1
+
+    if seconds * 1000 >= Config.SLOW_QUERY_MS:
+        entry = {
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'ms': round(seconds * 1000, 1),
+            'rows': rows,
+            'call_site': site,
+            'id': fingerprint_id,
+            'query': text,
+        }
+        with _lock:
+            _slow_queries.append(entry)
+        print(f"🐢 Slow query {entry['ms']}ms ({rows} rows) at {site}: {text[:300]}")
+
+
+class TimedCursorMixin:
+    """Records every statement of the cursor in the metrics registry"""
+
+    def _timed(self, method, query, *args):
+        started = time.perf_counter()
+        try:
+            return method(query, *args)
+        finally:
+            seconds = time.perf_counter() - started
+            try:
+                sql = query if isinstance(query, str) else (
+                    query.decode('utf-8', 'replace') if isinstance(query, bytes)
+                    else query.as_string(self.connection))
+                record_query(sql, seconds, self.rowcount, call_site())
+            except Exception as e:
+                print(f"⚠️ Query metrics error: {e}")
+
+    def execute(self, query, vars=None):
+        return self._timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(super().copy_expert, sql, file, size)
+
+
+class TimedCursor(TimedCursorMixin, RealDictCursor):
+    """Default cursor of pooled connections (rows as dicts)"""
+
+
+class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    """Plain tuple cursor for bulk work (conn.cursor(cursor_factory=TimedTupleCursor))"""
+
+
+class DbClock:
+    """SQL seconds / statements counted by db_clock()"""
+
+    __slots__ = ('seconds', 'queries')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+
+@contextmanager
+def db_clock():
+    """Count the timed statements this thread runs inside the block (nestable)"""
+    active = getattr(_clocks, 'active', None)
+    if active is None:
+        active = _clocks.active = []
+    clock = DbClock()
+    active.append(clock)
+    try:
+        yield clock
+    finally:
+        active.remove(clock)
+
+
+# ====================
+# Flask
+# ====================
+
+def init_app(app):
+    """Time every request of the app"""
+
+    @app.before_request
+    def _start_request_timer():
+        _request_state.started = time.perf_counter()
+        _request_state.db_seconds = 0.0
+        _request_state.queries = 0
+
+    @app.after_request
+    def _record_request(response):
+        started = getattr(_request_state, 'started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        db_seconds = _request_state.db_seconds
+        _request_state.started = None
+
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        key = (endpoint, request.method, str(response.status_code))
+        with _lock:
+            histogram = _requests.get(key)
+            if histogram is None:
+                histogram = _requests[key] = Histogram()
+            histogram.observe(seconds)
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_seconds * 1000:.1f};desc="{_request_state.queries} queries", '
+            f'app;dur={(seconds - db_seconds) * 1000:.1f}, '
+            f'total;dur={seconds * 1000:.1f}'
+        )
+        return response
+
+
+# ====================
+# Export
+# ====================
+
+def query_stats(limit=50):
+    """Statements by total time, most expensive first"""
+    with _lock:
+        rows = [stats.as_dict(fid) for fid, stats in _queries.items()]
+    rows.sort(key=lambda r: -r['total_ms'])
+    return rows[:limit]
+
+
+def slow_queries():
+    """Slow query log, newest first"""
+    with _lock:
+        return list(reversed(_slow_queries))
+
+
+def reset():
+    """Forget everything recorded so far (tests)"""
+    with _lock:
+        _requests.clear()
+        _queries.clear()
+        _slow_queries.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+
+
+def _histogram_lines(name, labels, h):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, h.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+    lines.append(f'{name}_sum{{{labels}}} {h.total:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {h.count}')
+    return lines
+
+
+def render_prometheus(pool=None):
+    """
+    All metrics in the Prometheus text format (version 0.0.4)
+
+    Args:
+        pool: app.db.pool_stats() snapshot, exported as gauges when given
+    """
+    with _lock:
+        requests = [(key, _copy(h)) for key, h in _requests.items()]
+        queries = [(fid, stats.fingerprint, _copy(stats.histogram), stats.rows)
+                   for fid, stats in _queries.items()]
+        slow = len(_slow_queries)
+
+    lines = [
+        '# HELP app_start_time_seconds Process start time (unix seconds)',
+        '# TYPE app_start_time_seconds gauge',
+        f'app_start_time_seconds {_started_at:.0f}',
+        '# HELP http_request_duration_seconds Flask request duration',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (endpoint, method, status), h in sorted(requests):
+        lines += _histogram_lines('http_request_duration_seconds',
+                                  _labels(endpoint=endpoint, method=method, status=status), h)
+
+    lines += [
+        '# HELP db_query_duration_seconds SQL statement duration by fingerprint',
+        '# TYPE db_query_duration_seconds histogram',
+    ]
+    for fid, text, h, _ in sorted(queries):
+        lines += _histogram_lines('db_query_duration_seconds',
+                                  _labels(fingerprint=fid, query=text[:200]), h)
+
+    lines += [
+        '# HELP db_query_rows_total Rows returned or affected by fingerprint',
+        '# TYPE db_query_rows_total counter',
+    ]
+    for fid, _, _, rows in sorted(queries):
+        lines.append(f'db_query_rows_total{{{_labels(fingerprint=fid)}}} {rows}')
+
+    lines += [
+        '# HELP db_slow_queries_logged Entries in the slow query log',
+        '# TYPE db_slow_queries_logged gauge',
+        f'db_slow_queries_logged {slow}',
+    ]
+
+    if pool and pool.get('initialized'):
+        for key in ('open_connections', 'idle_connections', 'in_use', 'peak_in_use'):
+            lines.append(f'# TYPE db_pool_{key} gauge')
+            lines.append(f'db_pool_{key} {pool[key]}')
+        for key in ('checkouts', 'waits', 'timeouts', 'healthcheck_failures'):
+            lines.append(f'# TYPE db_pool_{key}_total counter')
+            lines.append(f'db_pool_{key}_total {pool[key]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _copy(h):
+    clone = Histogram()
+    clone.counts = list(h.counts)
+    clone.total = h.total
+    clone.count = h.count
+    return clone
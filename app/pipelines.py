@@ -0,0 +1,433 @@
+"""
+Upload pipelines run as background jobs
+תהליכי ההעלאה (רצים כעבודות רקע)
+
+Each function takes a JobContext (app/jobs.py) plus the saved upload and
+runs the same stages the upload routes used to run inside the request,
+reporting stage / progress / messages through the context. Each import
+also records its stages in the ETL run ledger (app/etl_ledger.py).
+"""
+import time
+
+from psycopg2.extras import execute_values
+
+from app.bulk_load import load_raw_residents, remember_loaded_rows
+from app.cleaning import clean_resident_values, map_resident_columns
+from app.config import Config
+from app.dashboard import invalidate_dashboard_stats
+from app.db import advisory_lock, get_connection
+from app.etl_ledger import EtlRun
+from app.profiling import get_profile, profile_function
+from app.ingest import iter_upload_chunks, row_hash
+from app.reports import refresh_reports_after_run
+from app.utils import execute_function
+
+# Map rating to package_size
+RATING_MAP = {
+    1: 'סמלי',
+    2: 'מכובד',
+    3: 'מפואר',
+    '1': 'סמלי',
+    '2': 'מכובד',
+    '3': 'מפואר'
+}
+
+ORDERS_BATCH_SIZE = 1000
+
+# Advisory locks (app.db.advisory_lock) serializing the imports of a kind,
+# web jobs and scripts/ alike: they share raw / temp / outerapporder rows
+RESIDENTS_LOCK = 'etl_residents'
+ORDERS_LOCK = 'etl_orders'
+
+
+def set_job_id(cur, ctx):
+    """Tag this transaction's etl_progress notifications with the job id"""
+    cur.execute("SELECT set_config('etl.job_id', %s, true)", (str(ctx.job_id),))
+
+
+def import_lock(ctx, name):
+    """advisory_lock(name); the job shows a waiting stage while another import holds it"""
+    return advisory_lock(name, on_wait=lambda: ctx.stage('waiting for another import', 0))
+
+
+def after_run(label):
+    """Bring reports and dashboard counters up to date after a run"""
+    refresh_reports_after_run(label)
+    invalidate_dashboard_stats()
+
+
+def resident_chunks(ctx, path, filename, mapped_columns):
+    """File chunks with mapped column names and cleaned values (fills mapped_columns)"""
+    first = True
+    for df in iter_upload_chunks(path, filename):
+        if first:
+            first = False
+            mapped_columns.update(map_resident_columns(df))
+
+            # Log column mapping
+            if mapped_columns:
+                print("🔄 מיפוי עמודות:")
+                for orig, mapped in mapped_columns.items():
+                    print(f"   {orig} → {mapped}")
+                mapping_msg = "🔄 מיפוי עמודות אוטומטי:\n" + "\n".join([f"• {o} → {m}" for o, m in list(mapped_columns.items())[:5]])
+                if len(mapped_columns) > 5:
+                    mapping_msg += f"\n• ועוד {len(mapped_columns) - 5}..."
+                ctx.message(mapping_msg, 'info')
+        else:
+            map_resident_columns(df)
+
+        clean_resident_values(df)
+        yield df
+
+
+def residents_status_counts(cur):
+    """temp_residents_csv rows per status after process_residents_csv"""
+    cur.execute("""
+        SELECT COALESCE(NULLIF(status, ''), 'ממתין') AS status, COUNT(*) AS count
+        FROM temp_residents_csv
+        GROUP BY 1
+    """)
+    return {row['status']: row['count'] for row in cur.fetchall()}
+
+
+def temp_residents_progress(cur):
+    """(rows, rows still pending) in temp_residents_csv"""
+    cur.execute("""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE status IS NULL OR status = '' OR status = 'ממתין') AS pending
+        FROM temp_residents_csv
+    """)
+    row = cur.fetchone()
+    return row['total'], row['pending']
+
+
+def temp_residents_fingerprint(cur):
+    """temp_residents_csv fingerprint (migrations/21_resume_fingerprint.sql), None when empty"""
+    cur.execute("SELECT temp_residents_fingerprint() AS fingerprint")
+    return cur.fetchone()['fingerprint']
+
+
+def skip_unchanged(ctx, run, previous):
+    """Close the run as skipped: previous already imported the same file"""
+    run.skip(previous)
+    ctx.message(f'⏭️ הקובץ זהה לקובץ שיובא בהרצה #{previous["id"]} '
+                f'({previous["started_at"]:%d/%m/%Y %H:%M}) ולא יובא שוב. '
+                f'לייבוא מחדש סמן "ייבוא מחדש"', 'info')
+    return run.stats
+
+
+def run_residents_upload(ctx, path, filename, force=False):
+    """
+    file chunks → raw (COPY) → raw_to_temp_stage → process_residents_csv → stats
+
+    Unless force is set, a file that was already imported is skipped, rows
+    an earlier import merged or inserted are dropped after loading, and an
+    interrupted run of the same file continues from its last committed batch.
+    """
+    mapped_columns = {}
+
+    with import_lock(ctx, RESIDENTS_LOCK), \
+            EtlRun.start('residents', 'web', path=path, filename=filename, job_id=ctx.job_id) as run:
+        previous = None if force else run.previous_import()
+        if previous:
+            return skip_unchanged(ctx, run, previous)
+        interrupted = None if force else run.interrupted_run()
+
+        with get_connection() as conn:
+            cur = conn.cursor()
+            temp_count, pending = 0, 0
+            if interrupted:
+                if temp_residents_fingerprint(cur) == interrupted['temp_fingerprint']:
+                    temp_count, pending = temp_residents_progress(cur)
+                else:
+                    ctx.message(f'⚠️ טבלת temp כבר לא מכילה את השורות של הרצה #{interrupted["id"]} '
+                                f'שנקטעה – הקובץ נטען מחדש', 'warning')
+
+            if temp_count:
+                # The interrupted run's rows are still in temp: carry on from there
+                run.resume(interrupted)
+                load_stats = {'rows': 0, 'skipped': 0, 'rows_per_sec': 0, 'method': None, 'chunks': 0}
+                rows_inserted = 0
+                ctx.message(f'↩️ ממשיך את הרצה #{interrupted["id"]} שנקטעה: '
+                            f'{temp_count - pending} מתוך {temp_count} שורות כבר עובדו', 'info')
+            else:
+                # Stage 1: file to raw table, chunk by chunk (COPY)
+                ctx.stage('load_raw', 5)
+                with run.stage('load_raw') as stage:
+                    load_stats = load_raw_residents(
+                        conn, resident_chunks(ctx, path, filename, mapped_columns),
+                        on_chunk=lambda rows: ctx.progress(rows_done=rows),
+                        skip_loaded=not force
+                    )
+                    rows_inserted = stage.rows_out = load_stats['rows']
+                ctx.progress(rows_done=rows_inserted, rows_total=rows_inserted, force=True)
+                ctx.message(f'✅ שלב 1: {rows_inserted} שורות נטענו לטבלת raw '
+                            f'({load_stats["rows_per_sec"]} שורות/שנייה)', 'info')
+                if load_stats['skipped']:
+                    ctx.message(f'⏭️ {load_stats["skipped"]} שורות כבר יובאו בהעלאה קודמת ודולגו', 'info')
+
+                # Stage 2: raw to temp
+                ctx.stage('raw_to_temp_stage', 35)
+                with run.stage('raw_to_temp_stage', rows_in=rows_inserted) as stage:
+                    set_job_id(cur, ctx)
+                    cur.execute("SELECT raw_to_temp_stage()")
+                    result1 = cur.fetchone()
+                    conn.commit()
+                    temp_count = pending = stage.rows_out = result1['raw_to_temp_stage'] if result1 else 0
+                run.record_temp(temp_residents_fingerprint(cur))
+                ctx.message(f'✅ שלב 2: {temp_count} שורות הועברו לטבלת temp', 'info')
+
+            # Stage 3: temp to person, ETL_BATCH_SIZE rows per call (each
+            # commit delivers one etl_progress notification and is a point
+            # an interrupted run resumes from)
+            ctx.stage('process_residents_csv', 55)
+            processed_count = temp_count - pending
+            ctx.progress(rows_done=processed_count, rows_total=temp_count, force=True)
+            started = time.monotonic()
+            with run.stage('process_residents_csv', rows_in=pending) as stage:
+                while True:
+                    set_job_id(cur, ctx)
+                    cur.execute("SELECT process_residents_csv(%s)", (Config.ETL_BATCH_SIZE,))
+                    batch = cur.fetchone()['process_residents_csv']
+                    conn.commit()
+                    if not batch:
+                        break
+                    processed_count += batch
+                    ctx.progress(rows_done=processed_count,
+                                 progress=55 + 30 * processed_count / max(temp_count, processed_count))
+                stage.rows_out = processed_count - (temp_count - pending)
+                stage.status_counts = residents_status_counts(cur)
+                remember_loaded_rows(cur, run.id)
+                conn.commit()
+            ctx.progress(rows_done=processed_count, force=True)
+            process_rate = round(stage.rows_out / max(time.monotonic() - started, 0.001))
+            ctx.message(f'✅ שלב 3: {processed_count} תושבים עובדו בהצלחה! '
+                        f'({process_rate} שורות/שנייה)', 'success')
+
+            # Statistics
+            ctx.stage('stats', 85)
+            stats = {
+                'inserted': stage.status_counts.get('הופץ', 0),
+                'merged': stage.status_counts.get('אוחד', 0),
+                'skipped': stage.status_counts.get('נדחה', 0),
+                'partial_match': stage.status_counts.get('התאמה חלקית', 0),
+            }
+
+            ctx.message(f"""📊 סטטיסטיקות:
+            • נוספו: {stats['inserted']}
+            • אוחדו: {stats['merged']}
+            • נדחו: {stats['skipped']}
+            • התאמה חלקית: {stats['partial_match']}
+            """, 'info')
+
+            # If many were skipped, show warning
+            if stats['skipped'] > 0:
+                ctx.message(f'⚠️ {stats["skipped"]} תושבים נדחו! בדוק ב-"דיבאג ETL" למה', 'warning')
+
+            # Check final person count
+            cur.execute("SELECT COUNT(*) as total FROM person")
+            total = cur.fetchone()['total']
+            ctx.message(f'👥 סה"כ תושבים במערכת: {total}', 'success')
+
+            cur.close()
+
+        ctx.stage('refresh_reports', 95)
+        with run.stage('refresh_reports'):
+            after_run('residents upload')
+
+        run.stats = {
+            'rows_loaded': rows_inserted,
+            'rows_already_loaded': load_stats['skipped'],
+            'rows_per_sec': load_stats['rows_per_sec'],
+            'load_method': load_stats.get('method'),
+            'temp_rows': temp_count,
+            'processed': processed_count,
+            'process_rows_per_sec': process_rate,
+            'inserted': stats['inserted'],
+            'merged': stats['merged'],
+            'skipped': stats['skipped'],
+            'partial_match': stats['partial_match'],
+            'total_residents': total,
+            'load_chunks': load_stats['chunks'],
+            'column_mapping': mapped_columns,
+            'resumed_from': run.resumed_from,
+        }
+
+    return run.stats
+
+
+def outer_order_rows(df):
+    """outerapporder values (sender_code, invitees, package_size, origin) of a chunk"""
+    rows = []
+    for _, row in df.iterrows():
+        rating = row.get('rating')
+        rows.append((
+            str(row.get('order_code', '')),                                  # sender_code
+            str(row.get('guest_list', '')),                                  # invitees
+            RATING_MAP.get(rating, RATING_MAP.get(str(rating), 'סמלי')),     # package_size
+            'external_app',
+        ))
+    return rows
+
+
+def orders_status_counts(cur, after_id):
+    """outerapporder rows per status, for the rows with id > after_id"""
+    cur.execute("""
+        SELECT status, COUNT(*) AS count
+        FROM outerapporder
+        WHERE id > %s
+        GROUP BY status
+    """, (after_id,))
+    return {row['status']: row['count'] for row in cur.fetchall()}
+
+
+def insert_outer_orders(cur, rows):
+    """
+    Insert outer_order_rows() values as waiting orders, each with its row_hash
+
+    Rows already in outerapporder (same row_hash) are left out.
+
+    Returns:
+        int: rows inserted
+    """
+    if not rows:
+        return 0
+    inserted = execute_values(cur, """
+        INSERT INTO outerapporder
+        (sender_code, invitees, package_size, origin, created_at, status, row_hash)
+        VALUES %s
+        ON CONFLICT (row_hash) WHERE row_hash IS NOT NULL DO NOTHING
+        RETURNING 1
+    """, [row + (row_hash(row),) for row in rows],
+        template="(%s, %s, %s, %s, NOW(), 'waiting', %s)", page_size=ORDERS_BATCH_SIZE, fetch=True)
+    return len(inserted)
+
+
+def run_orders_upload(ctx, path, filename, force=False):
+    """
+    file chunks → outerapporder (batched) → distribute_all_outer_orders
+
+    A file that was already imported is skipped unless force is set; orders
+    already in outerapporder are never inserted twice.
+    """
+    with import_lock(ctx, ORDERS_LOCK), \
+            EtlRun.start('orders', 'web', path=path, filename=filename, job_id=ctx.job_id) as run:
+        previous = None if force else run.previous_import()
+        if previous:
+            return skip_unchanged(ctx, run, previous)
+
+        with get_connection() as conn:
+            cur = conn.cursor()
+
+            # One transaction for the whole file, one INSERT per chunk
+            ctx.stage('load_orders', 5)
+            with run.stage('load_orders') as stage:
+                cur.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM outerapporder")
+                last_id = cur.fetchone()['last_id']
+                rows_read = rows_inserted = 0
+                for df in iter_upload_chunks(path, filename):
+                    rows = outer_order_rows(df)
+                    rows_inserted += insert_outer_orders(cur, rows)
+                    rows_read += len(rows)
+                    ctx.progress(rows_done=rows_read)
+                conn.commit()
+                stage.rows_in = rows_read
+                stage.rows_out = rows_inserted
+            ctx.progress(rows_done=rows_read, rows_total=rows_read, force=True)
+            duplicates = rows_read - rows_inserted
+            if duplicates:
+                ctx.message(f'⏭️ {duplicates} הזמנות כבר קיימות במערכת ודולגו', 'info')
+
+            # Run distribution
+            ctx.stage('distribute_all_outer_orders', 50)
+            cur.execute("SELECT COUNT(*) AS waiting FROM outerapporder WHERE status = 'waiting'")
+            waiting = cur.fetchone()['waiting']
+            with run.stage('distribute_all_outer_orders', rows_in=waiting) as stage:
+                set_job_id(cur, ctx)
+                cur.execute("SELECT distribute_all_outer_orders()")
+                result = cur.fetchone()
+                distributed = stage.rows_out = result['distribute_all_outer_orders'] if result else 0
+                conn.commit()
+                stage.status_counts = orders_status_counts(cur, last_id)
+            cur.close()
+
+        ctx.message(f'הקובץ הועלה בהצלחה! {rows_inserted} הזמנות נטענו, {distributed} הופצו', 'success')
+
+        ctx.stage('refresh_reports', 95)
+        with run.stage('refresh_reports'):
+            after_run('orders distribution')
+
+        run.stats = {'rows_loaded': rows_inserted, 'rows_already_loaded': duplicates,
+                     'distributed': distributed}
+
+    return run.stats
+
+
+def run_orders_import(ctx, path, filename, force=False):
+    """import_orders_from_csv (order_code + guest_list pairs); an already imported file is skipped unless force"""
+    from app.import_orders import import_orders_from_csv
+
+    with EtlRun.start('orders_import', 'web', path=path, filename=filename, job_id=ctx.job_id) as run:
+        previous = None if force else run.previous_import()
+        if previous:
+            return skip_unchanged(ctx, run, previous)
+
+        ctx.stage('import_orders', 10)
+        with run.stage('import_orders') as stage:
+            with get_connection() as conn:
+                stats = import_orders_from_csv(path, conn, filename=filename)
+            stage.rows_in = stats['total_orders']
+            stage.rows_out = stats['successful_pairs']
+            stage.status_counts = {'created': stats['successful_pairs'], 'failed': stats['failed_pairs']}
+
+        # Build messages
+        ctx.message(f'✅ {stats["total_orders"]} הזמנות עובדו', 'success')
+        ctx.message(f'✅ {stats["successful_pairs"]} זוגות שולח-מקבל נוצרו בהצלחה!', 'success')
+
+        if stats['failed_pairs'] > 0:
+            ctx.message(f'⚠️ {stats["failed_pairs"]} זוגות נכשלו', 'warning')
+
+        for key, label in (('missing_senders', 'שולחים חסרים'), ('missing_receivers', 'מקבלים חסרים')):
+            if stats[key]:
+                count = len(stats[key])
+                sample = ', '.join(str(c) for c in stats[key][:5])
+                if count > 5:
+                    sample += f'... ועוד {count-5}'
+                ctx.message(f'⚠️ {label} ({count}): {sample}', 'warning')
+
+        ctx.stage('refresh_reports', 95)
+        with run.stage('refresh_reports'):
+            after_run('orders import')
+        run.stats = {key: stats[key] for key in ('total_orders', 'successful_pairs', 'failed_pairs')}
+    return stats
+
+
+def run_database_function(ctx, func_name, params, profile=False, created_by=None):
+    """
+    Run a public database function (the run-procedures page)
+
+    profile=True runs it under EXPLAIN ANALYZE in a rolled-back transaction
+    and saves the plan (app/profiling.py) instead of applying its changes.
+    """
+    if profile:
+        ctx.stage(f'profile {func_name}', 10)
+        profile_id = profile_function(func_name, params, created_by=created_by)
+        saved = get_profile(profile_id)
+        ctx.message(f'🔬 פרופיל {func_name}: {float(saved["execution_ms"]):.1f}ms '
+                    f'(השינויים בוטלו)', 'info')
+        top = saved['top_nodes'][0] if saved['top_nodes'] else None
+        return {
+            'profile_id': profile_id,
+            'execution_ms': float(saved['execution_ms']),
+            'planning_ms': float(saved['planning_ms']),
+            'top_node': f"{top['node']} ({top['pct']}%)" if top else None,
+        }
+
+    ctx.stage(func_name, 10)
+    result = execute_function(func_name, params if params else None)
+    ctx.message(f'הפונקציה {func_name} הורצה בהצלחה! תוצאה: {result}', 'success')
+
+    # The function may have changed anything the reports read
+    ctx.stage('refresh_reports', 90)
+    after_run(func_name)
+    return {'result': dict(result) if result else None}
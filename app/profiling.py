@@ -0,0 +1,283 @@
+"""
+Query profiling (EXPLAIN ANALYZE)
+פרופיילינג של פונקציות ודוחות
+
+The run-procedures page and the reports page have an opt-in profile mode:
+the statement runs under EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) in a
+transaction that is always rolled back, so mutating functions
+(process_residents_csv, distribute_all_outer_orders, ...) leave no data
+behind (sequences still advance, NOTIFYs are dropped). The plan, its
+timings and the plan nodes with the most exclusive time are stored in
+query_profiles (migrations/17_query_profiles.sql).
+
+To EXPLAIN, a plpgsql function is one Result node. Where the server allows
+it (superuser), the statements inside are captured as well:
+
+  * auto_explain (if installed) with log_nested_statements, its plans sent
+    to this connection as NOTICEs;
+  * pg_stat_xact_user_functions (track_functions = 'pl') for the time of
+    every function and trigger the call reached.
+"""
+import json
+import re
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import Json
+
+from app import schema_cache
+from app.config import Config
+from app.db import get_connection, get_cursor
+from app.reports import report_source
+
+# Plan nodes kept in the summary
+TOP_NODES = 15
+
+AUTO_EXPLAIN_SETTINGS = """
+    SET LOCAL auto_explain.log_min_duration = 0;
+    SET LOCAL auto_explain.log_analyze = on;
+    SET LOCAL auto_explain.log_buffers = on;
+    SET LOCAL auto_explain.log_nested_statements = on;
+    SET LOCAL auto_explain.log_format = json;
+    SET LOCAL auto_explain.log_level = notice;
+"""
+
+_AUTO_EXPLAIN_RE = re.compile(r'duration: ([\d.]+) ms\s+plan:\s*(\{.*\})', re.DOTALL)
+
+
+def node_label(node):
+    """'Hash Join (Inner)', 'Seq Scan on person', 'Index Scan using idx on t' ..."""
+    label = node['Node Type']
+    if node.get('Join Type'):
+        label += f" ({node['Join Type']})"
+    if node.get('Index Name'):
+        label += f" using {node['Index Name']}"
+    target = node.get('Relation Name') or node.get('CTE Name') or node.get('Function Name')
+    if target:
+        label += f" on {target}"
+        if node.get('Alias') and node['Alias'] != target:
+            label += f" {node['Alias']}"
+    return label
+
+
+def plan_nodes(plan, statement=0):
+    """
+    Every node of a JSON plan with its exclusive time
+
+    Actual Total Time is per loop and includes the children, so a node's
+    own time is total × loops minus its children's total × loops.
+    """
+    nodes = []
+
+    def walk(node, depth):
+        loops = node.get('Actual Loops', 0)
+        inclusive = node.get('Actual Total Time', 0) * loops
+        children = node.get('Plans', [])
+        children_ms = sum(child.get('Actual Total Time', 0) * child.get('Actual Loops', 0)
+                          for child in children)
+        nodes.append({
+            'statement': statement,
+            'depth': depth,
+            'node': node_label(node),
+            'exclusive_ms': round(max(inclusive - children_ms, 0), 3),
+            'inclusive_ms': round(inclusive, 3),
+            'rows': node.get('Actual Rows', 0) * loops,
+            'plan_rows': node.get('Plan Rows'),
+            'loops': loops,
+            'shared_hit': node.get('Shared Hit Blocks'),
+            'shared_read': node.get('Shared Read Blocks'),
+        })
+        for child in children:
+            walk(child, depth + 1)
+
+    walk(plan, 0)
+    return nodes
+
+
+def top_nodes(plans, limit=TOP_NODES):
+    """Nodes of several plans ({statement: plan}) by exclusive time, with their share"""
+    nodes = [node for statement, plan in plans.items() for node in plan_nodes(plan, statement)]
+    total = sum(node['exclusive_ms'] for node in nodes) or 1
+    nodes.sort(key=lambda node: -node['exclusive_ms'])
+    for node in nodes:
+        node['pct'] = round(node['exclusive_ms'] * 100 / total, 1)
+    return nodes[:limit]
+
+
+def _try(cur, statement):
+    """Run an optional setup statement; False (and nothing changed) if the server refuses"""
+    cur.execute("SAVEPOINT profile_setup")
+    try:
+        cur.execute(statement)
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT profile_setup")
+        return False
+    cur.execute("RELEASE SAVEPOINT profile_setup")
+    return True
+
+
+def _nested_plans(notices):
+    """auto_explain NOTICEs → [{query, duration_ms, plan}] (the EXPLAIN itself left out)"""
+    plans = []
+    for notice in notices:
+        match = _AUTO_EXPLAIN_RE.search(notice)
+        if not match:
+            continue
+        try:
+            entry = json.loads(match.group(2))
+        except ValueError:
+            continue
+        query = entry.get('Query Text', '')
+        if query.lstrip().upper().startswith('EXPLAIN'):
+            continue
+        plans.append({'query': query, 'duration_ms': float(match.group(1)), 'plan': entry['Plan']})
+    return plans
+
+
+def explain_analyze(conn, query, params=None):
+    """
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) query, then roll everything back
+
+    Returns:
+        dict: plan, planning_ms, execution_ms, total_ms, nested, functions, top_nodes
+    """
+    cur = conn.cursor()
+    saved_notices = conn.notices
+    conn.notices = deque(maxlen=1000)
+    try:
+        cur.execute("SET LOCAL statement_timeout = %s", (Config.PROFILE_TIMEOUT_MS,))
+        track_functions = _try(cur, "SET LOCAL track_functions = 'pl'")
+        nested_statements = (_try(cur, "LOAD 'auto_explain'")
+                             and _try(cur, AUTO_EXPLAIN_SETTINGS))
+
+        started = time.perf_counter()
+        cur.execute(sql.SQL('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ') + query, params)
+        total_ms = (time.perf_counter() - started) * 1000
+        result = cur.fetchone()['QUERY PLAN']
+        if isinstance(result, str):
+            result = json.loads(result)
+        explained = result[0]
+
+        functions = None
+        if track_functions:
+            cur.execute("""
+                SELECT funcname AS function, calls, total_time AS total_ms, self_time AS self_ms
+                FROM pg_stat_xact_user_functions
+                ORDER BY total_time DESC
+            """)
+            functions = [dict(row) for row in cur.fetchall()]
+
+        nested = _nested_plans(conn.notices) if nested_statements else []
+    finally:
+        conn.rollback()
+        conn.notices = saved_notices
+        cur.close()
+
+    # A function's own statements are where its time goes; the Result node
+    # of SELECT f() would only repeat the total
+    if nested:
+        plans = {i: entry['plan'] for i, entry in enumerate(nested, start=1)}
+    else:
+        plans = {0: explained['Plan']}
+
+    return {
+        'plan': explained,
+        'planning_ms': explained.get('Planning Time'),
+        'execution_ms': explained.get('Execution Time'),
+        'total_ms': round(total_ms, 3),
+        'nested': nested or None,
+        'functions': functions,
+        'top_nodes': top_nodes(plans),
+    }
+
+
+def _save(target_type, target, relation, query_text, params, volatility, profile, created_by):
+    with get_cursor(commit=True) as cur:
+        cur.execute("""
+            INSERT INTO query_profiles
+            (target_type, target, relation, query, params, volatility, planning_ms, execution_ms,
+             total_ms, plan, nested, functions, top_nodes, created_by)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (target_type, target, relation, query_text, Json(params), volatility,
+              profile['planning_ms'], profile['execution_ms'], profile['total_ms'],
+              Json(profile['plan']), Json(profile['nested']), Json(profile['functions']),
+              Json(profile['top_nodes']), created_by))
+        return cur.fetchone()['id']
+
+
+def profile_function(func_name, params=None, created_by=None):
+    """
+    Profile SELECT func_name(params...) (rolled back); ValueError for unknown functions
+
+    Returns:
+        int: query_profiles id
+    """
+    if func_name not in {func['name'] for func in schema_cache.functions()}:
+        raise ValueError(f"פונקציה לא קיימת: {func_name}")
+    params = list(params or [])
+
+    query = sql.SQL('SELECT {}({})').format(
+        sql.Identifier(func_name),
+        sql.SQL(', ').join([sql.Placeholder()] * len(params))
+    )
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # Overloads: the most volatile one decides
+            cur.execute("""
+                SELECT MAX(p.provolatile) AS volatility
+                FROM pg_proc p
+                JOIN pg_namespace n ON n.oid = p.pronamespace
+                WHERE n.nspname = 'public' AND p.proname = %s
+            """, (func_name,))
+            volatility = cur.fetchone()['volatility']
+        conn.rollback()
+        query_text = query.as_string(conn)
+        profile = explain_analyze(conn, query, params)
+
+    return _save('function', func_name, None, query_text, params, volatility, profile, created_by)
+
+
+def profile_view(view_name, live=True, created_by=None):
+    """
+    Profile SELECT * FROM the report (the view itself, or its mv_* copy unless live)
+
+    Returns:
+        int: query_profiles id
+    """
+    schema_cache.view_columns(view_name)  # ValueError for unknown views
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            relation, _, _ = report_source(cur, view_name, live)
+        conn.rollback()
+        query = sql.SQL('SELECT * FROM {}').format(sql.Identifier(relation))
+        query_text = query.as_string(conn)
+        profile = explain_analyze(conn, query)
+
+    return _save('view', view_name, relation, query_text, None, None, profile, created_by)
+
+
+def get_profile(profile_id):
+    """query_profiles row as a dict, or None"""
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM query_profiles WHERE id = %s", (profile_id,))
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def list_profiles(target=None, limit=50):
+    """Latest profiles without the plans (newest first)"""
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT id, target_type, target, relation, params, volatility,
+                   planning_ms, execution_ms, total_ms, created_by, created_at,
+                   top_nodes -> 0 AS top_node
+            FROM query_profiles
+            WHERE %(target)s::text IS NULL OR target = %(target)s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %(limit)s
+        """, {'target': target, 'limit': limit})
+        return [dict(row) for row in cur.fetchall()]
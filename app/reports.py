@@ -0,0 +1,74 @@
+"""
+Materialized report layer
+שכבת דוחות מחושבת מראש
+
+Summary reports (v_families_balance, v_accounts_summary, ...) have an
+mv_* materialized copy (migrations/12_materialized_reports.sql). Reads go
+to the copy unless live data is asked for; refresh_reports() brings the
+copies up to date after distribution / import runs.
+"""
+from app.db import get_cursor
+
+
+def get_materialized(cur, view_name):
+    """mv_name / refreshed_at of the view's materialized copy, or None"""
+    cur.execute("SELECT to_regclass('public.report_materialized') IS NOT NULL AS registry")
+    if not cur.fetchone()['registry']:
+        return None
+
+    cur.execute("""
+        SELECT mv_name, refreshed_at, duration_ms, row_count
+        FROM report_materialized
+        WHERE view_name = %s
+    """, (view_name,))
+    return cur.fetchone()
+
+
+def report_source(cur, view_name, live=False):
+    """
+    Relation to read a report from
+
+    Returns:
+        tuple: (relation name, source, refreshed_at) - source is
+        'materialized' for the mv_* copy, 'live' for the view itself
+    """
+    materialized = None if live else get_materialized(cur, view_name)
+    if materialized:
+        return materialized['mv_name'], 'materialized', materialized['refreshed_at']
+    return view_name, 'live', None
+
+
+def refresh_reports(view_name=None, concurrently=True):
+    """
+    Refresh the materialized copies (all, or one view)
+
+    Returns:
+        list: [{view_name, duration_ms, row_count}] per refreshed copy
+    """
+    with get_cursor(commit=True) as cur:
+        cur.execute("SELECT * FROM refresh_report_views(%s, %s)", (view_name, concurrently))
+        return cur.fetchall()
+
+
+def refresh_reports_after_run(label):
+    """Refresh after a distribution / import run; failures are reported, not raised"""
+    try:
+        refreshed = refresh_reports()
+        total_ms = sum(float(row['duration_ms']) for row in refreshed)
+        print(f"📊 Reports refreshed after {label}: {len(refreshed)} views in {total_ms:.0f}ms")
+    except Exception as e:
+        print(f"⚠️ Report refresh after {label} failed: {e}")
+
+
+def report_freshness():
+    """Refresh state of every materialized report"""
+    with get_cursor() as cur:
+        cur.execute("SELECT to_regclass('public.report_materialized') IS NOT NULL AS registry")
+        if not cur.fetchone()['registry']:
+            return []
+        cur.execute("""
+            SELECT view_name, mv_name, refreshed_at, duration_ms, row_count
+            FROM report_materialized
+            ORDER BY view_name
+        """)
+        return cur.fetchall()
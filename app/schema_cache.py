@@ -0,0 +1,219 @@
+"""
+Schema metadata cache
+מטמון מטא-דאטה של הסכמה
+
+Table / view / function lists, function parameters and per-table columns
+are read on every page load and every search keystroke, but only change
+with migrations. They are served from a TTLCache and reloaded when:
+  - SCHEMA_CACHE_TTL seconds have passed,
+  - the database announces DDL on channel schema_changed
+    (migrations/11_schema_change_notify.sql), or
+  - /api/schema-cache/refresh is called.
+
+Cached values are shared between requests - callers must not modify them.
+"""
+import select
+import threading
+import time
+
+import psycopg2
+
+from app.cache import TTLCache
+from app.config import Config
+from app.db import get_cursor
+from app.search import get_search_index
+
+CHANNEL = 'schema_changed'
+
+_cache = TTLCache(Config.SCHEMA_CACHE_TTL)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+# ====================
+# Loaders
+# ====================
+
+def _load_tables():
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT table_name as name
+            FROM information_schema.tables
+            WHERE table_schema = 'public'
+            AND table_type = 'BASE TABLE'
+            ORDER BY table_name
+        """)
+        return cur.fetchall()
+
+
+def _load_views():
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT table_name as name
+            FROM information_schema.views
+            WHERE table_schema = 'public'
+            ORDER BY table_name
+        """)
+        return cur.fetchall()
+
+
+def _load_functions():
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT routine_name as name
+            FROM information_schema.routines
+            WHERE routine_schema = 'public'
+            AND routine_type = 'FUNCTION'
+            ORDER BY routine_name
+        """)
+        return cur.fetchall()
+
+
+def _load_function_parameters():
+    """IN parameters of every public function in one query, by function name"""
+    with get_cursor() as cur:
+        cur.execute("""
+            SELECT
+                r.routine_name,
+                p.parameter_name,
+                p.data_type,
+                p.parameter_default
+            FROM information_schema.parameters p
+            JOIN information_schema.routines r
+              ON r.specific_schema = p.specific_schema
+             AND r.specific_name = p.specific_name
+            WHERE p.specific_schema = 'public'
+            AND r.routine_schema = 'public'
+            AND p.parameter_mode = 'IN'
+            ORDER BY r.routine_name, p.ordinal_position
+        """)
+        by_function = {}
+        for row in cur.fetchall():
+            name = row.pop('routine_name')
+            by_function.setdefault(name, []).append(row)
+        return by_function
+
+
+def _load_view_columns(view_name):
+    # Imported here: app.utils imports this module
+    from app.utils import get_view_columns
+
+    with get_cursor() as cur:
+        return get_view_columns(cur, view_name)
+
+
+def _load_table_meta(table_name):
+    from app.utils import get_table_columns, get_primary_key
+
+    with get_cursor() as cur:
+        return {
+            'columns': get_table_columns(cur, table_name),
+            'primary_key': get_primary_key(cur, table_name),
+            'search_index': get_search_index(cur, table_name),
+        }
+
+
+# ====================
+# Cached lookups
+# ====================
+
+def _get(key, loader):
+    ensure_listener()
+    return _cache.get(key, loader)
+
+
+def tables():
+    """Public base tables [{'name': ...}]"""
+    return _get('tables', _load_tables)
+
+
+def views():
+    """Public views [{'name': ...}]"""
+    return _get('views', _load_views)
+
+
+def functions():
+    """Public functions [{'name': ...}]"""
+    return _get('functions', _load_functions)
+
+
+def function_parameters(func_name):
+    """IN parameters of a public function (empty list if unknown)"""
+    return _get('function_parameters', _load_function_parameters).get(func_name, [])
+
+
+def table_meta(table_name):
+    """
+    Columns, primary key and search index of a public table
+
+    Returns:
+        dict: columns [(name, type)], primary_key [names], search_index
+        (see app.search.get_search_index) - ValueError if the table does not exist
+    """
+    return _get(('table', table_name), lambda: _load_table_meta(table_name))
+
+
+def view_columns(view_name):
+    """Columns [(name, type)] of a public view - ValueError if it does not exist"""
+    return _get(('view', view_name), lambda: _load_view_columns(view_name))
+
+
+def refresh():
+    """Drop everything cached; the next lookups reload from the catalog"""
+    _cache.invalidate()
+
+
+def stats():
+    """Cache counters plus the state of the notification listener"""
+    result = _cache.stats()
+    result['listener'] = _listener.is_alive() if _listener else False
+    return result
+
+
+# ====================
+# DDL notifications
+# ====================
+
+def _listen(dsn):
+    """Invalidate the cache on every schema_changed notification; reconnect on failure"""
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f'LISTEN {CHANNEL}')
+            # DDL may have happened while we were not listening
+            _cache.invalidate()
+            backoff = 1
+
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    tags = {n.payload for n in conn.notifies}
+                    conn.notifies.clear()
+                    _cache.invalidate()
+                    print(f"🔄 Schema cache invalidated ({', '.join(sorted(tags))})")
+        except Exception as e:
+            print(f"⚠️ Schema cache listener error: {e} - retrying in {backoff}s")
+        finally:
+            if conn is not None:
+                conn.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def ensure_listener():
+    """Start the notification listener thread once per process"""
+    global _listener
+    if _listener is not None or not Config.SCHEMA_CACHE_LISTEN:
+        return
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=_listen, args=(Config.DATABASE_URL,),
+                name='schema-cache-listener', daemon=True
+            )
+            _listener.start()
@@ -0,0 +1,69 @@
+"""
+Search for the table browser
+חיפוש בטבלאות
+
+Searching matches a term anywhere in any text column (ILIKE '%term%').
+Tables registered in search_index (migrations/10_trigram_search.sql) have a
+GIN trigram index over one expression that joins their text columns; those
+tables are searched on that expression so the index can be used. Tables
+without an index (or servers without pg_trgm) fall back to per-column ILIKE.
+"""
+from psycopg2 import sql
+
+
+def is_text_type(col_type):
+    """True for text / varchar / char columns (format_type names)"""
+    return col_type == 'text' or col_type.startswith(('character', 'varchar'))
+
+
+def get_search_index(cur, table_name):
+    """Columns and expression of the table's trigram index, or None"""
+    cur.execute("SELECT to_regclass('public.search_index') IS NOT NULL AS registry")
+    if not cur.fetchone()['registry']:
+        return None
+
+    cur.execute("""
+        SELECT s.columns, search_expression(s.columns) AS expression
+        FROM search_index s
+        JOIN pg_class i ON i.relname = s.index_name AND i.relkind = 'i'
+        JOIN pg_namespace n ON n.oid = i.relnamespace AND n.nspname = 'public'
+        WHERE s.table_name = %s
+    """, (table_name,))
+    return cur.fetchone()
+
+
+def build_search_condition(columns, term, index=None):
+    """
+    WHERE condition matching term in any text column
+
+    Args:
+        columns: [(name, type)] of the table
+        term: search text
+        index: the table's get_search_index() result, or None
+
+    Returns:
+        tuple: (condition or None, params, method) - method is 'trigram' when
+        the indexed expression is used, otherwise 'ilike'
+    """
+    text_columns = [name for name, col_type in columns if is_text_type(col_type)]
+    if not text_columns:
+        return None, [], 'ilike'
+
+    pattern = f"%{term}%"
+    conditions = []
+    method = 'ilike'
+
+    if index:
+        # The expression comes from search_expression() so it matches the index exactly
+        conditions.append(sql.SQL(index['expression'] + ' ILIKE %s'))
+        indexed = set(index['columns'])
+        # Text columns added after the index was built
+        text_columns = [col for col in text_columns if col not in indexed]
+        method = 'trigram'
+
+    conditions.extend(
+        sql.SQL('{}::text ILIKE %s').format(sql.Identifier(col)) for col in text_columns
+    )
+
+    condition = sql.SQL('({})').format(sql.SQL(' OR ').join(conditions))
+    return condition, [pattern] * len(conditions), method
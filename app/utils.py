@@ -1,117 +1,405 @@
 """
 Utility functions for Mishloach Manot System
 """
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from app.config import Config
+from app import schema_cache
+from app.db import get_connection, get_cursor
+from app.metrics import TimedTupleCursor
+from app.reports import report_source
+from app.search import build_search_condition
+from psycopg2 import sql
+import base64
+import codecs
 import csv
 import io
-
-def get_db_connection():
-    """Get database connection with RealDictCursor"""
-    return psycopg2.connect(Config.DATABASE_URL, cursor_factory=RealDictCursor)
+import json
 
 
 def execute_function(func_name, params=None):
     """Execute a PostgreSQL function"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        if params:
-            placeholders = ', '.join(['%s'] * len(params))
-            query = f"SELECT {func_name}({placeholders})"
-            cur.execute(query, params)
-        else:
-            cur.execute(f"SELECT {func_name}()")
-        
-        result = cur.fetchone()
-        conn.commit()
-        return result
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        cur.close()
-        conn.close()
-
-
-def get_table_data(table_name, limit=50, offset=0, search=None, order_by=None):
-    """Get paginated table data"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # Build query
-        query = f'SELECT * FROM {table_name}'
-        count_query = f'SELECT COUNT(*) as count FROM {table_name}'
-        params = []
+    with get_connection() as conn:
+        cur = conn.cursor()
         
-        # Add search if provided
-        if search:
-            # Get column names
-            cur.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table_name,))
-            columns = [row['column_name'] for row in cur.fetchall()]
-            
-            # Build WHERE clause for text columns
-            text_columns = []
-            cur.execute(f"""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name = %s 
-                AND data_type IN ('text', 'character varying', 'character')
-            """, (table_name,))
-            text_columns = [row['column_name'] for row in cur.fetchall()]
+        try:
+            if params:
+                placeholders = ', '.join(['%s'] * len(params))
+                query = f"SELECT {func_name}({placeholders})"
+                cur.execute(query, params)
+            else:
+                cur.execute(f"SELECT {func_name}()")
             
-            if text_columns:
-                where_clause = ' OR '.join([f"{col}::text ILIKE %s" for col in text_columns])
-                query += f" WHERE {where_clause}"
-                count_query += f" WHERE {where_clause}"
-                params = [f"%{search}%"] * len(text_columns)
-        
-        # Add order by
-        if order_by:
-            query += f" ORDER BY {order_by}"
-        
-        # Add pagination
-        query += " LIMIT %s OFFSET %s"
-        
-        # Get total count
-        if params:
-            cur.execute(count_query, params)
-        else:
-            cur.execute(count_query)
-        total = cur.fetchone()['count']
-        
-        # Get data
-        cur.execute(query, params + [limit, offset])
+            result = cur.fetchone()
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cur.close()
+
+
+# Tables estimated (pg_class.reltuples) above this size get an approximate count
+APPROX_COUNT_THRESHOLD = 10000
+
+
+def _relation_columns(cur, name, relkinds):
+    """Column names and types of a public relation of the given pg_class kinds"""
+    cur.execute("""
+        SELECT a.attname AS name, format_type(a.atttypid, a.atttypmod) AS type
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public'
+          AND c.relname = %s
+          AND c.relkind::text = ANY(%s)
+          AND a.attnum > 0
+          AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, (name, list(relkinds)))
+    return [(col['name'], col['type']) for col in cur.fetchall()]
+
+
+def get_table_columns(cur, table_name):
+    """Column names and types of a public table; ValueError if it does not exist"""
+    columns = _relation_columns(cur, table_name, ('r', 'p'))
+    if not columns:
+        raise ValueError(f"טבלה לא קיימת: {table_name}")
+    return columns
+
+
+def get_view_columns(cur, view_name):
+    """Column names and types of a public (materialized) view; ValueError if it does not exist"""
+    columns = _relation_columns(cur, view_name, ('v', 'm'))
+    if not columns:
+        raise ValueError(f"תצוגה לא קיימת: {view_name}")
+    return columns
+
+
+def get_primary_key(cur, table_name):
+    """Primary key column names of a public table (empty list if none)"""
+    cur.execute("""
+        SELECT a.attname AS name
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE n.nspname = 'public'
+          AND c.relname = %s
+          AND i.indisprimary
+        ORDER BY array_position(i.indkey::int2[], a.attnum)
+    """, (table_name,))
+    return [row['name'] for row in cur.fetchall()]
+
+
+def parse_order_by(order_by, column_names):
+    """Parse 'col', 'col desc' or '-col' into (column, descending)"""
+    if not order_by:
+        return None, False
+    value = order_by.strip()
+    descending = False
+    if value.startswith('-'):
+        value, descending = value[1:].strip(), True
+    else:
+        parts = value.rsplit(None, 1)
+        if len(parts) == 2 and parts[1].lower() in ('asc', 'desc'):
+            value, descending = parts[0], parts[1].lower() == 'desc'
+    if value not in column_names:
+        raise ValueError(f"עמודת מיון לא קיימת: {value}")
+    return value, descending
+
+
+def encode_cursor(order, values):
+    """Opaque page token: sort signature + key values of the boundary row"""
+    payload = json.dumps({'o': order, 'k': values}, default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token, order):
+    """Key values from a page token created for the same sort order"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("cursor לא תקין")
+    if not isinstance(payload, dict) or payload.get('o') != order or not isinstance(payload.get('k'), list):
+        raise ValueError("cursor לא תקין")
+    return payload['k']
+
+
+def _row_compare(columns, operator, values, types):
+    """(col1, col2, ...) <op> (%s::type1, %s::type2, ...)"""
+    return sql.SQL('({}) {} ({})').format(
+        sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+        sql.SQL(operator),
+        sql.SQL(', ').join(sql.SQL('%s::' + types[col]) for col in columns)
+    ), list(values)
+
+
+def _keyset_condition(sort_col, pk, values, types, descending, backwards):
+    """
+    WHERE condition for rows after (or, backwards, before) the cursor row.
+    The order is (sort_col NULLS LAST, pk...), so NULL sort values need their own branch.
+    """
+    forward_op = '<' if descending else '>'
+    op = {'>': '<', '<': '>'}[forward_op] if backwards else forward_op
+
+    if sort_col is None:
+        return _row_compare(pk, op, values, types)
+
+    sort_value, pk_values = values[0], values[1:]
+    col = sql.Identifier(sort_col)
+
+    if sort_value is None:
+        pk_cond, params = _row_compare(pk, op, pk_values, types)
+        if backwards:
+            return sql.SQL('({col} IS NOT NULL OR ({col} IS NULL AND {pk}))').format(col=col, pk=pk_cond), params
+        return sql.SQL('({col} IS NULL AND {pk})').format(col=col, pk=pk_cond), params
+
+    key_cond, params = _row_compare([sort_col] + pk, op, values, types)
+    if backwards:
+        return sql.SQL('({col} IS NOT NULL AND {key})').format(col=col, key=key_cond), params
+    return sql.SQL('(({col} IS NOT NULL AND {key}) OR {col} IS NULL)').format(col=col, key=key_cond), params
+
+
+def _order_clause(sort_col, pk, descending, backwards):
+    """ORDER BY sort_col NULLS LAST, pk... (fully reversed when paging backwards)"""
+    desc = descending != backwards
+    direction = sql.SQL('DESC' if desc else 'ASC')
+    items = []
+    if sort_col is not None:
+        nulls = sql.SQL('NULLS FIRST' if backwards else 'NULLS LAST')
+        items.append(sql.SQL('{} {} {}').format(sql.Identifier(sort_col), direction, nulls))
+    items.extend(sql.SQL('{} {}').format(sql.Identifier(col), direction) for col in pk)
+    return sql.SQL(' ORDER BY ') + sql.SQL(', ').join(items)
+
+
+def _table_count(cur, table_name, where, params, exact):
+    """(total, is_estimate); total is None for filtered estimates of large tables"""
+    if not exact:
+        cur.execute("""
+            SELECT c.reltuples::bigint AS estimate
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = %s
+        """, (table_name,))
+        estimate = cur.fetchone()['estimate']
+        # reltuples is -1 until the table has been vacuumed/analyzed
+        if estimate >= APPROX_COUNT_THRESHOLD:
+            return (None if where else estimate), True
+
+    query = sql.SQL('SELECT COUNT(*) AS count FROM {}').format(sql.Identifier(table_name))
+    if where:
+        query += sql.SQL(' WHERE ') + where
+    cur.execute(query, params)
+    return cur.fetchone()['count'], False
+
+
+def _filter_condition(filters, types):
+    """{column: value} -> AND of column = value (value cast to the column type)"""
+    if not filters:
+        return None, []
+    conditions = []
+    for col in filters:
+        if col not in types:
+            raise ValueError(f"עמודת סינון לא קיימת: {col}")
+        conditions.append(sql.SQL('{} = %s::' + types[col]).format(sql.Identifier(col)))
+    return sql.SQL(' AND ').join(conditions), list(filters.values())
+
+
+def _paginate(cur, relation, columns, key, limit, offset, where, params, order_by, cursor, before):
+    """
+    One page of a table or view
+
+    Relations with a unique key are paged by keyset: pass the returned
+    next_cursor / prev_cursor back as cursor / before. An explicit offset
+    (or a relation without a key) falls back to LIMIT/OFFSET.
+    """
+    types = dict(columns)
+    sort_col, descending = parse_order_by(order_by, [name for name, _ in columns])
+    if sort_col in key and len(key) == 1:
+        sort_col = None
+
+    query = sql.SQL('SELECT * FROM {}').format(sql.Identifier(relation))
+
+    if not key or offset:
+        if where:
+            query += sql.SQL(' WHERE ') + where
+        if sort_col or key:
+            query += _order_clause(sort_col, key, descending, False)
+        query += sql.SQL(' LIMIT %s OFFSET %s')
+        cur.execute(query, params + [limit + 1, offset])
         data = cur.fetchall()
-        
         return {
-            'data': data,
-            'total': total,
+            'data': data[:limit],
             'limit': limit,
-            'offset': offset
+            'offset': offset,
+            'pagination': 'offset',
+            'has_more': len(data) > limit,
+            'next_cursor': None,
+            'prev_cursor': None,
         }
-    finally:
-        cur.close()
-        conn.close()
 
+    key_columns = ([sort_col] if sort_col else []) + key
+    order = [sort_col, descending]
+    backwards = bool(before)
+    token = before or cursor
+
+    conditions = [where] if where else []
+    if token:
+        keyset_cond, keyset_params = _keyset_condition(
+            sort_col, key, decode_cursor(token, order), types, descending, backwards
+        )
+        conditions.append(keyset_cond)
+        params = params + keyset_params
+    if conditions:
+        query += sql.SQL(' WHERE ') + sql.SQL(' AND ').join(conditions)
+
+    query += _order_clause(sort_col, key, descending, backwards)
+    query += sql.SQL(' LIMIT %s')
+    cur.execute(query, params + [limit + 1])
+    data = cur.fetchall()
+
+    has_more = len(data) > limit
+    data = data[:limit]
+    if backwards:
+        data.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, bool(token)
+
+    def boundary(row):
+        return encode_cursor(order, [row[col] for col in key_columns])
+
+    return {
+        'data': data,
+        'limit': limit,
+        'offset': 0,
+        'pagination': 'keyset',
+        'has_more': has_next,
+        'next_cursor': boundary(data[-1]) if data and has_next else None,
+        'prev_cursor': boundary(data[0]) if data and has_prev else None,
+    }
+
+
+def _combine(*conditions):
+    """AND the (condition, params) pairs that are not None"""
+    parts = [(cond, params) for cond, params in conditions if cond is not None]
+    if not parts:
+        return None, []
+    return (sql.SQL(' AND ').join(cond for cond, _ in parts),
+            [p for _, params in parts for p in params])
+
+
+def _column_info(columns):
+    return [{'name': name, 'type': col_type} for name, col_type in columns]
+
+
+def get_table_data(table_name, limit=50, offset=0, search=None, order_by=None,
+                   cursor=None, before=None, exact_count=False, filters=None):
+    """
+    Get paginated table data
+
+    Tables are paged by their primary key (see _paginate). search matches
+    any text column (trigram index when the table has one); filters is a
+    {column: value} dict of exact matches.
+    """
+    meta = schema_cache.table_meta(table_name)
+    columns = meta['columns']
+
+    search_cond, search_params, search_method = None, [], None
+    if search:
+        search_cond, search_params, search_method = build_search_condition(
+            columns, search, meta['search_index']
+        )
+    where, params = _combine((search_cond, search_params),
+                             _filter_condition(filters, dict(columns)))
+
+    with get_cursor() as cur:
+        total, total_is_estimate = _table_count(cur, table_name, where, params, exact_count)
+        result = _paginate(cur, table_name, columns, meta['primary_key'], limit, offset,
+                           where, params, order_by, cursor, before)
+
+    result.update({
+        'columns': _column_info(columns),
+        'total': total,
+        'total_is_estimate': total_is_estimate,
+        'search_method': search_method,
+    })
+    return result
+
+
+# Unique, non-null columns of the larger report views - these views are paged
+# by keyset on them; other views fall back to LIMIT/OFFSET
+VIEW_KEYS = {
+    'v_orders_details': ['id'],
+    'v_orders_summary': ['sender_id', 'getter_id'],
+    'v_autoreturn_activity': ['order_id'],
+    'v_accounts_summary': ['sender_id'],
+    'v_families_balance': ['personid'],
+    'v_family_receipts': ['personid'],
+}
+
+# Default sort of paged views (the order the view itself defines)
+VIEW_DEFAULT_ORDER = {
+    'v_orders_details': '-order_date',
+    'v_accounts_summary': 'sender_name',
+    'v_family_receipts': 'lastname',
+}
+
+
+def _view_count(cur, view_name, where, params, exact):
+    """(total, is_estimate) - planner estimate unless the view is small or exact is asked"""
+    query = sql.SQL('SELECT 1 FROM {}').format(sql.Identifier(view_name))
+    if where:
+        query += sql.SQL(' WHERE ') + where
+
+    if not exact:
+        cur.execute(sql.SQL('EXPLAIN (FORMAT JSON) ') + query, params)
+        plan = cur.fetchone()['QUERY PLAN']
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate >= APPROX_COUNT_THRESHOLD:
+            return estimate, True
+
+    cur.execute(sql.SQL('SELECT COUNT(*) AS count FROM ({}) v').format(query), params)
+    return cur.fetchone()['count'], False
 
-def get_view_data(view_name, limit=None):
-    """Get data from a view"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        if limit:
-            cur.execute(f"SELECT * FROM {view_name} LIMIT %s", (limit,))
-        else:
-            cur.execute(f"SELECT * FROM {view_name}")
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+
+def get_view_data(view_name, limit=50, offset=0, search=None, order_by=None,
+                  cursor=None, before=None, exact_count=False, filters=None, live=False):
+    """
+    Get paginated view data - same parameters and response as get_table_data
+
+    Views listed in VIEW_KEYS are paged by keyset on those columns. The
+    total is the planner's estimate for large results (exact_count to count).
+    Reports with a materialized copy are read from it unless live=True;
+    source / refreshed_at in the response tell which one was used.
+    """
+    schema_cache.view_columns(view_name)  # ValueError for unknown views
+
+    with get_cursor() as cur:
+        relation, source, refreshed_at = report_source(cur, view_name, live)
+        columns = schema_cache.view_columns(relation)
+
+        search_cond, search_params, search_method = None, [], None
+        if search:
+            search_cond, search_params, search_method = build_search_condition(columns, search)
+        where, params = _combine((search_cond, search_params),
+                                 _filter_condition(filters, dict(columns)))
+
+        total, total_is_estimate = _view_count(cur, relation, where, params, exact_count)
+        result = _paginate(cur, relation, columns, VIEW_KEYS.get(view_name, []), limit, offset,
+                           where, params, order_by or VIEW_DEFAULT_ORDER.get(view_name),
+                           cursor, before)
+
+    result.update({
+        'columns': _column_info(columns),
+        'total': total,
+        'total_is_estimate': total_is_estimate,
+        'search_method': search_method,
+        'source': source,
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None,
+    })
+    return result
 
 
 def export_to_csv(data, columns):
@@ -123,86 +411,62 @@ def export_to_csv(data, columns):
     return output.getvalue()
 
 
+# Rows fetched per round trip when streaming an export
+EXPORT_BATCH_SIZE = 2000
+
+
+def stream_view_csv(view_name, batch_size=EXPORT_BATCH_SIZE, live=False):
+    """
+    Generator of UTF-8 CSV chunks (BOM + header first) for a whole view
+
+    Rows come from a server-side cursor batch_size at a time, so memory stays
+    flat however big the view is. Reports with a materialized copy are read
+    from it unless live=True. Yields nothing when the view is empty;
+    ValueError if the view does not exist.
+    """
+    if view_name not in {view['name'] for view in schema_cache.views()}:
+        raise ValueError(f"תצוגה לא קיימת: {view_name}")
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            relation, _, _ = report_source(cur, view_name, live)
+        # Named (server-side) cursor returning plain tuples
+        with conn.cursor(name='export_view', cursor_factory=TimedTupleCursor) as cur:
+            cur.itersize = batch_size
+            cur.execute(sql.SQL('SELECT * FROM {}').format(sql.Identifier(relation)))
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow([col[0] for col in cur.description])
+            prefix = codecs.BOM_UTF8
+
+            while rows:
+                writer.writerows(rows)
+                yield prefix + output.getvalue().encode('utf-8')
+                prefix = b''
+                output.seek(0)
+                output.truncate()
+                rows = cur.fetchmany(batch_size)
+
+
 def get_function_parameters(func_name):
-    """Get parameters for a PostgreSQL function"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT 
-                p.parameter_name,
-                p.data_type,
-                p.parameter_default
-            FROM information_schema.parameters p
-            WHERE p.specific_schema = 'public'
-            AND p.specific_name IN (
-                SELECT specific_name 
-                FROM information_schema.routines 
-                WHERE routine_name = %s
-                AND routine_schema = 'public'
-            )
-            AND p.parameter_mode = 'IN'
-            ORDER BY p.ordinal_position
-        """, (func_name,))
-        
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    """Get parameters for a PostgreSQL function (cached, see app.schema_cache)"""
+    return schema_cache.function_parameters(func_name)
 
 
 def get_all_functions():
-    """Get list of all public functions"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT routine_name as name
-            FROM information_schema.routines
-            WHERE routine_schema = 'public'
-            AND routine_type = 'FUNCTION'
-            ORDER BY routine_name
-        """)
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    """Get list of all public functions (cached)"""
+    return schema_cache.functions()
 
 
 def get_all_views():
-    """Get list of all views"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT table_name as name
-            FROM information_schema.views
-            WHERE table_schema = 'public'
-            ORDER BY table_name
-        """)
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    """Get list of all views (cached)"""
+    return schema_cache.views()
 
 
 def get_all_tables():
-    """Get list of all tables"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
-            SELECT table_name as name
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            AND table_type = 'BASE TABLE'
-            ORDER BY table_name
-        """)
-        return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
+    """Get list of all tables (cached)"""
+    return schema_cache.tables()
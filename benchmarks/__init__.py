@@ -0,0 +1,12 @@
+"""
+Performance benchmarks for the Mishloach Manot ETL
+מדידות ביצועים
+
+Each benchmark runs against the server in Config.DATABASE_URL and leaves
+its data untouched: the single-stage benchmarks roll back everything they
+create, bench_etl works in a scratch database it creates and drops, e.g.:
+
+    python -m benchmarks.bench_autoreturn --orders 50000
+    python -m benchmarks.bench_etl --households 1000 10000 100000
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
@@ -0,0 +1,129 @@
+"""
+Benchmark: row-level vs statement-level autoreturn trigger
+השוואת טריגר autoreturn לכל שורה מול טריגר ברמת פקודה
+
+Creates synthetic residents and outer orders, runs distribute_all_outer_orders()
+once with each trigger variant and rolls everything back.
+
+Usage:
+    python -m benchmarks.bench_autoreturn [--orders 50000] [--invitees 10]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+
+
+# The trigger as it was defined in 02_fixes.sql (one apply_autoreturn_from_outer per order)
+ROW_TRIGGER_SQL = """
+    CREATE OR REPLACE FUNCTION pg_temp.trigger_autoreturn_row() RETURNS TRIGGER AS $$
+    BEGIN
+        IF NEW.origin_type != 'autoreturn' THEN
+            PERFORM public.apply_autoreturn_from_outer(NEW.id);
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS after_order_insert ON public."Order";
+    CREATE TRIGGER after_order_insert
+        AFTER INSERT ON public."Order"
+        FOR EACH ROW
+        EXECUTE FUNCTION pg_temp.trigger_autoreturn_row();
+"""
+
+
+def seed(cur, orders, invitees_per_order):
+    """Create residents and waiting outer orders for one run"""
+    people = max(invitees_per_order * 2, orders // invitees_per_order)
+
+    # Keep existing waiting rows out of the measurement
+    cur.execute("UPDATE outerapporder SET status = 'bench_hold' WHERE status = 'waiting'")
+
+    cur.execute("SELECT COALESCE(MAX(code), 0) FROM person")
+    base_code = cur.fetchone()[0] + 1
+
+    cur.execute("""
+        INSERT INTO person (code, lastname, father_name, buildingnumber,
+                            apartmentnumber, phone, autoreturn)
+        SELECT %s + g, 'בנצ''מרק', 'אב', 'b' || g, '1', '02' || (5000000 + g), g %% 2 = 0
+        FROM generate_series(0, %s - 1) g
+        RETURNING personid
+    """, (base_code, people))
+    ids = [row[0] for row in cur.fetchall()]
+
+    cur.execute("""
+        INSERT INTO outerapporder (sender_code, invitees, package_size)
+        SELECT (%s + (o %% %s))::text,
+               (SELECT string_agg(
+                           ((%s::int[])[1 + ((o * %s + i) %% %s)])::text, '|')
+                FROM generate_series(1, %s) i),
+               'S'
+        FROM generate_series(0, %s - 1) o
+    """, (base_code, people, ids, invitees_per_order, people, invitees_per_order,
+          orders // invitees_per_order))
+
+
+def run_variant(conn, variant, orders, invitees_per_order):
+    """Run one distribution inside a transaction that is rolled back"""
+    cur = conn.cursor()
+    try:
+        if variant == 'row':
+            cur.execute(ROW_TRIGGER_SQL)
+        seed(cur, orders, invitees_per_order)
+
+        cur.execute('SELECT COALESCE(MAX(id), 0) FROM "Order"')
+        last_order_id = cur.fetchone()[0]
+
+        started = time.perf_counter()
+        cur.execute("SELECT distribute_all_outer_orders()")
+        distributed = cur.fetchone()[0]
+        seconds = time.perf_counter() - started
+
+        cur.execute(
+            """SELECT COUNT(*) FROM "Order" WHERE id > %s AND origin_type = 'autoreturn'""",
+            (last_order_id,)
+        )
+        autoreturns = cur.fetchone()[0]
+
+        return {
+            'variant': variant,
+            'orders': distributed,
+            'autoreturn_orders': autoreturns,
+            'seconds': round(seconds, 3),
+        }
+    finally:
+        conn.rollback()
+        cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=50000, help='orders to distribute')
+    parser.add_argument('--invitees', type=int, default=10, help='invitees per outer order')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(Config.DATABASE_URL)
+    try:
+        results = [run_variant(conn, variant, args.orders, args.invitees)
+                   for variant in ('row', 'statement')]
+    finally:
+        conn.close()
+
+    for r in results:
+        print(f"{r['variant']:>9}: {r['orders']} orders, {r['autoreturn_orders']} autoreturn "
+              f"in {r['seconds']:.2f}s")
+    if results[1]['seconds'] > 0:
+        print(f"speedup: {results[0]['seconds'] / results[1]['seconds']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Benchmark: the residents / orders ETL end to end at several city sizes
+מדידת זמני ה-ETL מקצה לקצה לפי גודל עיר
+
+For every size a scratch database (<database>_bench) is created from
+migrations/*.sql and emptied of the seed households, a synthetic city is
+generated (benchmarks/synthetic.py) and each stage is timed with the same
+code the upload jobs run:
+
+    parse_residents       file → mapped + cleaned chunks (app/ingest, app/cleaning)
+    raw_load              chunks → raw_residents_csv (COPY)
+    raw_to_temp_stage     SQL
+    process_residents_csv SQL
+    parse_orders          file → outerapporder rows
+    load_orders           rows → outerapporder (execute_values, duplicates skipped by row_hash)
+    distribute            distribute_all_outer_orders()
+    autoreturn            the autoreturn trigger's share of distribute
+    report_views          refresh_report_views()
+
+The scratch database is dropped afterwards (--keep leaves it). Results are
+written as JSON (benchmarks/results/) for benchmarks/compare.py.
+
+Usage:
+    python -m benchmarks.bench_etl [--households 1000 10000 100000] [--out results.json]
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import psycopg2
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bulk_load import load_raw_residents
+from app.cleaning import clean_resident_values, map_resident_columns
+from app.config import Config
+from app.ingest import iter_upload_chunks
+from app.pipelines import insert_outer_orders, outer_order_rows
+from benchmarks.synthetic import STREETS, generate_city
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def scratch_dsns(database_url):
+    """(maintenance DSN, scratch DSN, scratch database name) next to database_url"""
+    params = psycopg2.extensions.parse_dsn(database_url)
+    name = f"{params.get('dbname', 'postgres')}_bench"
+    admin = psycopg2.extensions.make_dsn(**{**params, 'dbname': 'postgres'})
+    scratch = psycopg2.extensions.make_dsn(**{**params, 'dbname': name})
+    return admin, scratch, name
+
+
+def create_scratch_database(admin_dsn, name):
+    """Fresh database with every migration applied"""
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    try:
+        cur = admin.cursor()
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        cur.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        admin.close()
+
+
+def drop_scratch_database(admin_dsn, name):
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    try:
+        admin.cursor().execute(f'DROP DATABASE IF EXISTS "{name}"')
+    finally:
+        admin.close()
+
+
+def apply_migrations(conn):
+    for path in sorted(glob.glob(os.path.join(ROOT, 'migrations', '*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            conn.cursor().execute(f.read())
+        conn.commit()
+
+
+def prepare_city(conn):
+    """
+    Empty city with the synthetic streets registered (untimed setup)
+
+    The seed migration's sample households have no code and sit on low
+    building / apartment numbers, and its streets were inserted with explicit
+    codes, so raw_to_temp_stage's nextval() can collide with them and file
+    rows fall back to street 999, matching each other by address.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        TRUNCATE payment_ledger, person_order_stats, "Order", person, outerapporder
+        RESTART IDENTITY CASCADE
+    """)
+    cur.execute("""
+        INSERT INTO street (streetcode, streetname)
+        SELECT (SELECT COALESCE(MAX(streetcode), 0) FROM street WHERE streetcode < 999) + u.n, u.name
+        FROM unnest(%s::text[]) WITH ORDINALITY AS u(name, n)
+        WHERE NOT EXISTS (SELECT 1 FROM street s WHERE LOWER(TRIM(s.streetname)) = u.name)
+    """, ([name for name, _ in STREETS],))
+    conn.commit()
+    cur.close()
+
+
+class StageTimer:
+    """Collects {stage: {seconds, rows, rows_per_sec}} in run order"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, seconds, rows):
+        self.stages[name] = {
+            'seconds': round(seconds, 4),
+            'rows': rows,
+            'rows_per_sec': round(rows / seconds) if seconds > 0 else None,
+        }
+        print(f"   {name:<22} {seconds:8.3f}s  {rows:>8} rows")
+
+    def run(self, name, func, *args, rows=None):
+        """Time func(*args); rows is a count or a function of func's result"""
+        started = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - started
+        count = rows(result) if callable(rows) else rows
+        self.record(name, seconds, count if count is not None else 0)
+        return result
+
+
+def scalar(conn, sql, params=None, commit=True):
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    value = cur.fetchone()[0]
+    cur.close()
+    if commit:
+        conn.commit()
+    return value
+
+
+def read_resident_chunks(path):
+    chunks = []
+    for df in iter_upload_chunks(path):
+        map_resident_columns(df)
+        clean_resident_values(df)
+        chunks.append(df)
+    return chunks
+
+
+def read_order_rows(path):
+    rows = []
+    for df in iter_upload_chunks(path):
+        rows.extend(outer_order_rows(df))
+    return rows
+
+
+def load_orders(conn, rows):
+    cur = conn.cursor()
+    inserted = insert_outer_orders(cur, rows)
+    conn.commit()
+    cur.close()
+    return inserted
+
+
+def distribute(conn, timer):
+    """distribute_all_outer_orders(), with the autoreturn trigger timed from pg_stat_xact_user_functions"""
+    cur = conn.cursor()
+    try:
+        cur.execute("SET track_functions = 'pl'")
+    except psycopg2.Error:
+        # Only superusers may change track_functions
+        conn.rollback()
+
+    started = time.perf_counter()
+    cur.execute("SELECT distribute_all_outer_orders()")
+    distributed = cur.fetchone()[0]
+    seconds = time.perf_counter() - started
+
+    cur.execute("""
+        SELECT COALESCE(SUM(total_time), 0) / 1000.0
+        FROM pg_stat_xact_user_functions
+        WHERE funcname = 'trigger_autoreturn_batch'
+    """)
+    autoreturn_seconds = float(cur.fetchone()[0])
+    cur.execute("""SELECT COUNT(*) FROM "Order" WHERE origin_type = 'autoreturn'""")
+    autoreturn_orders = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+
+    timer.record('distribute', seconds, distributed)
+    timer.record('autoreturn', autoreturn_seconds, autoreturn_orders)
+
+
+def run_size(admin_dsn, scratch_dsn, name, households, args):
+    """Create the scratch database, run every stage for one city size"""
+    print(f"🏙️  {households} households")
+    create_scratch_database(admin_dsn, name)
+    conn = psycopg2.connect(scratch_dsn)
+    timer = StageTimer()
+    try:
+        apply_migrations(conn)
+        prepare_city(conn)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            started = time.perf_counter()
+            city = generate_city(tmp, households, seed=args.seed, order_share=args.order_share)
+            generate_seconds = time.perf_counter() - started
+
+            # Residents
+            chunks = timer.run('parse_residents', lambda: read_resident_chunks(city['residents_path']),
+                               rows=lambda chunks: sum(len(df) for df in chunks))
+            timer.run('raw_load', load_raw_residents, conn, chunks,
+                      rows=lambda stats: stats['rows'])
+            timer.run('raw_to_temp_stage', lambda: scalar(conn, "SELECT raw_to_temp_stage()"),
+                      rows=lambda count: count)
+            timer.run('process_residents_csv', lambda: scalar(conn, "SELECT process_residents_csv()"),
+                      rows=lambda count: count)
+            del chunks
+
+            # Residents files have no autoreturn column; flag a share of people (untimed)
+            scalar(conn, """
+                WITH flagged AS (
+                    UPDATE person SET autoreturn = (hashtext(personid::text) & 1023) < %s
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM flagged
+            """, (round(args.autoreturn_share * 1024),))
+
+            # Orders
+            rows = timer.run('parse_orders', lambda: read_order_rows(city['orders_path']), rows=len)
+            timer.run('load_orders', load_orders, conn, rows, rows=lambda count: count)
+            del rows
+            distribute(conn, timer)
+
+            # Reports
+            cur = conn.cursor()
+            timer.run('report_views', lambda: cur.execute(
+                "SELECT * FROM refresh_report_views(NULL, true)") or cur.fetchall(),
+                rows=lambda refreshed: sum(row[2] for row in refreshed))
+            conn.commit()
+            cur.close()
+
+            persons = scalar(conn, "SELECT COUNT(*) FROM person")
+    finally:
+        conn.close()
+        if not args.keep:
+            drop_scratch_database(admin_dsn, name)
+
+    total = sum(stage['seconds'] for key, stage in timer.stages.items() if key != 'autoreturn')
+    print(f"   {'total':<22} {total:8.3f}s")
+    return {
+        'households': households,
+        'resident_rows': city['resident_rows'],
+        'order_rows': city['order_rows'],
+        'invitations': city['invitations'],
+        'persons': persons,
+        'generate_seconds': round(generate_seconds, 3),
+        'total_seconds': round(total, 4),
+        'stages': timer.stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_version(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        return scalar(conn, "SHOW server_version")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--households', type=int, nargs='+', default=[1000, 10000],
+                        help='city sizes to run (e.g. 1000 10000 100000)')
+    parser.add_argument('--seed', type=int, default=1, help='synthetic data seed')
+    parser.add_argument('--order-share', type=float, default=0.4,
+                        help='share of households that send an order')
+    parser.add_argument('--autoreturn-share', type=float, default=0.3,
+                        help='share of people flagged autoreturn before distribution')
+    parser.add_argument('--database-url', default=Config.DATABASE_URL,
+                        help='server to use; the scratch database is created next to this one')
+    parser.add_argument('--out', help='results file (default: benchmarks/results/etl-<time>-<commit>.json)')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+    args = parser.parse_args()
+
+    admin_dsn, scratch_dsn, name = scratch_dsns(args.database_url)
+    runs = [run_size(admin_dsn, scratch_dsn, name, households, args)
+            for households in args.households]
+
+    commit = git_commit()
+    result = {
+        'benchmark': 'etl',
+        'commit': commit,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'postgres': server_version(admin_dsn),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'order_share': args.order_share,
+        'autoreturn_share': args.autoreturn_share,
+        'runs': runs,
+    }
+
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        out = os.path.join(RESULTS_DIR, f"etl-{stamp}-{commit or 'nogit'}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"📄 {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Compare two benchmark result files
+השוואת תוצאות מדידה בין שני commits
+
+Prints every stage of every city size found in both files with the change
+in seconds, and exits with status 1 when a stage got slower than the
+threshold (so it can gate CI).
+
+Usage:
+    python -m benchmarks.compare OLD.json NEW.json [--threshold 0.2] [--min-seconds 0.05]
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(old, new, threshold=0.2, min_seconds=0.05):
+    """
+    Stage-by-stage comparison of two bench_etl results
+
+    Stages faster than min_seconds in both runs are never regressions
+    (timer noise dominates there).
+
+    Returns:
+        list: dicts (households, stage, old, new, change, regression)
+    """
+    old_runs = {run['households']: run for run in old['runs']}
+    rows = []
+    for run in new['runs']:
+        before = old_runs.get(run['households'])
+        if before is None:
+            continue
+        for stage, timing in run['stages'].items():
+            if stage not in before['stages']:
+                continue
+            old_s = before['stages'][stage]['seconds']
+            new_s = timing['seconds']
+            change = (new_s - old_s) / old_s if old_s > 0 else None
+            rows.append({
+                'households': run['households'],
+                'stage': stage,
+                'old': old_s,
+                'new': new_s,
+                'change': change,
+                'regression': (change is not None and change > threshold
+                               and max(old_s, new_s) >= min_seconds),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('old', help='baseline results (JSON)')
+    parser.add_argument('new', help='results to check (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='slowdown that counts as a regression (0.2 = 20%%)')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='ignore stages faster than this in both runs')
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{old.get('commit')} → {new.get('commit')}")
+
+    rows = compare(old, new, args.threshold, args.min_seconds)
+    for r in rows:
+        change = f"{r['change']:+.0%}" if r['change'] is not None else 'n/a'
+        flag = ' ⚠️ regression' if r['regression'] else ''
+        print(f"{r['households']:>8} {r['stage']:<22} {r['old']:8.3f}s → {r['new']:8.3f}s {change:>6}{flag}")
+
+    if any(r['regression'] for r in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Synthetic city data for benchmarks
+נתוני עיר סינתטיים למדידות ביצועים
+
+Writes a residents file shaped like the codes export in exel/ and an orders
+file shaped like the ordering app export (pipe-separated guest_list), with
+the same kinds of mess: "אין" instead of empty cells, phones with and
+without area code / dashes / +972, duplicated households typed twice.
+The same seed always gives the same files.
+
+Usage:
+    python -m benchmarks.synthetic --households 10000 --out /tmp/city
+"""
+
+import argparse
+import csv
+import os
+import random
+
+LASTNAMES = [
+    'כהן', 'לוי', 'מזרחי', 'פרץ', 'ביטון', 'דהן', 'אברהם', 'פרידמן', 'אזולאי', 'מלכה',
+    'כץ', 'גולדברג', 'שפירא', 'רוזנברג', 'וייס', 'קלאר', 'זיסקינד', 'פייביש', 'סילברסטון',
+    'הורוביץ', 'ברגר', 'שטרן', 'גרינברג', 'לנדאו', 'קפלן', 'רבינוביץ', 'טייטלבוים', 'הלפרין',
+    'אדלר', 'גוטמן', 'ויזל', 'פישר', 'שוורץ', 'בלום', 'רוטנברג', 'קליין', 'גלבר', 'אייזנברג',
+]
+
+FATHER_NAMES = [
+    'אברהם', 'יצחק', 'יעקב', 'משה', 'אהרן', 'דוד', 'שלמה', 'מרדכי', 'יוסף', 'שמואל',
+    'ישראל', 'חיים', 'מנחם', 'ברק', 'אליהו', 'נחום', 'בנימין', 'צבי', 'אריה', 'שמעון',
+]
+
+MOTHER_NAMES = [
+    'שרה', 'רבקה', 'רחל', 'לאה', 'חנה', 'אסתר', 'מרים', 'בתיה', 'אביטל', 'חני',
+    'יהודית', 'דבורה', 'שושנה', 'גיטי', 'פייגי', 'רייזי', 'נחמה', 'טובה', 'צביה', 'מלכה',
+]
+
+# Apartments per building; addresses are handed out in order so each
+# household has its own (street, building, apartment) like in a real city
+APARTMENTS_PER_BUILDING = 16
+
+# Weighted like the real codes file: a few long streets hold most households
+STREETS = [
+    ('נחל קישון', 22), ('נחל אוריה', 15), ('נחל שורק', 15), ('נחל מיכה', 14),
+    ('נחל שחם', 5), ('נחל צאילים', 5), ('ערבות הנחל', 5), ('נחל ניצנים', 4),
+    ('הרב מנחם פרוש', 3), ('לורנץ', 3), ('נחל ערוגות', 3), ('נחל זוהר', 2),
+    ('באר שבע', 2), ('נחל לכיש', 1), ('נחל קטלב', 1),
+]
+
+RESIDENT_HEADER = ['code', 'lastname', 'father_name', 'mother_name', 'streetname',
+                   'buildingnumber', 'entrance', 'apartmentnumber', 'phone', 'mobile',
+                   'mobile2', 'email', 'standing_order']
+
+# The ordering app export, with its stray spaces in the header
+ORDER_HEADER = ['id', ' created_at', 'updated_at', 'station_name', ' last_name',
+                'father_first_name', 'mother_first_name', 'mobile', 'home_phone', ' rating',
+                'street', 'building_number', 'apartment_number', 'resend_flag',
+                'order_code', 'guest_list', 'total_amount', 'payment_method']
+
+RATINGS = [('1', 21), ('2', 48), ('3', 16), ('אין דירוג', 15)]
+
+
+class CityGenerator:
+    """Households of one synthetic city (deterministic for a seed)"""
+
+    def __init__(self, households, seed=1):
+        self.households = households
+        self.rng = random.Random(seed)
+        self.streets = [name for name, _ in STREETS]
+        self.street_weights = [weight for _, weight in STREETS]
+        self.street_fill = {name: 0 for name in self.streets}
+
+    def _pick(self, pairs):
+        values, weights = zip(*pairs)
+        return self.rng.choices(values, weights)[0]
+
+    def landline(self, number):
+        """Local number typed with or without area code / dash"""
+        style = self.rng.random()
+        if style < 0.55:
+            return number
+        if style < 0.8:
+            return f'02-{number}'
+        return f'02{number}'
+
+    def mobile(self, number):
+        """Mobile number in one of the formats seen in uploads"""
+        prefix = self.rng.choice(['050', '052', '053', '054', '055', '058'])
+        style = self.rng.random()
+        if style < 0.6:
+            return f'{prefix}-{number}'
+        if style < 0.8:
+            return f'{prefix}{number}'
+        if style < 0.9:
+            return f'+972-{prefix[1:]}-{number}'
+        return f'{prefix} {number[:3]} {number[3:]}'
+
+    def address(self):
+        """Next free (street, building, apartment) on a weighted street"""
+        street = self.rng.choices(self.streets, self.street_weights)[0]
+        n = self.street_fill[street]
+        self.street_fill[street] += 1
+        return street, n // APARTMENTS_PER_BUILDING + 1, n % APARTMENTS_PER_BUILDING + 1
+
+    def household(self, code):
+        rng = self.rng
+        lastname = rng.choice(LASTNAMES)
+        street, building, apartment = self.address()
+        number = f'{9900000 + code % 100000}'
+        cell = f'{rng.randint(1000000, 9999999)}'
+        return {
+            'code': str(code),
+            'lastname': lastname,
+            'father_name': rng.choice(FATHER_NAMES),
+            'mother_name': rng.choice(MOTHER_NAMES) if rng.random() < 0.9 else 'אין',
+            'streetname': street,
+            'buildingnumber': str(building),
+            'entrance': rng.choice('אבג') if rng.random() < 0.07 else 'אין',
+            # A few rows lack the apartment (rejected by process_residents_csv)
+            'apartmentnumber': str(apartment) if rng.random() < 0.99 else 'אין',
+            'phone': self.landline(number) if rng.random() < 0.85 else rng.choice(['אין', '']),
+            'mobile': self.mobile(cell) if rng.random() < 0.6 else 'אין',
+            'mobile2': self.mobile(f'{rng.randint(1000000, 9999999)}') if rng.random() < 0.05 else 'אין',
+            'email': rng.choice([f'a{cell}@gmail.com', f'Y{cell}@Gmail.com ']) if rng.random() < 0.3 else 'אין',
+            'standing_order': self._pick([('0', 65), ('1', 15), ('2', 17), ('3', 3)]),
+        }
+
+    def residents(self, duplicate_share=0.02):
+        """Household dicts; some households appear twice with a different phone format"""
+        rows = []
+        for code in range(1, self.households + 1):
+            row = self.household(code)
+            rows.append(row)
+            if self.rng.random() < duplicate_share and row['phone'] not in ('אין', ''):
+                twin = dict(row)
+                twin['phone'] = twin['phone'].replace('-', '')
+                twin['mobile'] = 'אין'
+                rows.append(twin)
+        return rows
+
+    def orders(self, residents, order_share=0.4, max_guests=111):
+        """App export rows: ~order_share of households order for a guest list of codes"""
+        rng = self.rng
+        codes = [int(r['code']) for r in residents]
+        by_code = {int(r['code']): r for r in residents}
+        rows = []
+        senders = rng.sample(sorted(by_code), int(len(by_code) * order_share))
+        for order_id, sender in enumerate(senders, start=1000000):
+            # Guest list length like the real export: median ~11, long tail
+            guests = min(max_guests, max(1, int(rng.expovariate(1 / 17))))
+            guest_codes = {rng.choice(codes) for _ in range(guests)} - {sender}
+            if not guest_codes:
+                continue
+            person = by_code[sender]
+            rows.append({
+                'id': str(order_id),
+                ' created_at': f'{rng.randint(1, 28):02d}/03/2024 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}',
+                'updated_at': '',
+                'station_name': '',
+                ' last_name': person['lastname'],
+                'father_first_name': person['father_name'],
+                'mother_first_name': person['mother_name'],
+                'mobile': person['mobile'],
+                'home_phone': person['phone'],
+                ' rating': self._pick(RATINGS),
+                'street': person['streetname'],
+                'building_number': person['buildingnumber'],
+                'apartment_number': person['apartmentnumber'],
+                'resend_flag': '0',
+                'order_code': str(sender),
+                'guest_list': '|'.join(str(c) for c in sorted(guest_codes)),
+                'total_amount': str(len(guest_codes) * rng.choice([10, 12, 15])),
+                'payment_method': rng.choice(['', 'credit', 'nedarim']),
+            })
+        return rows
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def generate_city(directory, households, seed=1, order_share=0.4):
+    """
+    Write residents.csv and orders.csv for a synthetic city
+
+    Returns:
+        dict: paths and row counts of both files
+    """
+    os.makedirs(directory, exist_ok=True)
+    city = CityGenerator(households, seed)
+    residents = city.residents()
+    orders = city.orders(residents, order_share)
+
+    residents_path = os.path.join(directory, 'residents.csv')
+    orders_path = os.path.join(directory, 'orders.csv')
+    write_csv(residents_path, RESIDENT_HEADER, residents)
+    write_csv(orders_path, ORDER_HEADER, orders)
+
+    return {
+        'residents_path': residents_path,
+        'orders_path': orders_path,
+        'resident_rows': len(residents),
+        'order_rows': len(orders),
+        'invitations': sum(row['guest_list'].count('|') + 1 for row in orders),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--households', type=int, default=10000, help='households in the city')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--out', default='.', help='directory for residents.csv / orders.csv')
+    args = parser.parse_args()
+
+    city = generate_city(args.out, args.households, args.seed)
+    print(f"{city['resident_rows']} residents → {city['residents_path']}")
+    print(f"{city['order_rows']} orders ({city['invitations']} invitations) → {city['orders_path']}")
+
+
+if __name__ == '__main__':
+    main()
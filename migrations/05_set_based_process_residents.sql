@@ -0,0 +1,302 @@
+-- ========================================
+-- 05_set_based_process_residents.sql
+-- עיבוד תושבים מבוסס-קבוצות (set-based) במקום לולאה שורה-שורה
+-- ========================================
+
+-- ====================
+-- מפתחות התאמה מנורמלים לכל תושב
+-- ====================
+
+-- process_residents_csv משווה שמות, כתובת וטלפונים מנורמלים.
+-- ה-view מרכז את הנרמול במקום אחד כדי שההשוואה תתבצע ב-join אחד לכל סוג התאמה
+-- במקום סריקה של person (והרצת format_il_phone) עבור כל שורה ב-temp.
+CREATE OR REPLACE VIEW public.person_match_keys AS
+SELECT
+    p.personid,
+    p.code,
+    LOWER(TRIM(p.lastname))          AS lastname_key,
+    LOWER(TRIM(p.father_name))       AS father_key,
+    format_il_phone(p.phone)         AS phone_norm,
+    format_il_phone(p.mobile)        AS mobile_norm,
+    format_il_phone(p.mobile2)       AS mobile2_norm,
+    COALESCE(p.streetcode, 0)        AS street_key,
+    COALESCE(p.buildingnumber, '')   AS building_key,
+    COALESCE(p.apartmentnumber, '')  AS apartment_key
+FROM public.person p;
+
+ALTER VIEW public.person_match_keys OWNER TO postgres;
+
+
+-- ====================
+-- process_residents_csv – גרסה מבוססת-קבוצות
+-- ====================
+
+-- הסטטוסים זהים לגרסה הקודמת (אוחד / התאמה חלקית / נדחה / הופץ) וכך גם
+-- הרשומות ב-person_archive.
+--
+-- בגרסה הקודמת כל שורה "ראתה" את התושבים שנוספו או עודכנו על ידי השורות
+-- שלפניה. כדי לשמור על אותה התנהגות העיבוד מתבצע בסבבים: כל סבב מסווג
+-- ומחיל יחד את כל השורות עד השורה הראשונה שתלויה בשורה מוקדמת יותר
+-- בקובץ (תושב חדש עם טלפון/כתובת/קוד זהים, איחוד שמחליף mobile2, או
+-- עדכון תושב קיים לפי code). השורה התלויה פותחת את הסבב הבא.
+-- מספר הסבבים = 1 + מספר התלויות בתוך הקובץ, ולא מספר השורות.
+DROP FUNCTION IF EXISTS public.process_residents_csv();
+
+CREATE FUNCTION public.process_residents_csv() RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_round INTEGER := 0;
+    v_classified INTEGER;
+    rows_processed INTEGER;
+BEGIN
+    ------------------------------------------------------------------
+    -- שלב 1: שורות ממתינות + מפתחות מנורמלים (format_il_phone פעם אחת לשורה)
+    ------------------------------------------------------------------
+    DROP TABLE IF EXISTS pg_temp.prc_rows;
+
+    CREATE TEMP TABLE prc_rows ON COMMIT DROP AS
+    SELECT
+        t.temp_id, t.code, t.lastname, t.father_name, t.mother_name,
+        t.streetcode, t.buildingnumber, t.entrance, t.apartmentnumber,
+        t.email, t.standing_order,
+        format_il_phone(t.phone)         AS clean_phone,
+        format_il_phone(t.mobile)        AS clean_mobile,
+        format_il_phone(t.mobile2)       AS clean_mobile2,
+        LOWER(TRIM(t.lastname))          AS lastname_key,
+        LOWER(TRIM(t.father_name))       AS father_key,
+        COALESCE(t.streetcode, 0)        AS street_key,
+        COALESCE(t.buildingnumber, '')   AS building_key,
+        COALESCE(t.apartmentnumber, '')  AS apartment_key,
+        -- דרישות חובה: lastname, father_name, streetname, buildingnumber, apartmentnumber
+        concat_ws(', ',
+            CASE WHEN t.lastname IS NULL OR TRIM(t.lastname) = '' THEN 'שם משפחה' END,
+            CASE WHEN t.father_name IS NULL OR TRIM(t.father_name) = '' THEN 'שם פרטי' END,
+            CASE WHEN t.streetname IS NULL OR TRIM(t.streetname) = '' THEN 'רחוב' END,
+            CASE WHEN t.buildingnumber IS NULL OR TRIM(t.buildingnumber) = '' THEN 'מספר בניין' END,
+            CASE WHEN t.apartmentnumber IS NULL OR TRIM(t.apartmentnumber) = '' THEN 'מספר דירה' END
+        )                                AS missing_fields,
+        NULL::TEXT                       AS result,
+        NULL::INTEGER                    AS personid_target,
+        NULL::INTEGER                    AS new_personid,
+        NULL::INTEGER                    AS round_no
+    FROM public.temp_residents_csv t
+    WHERE t.status IS NULL OR t.status = '' OR t.status = 'ממתין';
+
+    GET DIAGNOSTICS rows_processed = ROW_COUNT;
+    ANALYZE prc_rows;
+
+    ------------------------------------------------------------------
+    -- שלב 2: סבבי סיווג
+    ------------------------------------------------------------------
+    LOOP
+        v_round := v_round + 1;
+
+        WITH pending AS (
+            SELECT * FROM prc_rows WHERE result IS NULL
+        ),
+        -- 🔍 התאמה מלאה: שם + כתובת + אחד הטלפונים
+        full_match AS (
+            SELECT r.temp_id, MIN(k.personid) AS personid
+            FROM pending r
+            JOIN public.person_match_keys k
+              ON k.lastname_key = r.lastname_key
+             AND k.father_key = r.father_key
+             AND k.street_key = r.street_key
+             AND k.building_key = r.building_key
+             AND k.apartment_key = r.apartment_key
+            WHERE k.phone_norm = r.clean_phone
+               OR k.mobile_norm = r.clean_mobile
+               OR k.mobile2_norm = r.clean_mobile2
+            GROUP BY r.temp_id
+        ),
+        -- 🔍 התאמה חלקית: טלפון או כתובת
+        partial_match AS (
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.phone_norm = r.clean_phone
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.mobile_norm = r.clean_mobile
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.mobile2_norm = r.clean_mobile2
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k
+              ON k.street_key = r.street_key
+             AND k.building_key = r.building_key
+             AND k.apartment_key = r.apartment_key
+        ),
+        classified AS (
+            SELECT
+                r.*,
+                fm.personid AS full_personid,
+                (fm.personid IS NOT NULL OR pm.temp_id IS NOT NULL) AS matches_person,
+                -- שורה שעשויה להפוך לתושב חדש בסבב זה
+                (fm.personid IS NULL AND pm.temp_id IS NULL AND r.missing_fields = '') AS can_insert,
+                EXISTS (SELECT 1 FROM public.person p WHERE p.code = r.code) AS code_exists
+            FROM pending r
+            LEFT JOIN full_match fm ON fm.temp_id = r.temp_id
+            LEFT JOIN (SELECT DISTINCT temp_id FROM partial_match) pm ON pm.temp_id = r.temp_id
+        ),
+        -- שורות שתלויות בתוצאה של שורה מוקדמת יותר בסבב זה
+        dependent AS (
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_phone = r.clean_phone
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_mobile = r.clean_mobile
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_mobile2 = r.clean_mobile2
+            WHERE (q.can_insert OR q.full_personid IS NOT NULL) AND q.temp_id < r.temp_id
+            UNION
+            -- איחוד מחליף את mobile2 של התושב – גם מי שהתאים לערך הישן ממתין
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.full_personid IS NOT NULL AND q.clean_mobile2 IS NOT NULL
+            JOIN public.person_match_keys k ON k.personid = q.full_personid
+            WHERE k.mobile2_norm = r.clean_mobile2 AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q
+              ON q.street_key = r.street_key
+             AND q.building_key = r.building_key
+             AND q.apartment_key = r.apartment_key
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.code = r.code
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            -- קוד קיים: ה-INSERT יעדכן תושב קיים (ON CONFLICT) ולכן משנה את מפתחותיו
+            SELECT r.temp_id FROM classified r
+            WHERE r.temp_id > (SELECT MIN(q.temp_id) FROM classified q
+                               WHERE q.can_insert AND q.code_exists)
+        )
+        UPDATE prc_rows t
+        SET result = CASE
+                WHEN c.full_personid IS NOT NULL THEN 'merged'
+                WHEN c.matches_person THEN 'partial_match'
+                WHEN c.missing_fields <> '' THEN 'skipped'
+                ELSE 'inserted'
+            END,
+            personid_target = c.full_personid,
+            round_no = v_round
+        FROM classified c
+        WHERE t.temp_id = c.temp_id
+          AND c.temp_id < COALESCE((SELECT MIN(d.temp_id) FROM dependent d), 2147483647);
+
+        GET DIAGNOSTICS v_classified = ROW_COUNT;
+        EXIT WHEN v_classified = 0;
+
+        -- ✅ איחוד: עדכון התושב הקיים (הערך האחרון שאינו NULL קובע, כמו בלולאה)
+        UPDATE public.person p
+        SET
+            mother_name = COALESCE(m.mother_name, p.mother_name),
+            entrance = COALESCE(m.entrance, p.entrance),
+            mobile2 = COALESCE(m.clean_mobile2, p.mobile2),
+            email = COALESCE(m.email, p.email),
+            standing_order = COALESCE(m.standing_order, p.standing_order)
+        FROM (
+            SELECT
+                personid_target,
+                (array_agg(mother_name ORDER BY temp_id DESC) FILTER (WHERE mother_name IS NOT NULL))[1] AS mother_name,
+                (array_agg(entrance ORDER BY temp_id DESC) FILTER (WHERE entrance IS NOT NULL))[1] AS entrance,
+                (array_agg(clean_mobile2 ORDER BY temp_id DESC) FILTER (WHERE clean_mobile2 IS NOT NULL))[1] AS clean_mobile2,
+                (array_agg(email ORDER BY temp_id DESC) FILTER (WHERE email IS NOT NULL))[1] AS email,
+                (array_agg(standing_order ORDER BY temp_id DESC) FILTER (WHERE standing_order IS NOT NULL))[1] AS standing_order
+            FROM prc_rows
+            WHERE round_no = v_round AND result = 'merged'
+            GROUP BY personid_target
+        ) m
+        WHERE p.personid = m.personid_target;
+
+        -- ✅ רשומות חדשות: מזהה מוקצה מראש כדי למפות כל שורה לתושב שנוצר
+        UPDATE prc_rows
+        SET new_personid = nextval('public.person_personid_seq')
+        WHERE round_no = v_round AND result = 'inserted';
+
+        WITH ins AS (
+            INSERT INTO public.person(
+                personid, code, lastname, father_name, mother_name,
+                streetcode, buildingnumber, entrance, apartmentnumber,
+                phone, mobile, mobile2, email, standing_order
+            )
+            SELECT
+                r.new_personid, r.code, r.lastname, r.father_name, r.mother_name,
+                r.streetcode, r.buildingnumber, r.entrance, r.apartmentnumber,
+                r.clean_phone, r.clean_mobile, r.clean_mobile2, r.email, r.standing_order
+            FROM prc_rows r
+            WHERE r.round_no = v_round AND r.result = 'inserted'
+            ORDER BY r.temp_id
+            ON CONFLICT (code) DO UPDATE SET
+                lastname = EXCLUDED.lastname,
+                father_name = EXCLUDED.father_name,
+                mother_name = EXCLUDED.mother_name,
+                streetcode = EXCLUDED.streetcode,
+                buildingnumber = EXCLUDED.buildingnumber,
+                entrance = EXCLUDED.entrance,
+                apartmentnumber = EXCLUDED.apartmentnumber,
+                phone = EXCLUDED.phone,
+                mobile = EXCLUDED.mobile,
+                mobile2 = EXCLUDED.mobile2,
+                email = EXCLUDED.email,
+                standing_order = EXCLUDED.standing_order
+            RETURNING personid, code
+        )
+        UPDATE prc_rows r
+        SET personid_target = ins.personid
+        FROM ins
+        WHERE r.round_no = v_round
+          AND r.result = 'inserted'
+          AND (r.code = ins.code OR (r.code IS NULL AND r.new_personid = ins.personid));
+    END LOOP;
+
+    ------------------------------------------------------------------
+    -- שלב 3: תיעוד לארכיון ועדכון סטטוס – פעולה אחת לכל טבלה
+    ------------------------------------------------------------------
+    INSERT INTO public.person_archive(
+        temp_id, personid_target, status, status_note,
+        lastname, father_name, mother_name,
+        streetcode, buildingnumber, entrance, apartmentnumber,
+        phone, mobile, mobile2, email, standing_order
+    )
+    SELECT
+        r.temp_id,
+        r.personid_target,
+        r.result,
+        CASE r.result
+            WHEN 'merged' THEN 'אוחדה עם רשומה קיימת'
+            WHEN 'partial_match' THEN 'התאמה חלקית – טלפון או כתובת קיימים'
+            WHEN 'skipped' THEN 'חסרים נתונים חיוניים: ' || r.missing_fields
+            ELSE 'נוספה רשומה חדשה'
+        END,
+        r.lastname, r.father_name, r.mother_name,
+        r.streetcode, r.buildingnumber, r.entrance, r.apartmentnumber,
+        r.clean_phone, r.clean_mobile, r.clean_mobile2, r.email, r.standing_order
+    FROM prc_rows r
+    ORDER BY r.temp_id;
+
+    UPDATE public.temp_residents_csv t
+    SET status = CASE r.result
+            WHEN 'merged' THEN 'אוחד'
+            WHEN 'partial_match' THEN 'התאמה חלקית'
+            WHEN 'skipped' THEN 'נדחה'
+            ELSE 'הופץ'
+        END,
+        processed_at = now()
+    FROM prc_rows r
+    WHERE t.temp_id = r.temp_id;
+
+    RETURN rows_processed;
+END;
+$$;
+
+ALTER FUNCTION public.process_residents_csv() OWNER TO postgres;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ process_residents_csv is now set-based';
+END $$;
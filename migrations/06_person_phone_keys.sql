@@ -0,0 +1,81 @@
+-- ========================================
+-- 06_person_phone_keys.sql
+-- טלפונים מנורמלים שמורים + אינדקסים להתאמת תושבים
+-- ========================================
+
+-- format_il_phone תלויה רק בקלט שלה (regexp/length), ולכן אפשר להגדיר אותה
+-- IMMUTABLE. זה מאפשר להשתמש בה בעמודות מחושבות ובאינדקסים.
+-- ⚠️ שינוי עתידי בלוגיקת הנרמול מחייב חישוב מחדש של העמודות:
+--    UPDATE person SET phone = phone;
+ALTER FUNCTION public.format_il_phone(text, text) IMMUTABLE;
+
+
+-- ====================
+-- עמודות מנורמלות ב-person
+-- ====================
+
+ALTER TABLE public.person
+    ADD COLUMN IF NOT EXISTS phone_norm TEXT
+        GENERATED ALWAYS AS (public.format_il_phone(phone)) STORED;
+
+ALTER TABLE public.person
+    ADD COLUMN IF NOT EXISTS mobile_norm TEXT
+        GENERATED ALWAYS AS (public.format_il_phone(mobile)) STORED;
+
+ALTER TABLE public.person
+    ADD COLUMN IF NOT EXISTS mobile2_norm TEXT
+        GENERATED ALWAYS AS (public.format_il_phone(mobile2)) STORED;
+
+COMMENT ON COLUMN public.person.phone_norm IS 'format_il_phone(phone) – מפתח התאמה';
+COMMENT ON COLUMN public.person.mobile_norm IS 'format_il_phone(mobile) – מפתח התאמה';
+COMMENT ON COLUMN public.person.mobile2_norm IS 'format_il_phone(mobile2) – מפתח התאמה';
+
+
+-- ====================
+-- אינדקסים
+-- ====================
+
+CREATE INDEX IF NOT EXISTS idx_person_phone_norm ON public.person(phone_norm);
+CREATE INDEX IF NOT EXISTS idx_person_mobile_norm ON public.person(mobile_norm);
+CREATE INDEX IF NOT EXISTS idx_person_mobile2_norm ON public.person(mobile2_norm);
+
+-- מפתח הכתובת כפי שהוא מושווה ב-process_residents_csv (התאמה חלקית ומלאה)
+CREATE INDEX IF NOT EXISTS idx_person_address_key ON public.person(
+    COALESCE(streetcode, 0),
+    COALESCE(buildingnumber, ''),
+    COALESCE(apartmentnumber, '')
+);
+
+-- מפתח השם להתאמה מלאה
+CREATE INDEX IF NOT EXISTS idx_person_name_key ON public.person(
+    LOWER(TRIM(lastname)),
+    LOWER(TRIM(father_name))
+);
+
+
+-- ====================
+-- person_match_keys מעל העמודות השמורות
+-- ====================
+
+-- אותם שמות עמודות כמו ב-05, כך ש-process_residents_csv לא משתנה.
+-- הביטויים זהים לביטויי האינדקסים כדי שהמתכנן יוכל להשתמש בהם.
+CREATE OR REPLACE VIEW public.person_match_keys AS
+SELECT
+    p.personid,
+    p.code,
+    LOWER(TRIM(p.lastname))          AS lastname_key,
+    LOWER(TRIM(p.father_name))       AS father_key,
+    p.phone_norm,
+    p.mobile_norm,
+    p.mobile2_norm,
+    COALESCE(p.streetcode, 0)        AS street_key,
+    COALESCE(p.buildingnumber, '')   AS building_key,
+    COALESCE(p.apartmentnumber, '')  AS apartment_key
+FROM public.person p;
+
+ANALYZE public.person;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ person phone keys and match indexes created';
+END $$;
@@ -0,0 +1,82 @@
+-- ========================================
+-- 08_statement_level_autoreturn.sql
+-- טריגר autoreturn ברמת פקודה (FOR EACH STATEMENT) עם transition table
+-- ========================================
+
+-- הטריגר הקודם (02_fixes.sql) רץ לכל שורה וקרא ל-apply_autoreturn_from_outer,
+-- שמבצעת 3 שאילתות לכל הזמנה. כאן כל ההזמנות שנוספו בפקודה נמצאות ב-new_orders
+-- וכל הזמנות ההחזרה נוצרות ב-INSERT ... SELECT אחד.
+-- apply_autoreturn_from_outer נשארת לשימוש ידני בהזמנה בודדת.
+CREATE OR REPLACE FUNCTION public.trigger_autoreturn_batch() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_delivery_price NUMERIC(10,2);
+BEGIN
+    -- גם INSERT של הזמנות ההחזרה עצמן מפעיל את הטריגר; בלי שורות רלוונטיות
+    -- יוצאים לפני ה-INSERT כדי שלא ייווצר סבב נוסף
+    IF NOT EXISTS (
+        SELECT 1
+        FROM new_orders n
+        JOIN public.person p ON p.personid = n.delivery_getter_id
+        WHERE n.origin_type <> 'autoreturn'
+          AND p.autoreturn IS TRUE
+    ) THEN
+        RETURN NULL;
+    END IF;
+
+    -- שליפת מחיר משלוח
+    SELECT COALESCE(
+        (SELECT setting_value::NUMERIC(10,2)
+         FROM public.delivery_settings
+         WHERE setting_name = 'delivery_price'
+         LIMIT 1),
+        10.00
+    ) INTO v_delivery_price;
+
+    -- יצירת הזמנות חזרה אוטומטיות: המקבל הופך לשולח והשולח למקבל
+    INSERT INTO public."Order"(
+        delivery_sender_id,
+        delivery_getter_id,
+        order_date,
+        excel_import_id,
+        origin_type,
+        origin_outer_id,
+        package_size,
+        price
+    )
+    SELECT
+        n.delivery_getter_id,
+        n.delivery_sender_id,
+        CURRENT_DATE,
+        NULL,
+        'autoreturn',
+        n.id,
+        n.package_size,
+        v_delivery_price
+    FROM new_orders n
+    JOIN public.person p ON p.personid = n.delivery_getter_id
+    WHERE n.origin_type <> 'autoreturn'
+      AND p.autoreturn IS TRUE
+    ORDER BY n.id
+    ON CONFLICT DO NOTHING;
+
+    RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.trigger_autoreturn_batch() OWNER TO postgres;
+
+DROP TRIGGER IF EXISTS after_order_insert ON public."Order";
+DROP FUNCTION IF EXISTS public.trigger_autoreturn();
+
+CREATE TRIGGER after_order_insert
+    AFTER INSERT ON public."Order"
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION public.trigger_autoreturn_batch();
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ after_order_insert is now a statement-level trigger';
+END $$;
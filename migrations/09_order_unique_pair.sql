@@ -0,0 +1,70 @@
+-- ========================================
+-- 09_order_unique_pair.sql
+-- הזמנה אחת לכל זוג שולח-מקבל
+-- ========================================
+
+-- distribute_all_outer_orders, טריגר ה-autoreturn ו-import_orders_from_csv
+-- משתמשים ב-ON CONFLICT DO NOTHING, אבל עד עכשיו לא היה אילוץ ייחודי על
+-- (delivery_sender_id, delivery_getter_id) ולכן כפילויות נכנסו בכל זאת.
+
+-- ====================
+-- ניקוי כפילויות קיימות
+-- ====================
+
+-- נשארת ההזמנה הראשונה (id נמוך) בכל זוג. תשלומים והזמנות autoreturn
+-- שהצביעו על כפילות מועברים להזמנה שנשארת.
+DO $$
+DECLARE
+    v_removed INTEGER;
+BEGIN
+    CREATE TEMP TABLE order_duplicates AS
+    SELECT id, keep_id
+    FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY delivery_sender_id, delivery_getter_id) AS keep_id
+        FROM public."Order"
+        WHERE delivery_sender_id IS NOT NULL
+          AND delivery_getter_id IS NOT NULL
+    ) ranked
+    WHERE id <> keep_id;
+
+    UPDATE public.payment_ledger pl
+    SET order_id = d.keep_id
+    FROM order_duplicates d
+    WHERE pl.order_id = d.id;
+
+    -- בהזמנות autoreturn, origin_outer_id הוא מזהה ההזמנה המקורית
+    UPDATE public."Order" o
+    SET origin_outer_id = d.keep_id
+    FROM order_duplicates d
+    WHERE o.origin_type = 'autoreturn'
+      AND o.origin_outer_id = d.id;
+
+    DELETE FROM public."Order" o
+    USING order_duplicates d
+    WHERE o.id = d.id;
+
+    GET DIAGNOSTICS v_removed = ROW_COUNT;
+    DROP TABLE order_duplicates;
+
+    RAISE NOTICE 'Removed % duplicate orders', v_removed;
+END $$;
+
+
+-- ====================
+-- אינדקס ייחודי
+-- ====================
+
+-- ON CONFLICT DO NOTHING (ללא יעד) מתייחס לכל אינדקס ייחודי, כך שכל מסלולי
+-- ההכנסה משתמשים בו בלי שינוי.
+-- לעונה נפרדת בכל שנה אפשר להחליף באינדקס על
+-- (delivery_sender_id, delivery_getter_id, EXTRACT(YEAR FROM order_date)).
+CREATE UNIQUE INDEX IF NOT EXISTS ux_order_sender_getter
+    ON public."Order"(delivery_sender_id, delivery_getter_id);
+
+-- השולח הוא העמודה הראשונה באינדקס הייחודי – האינדקס הנפרד מיותר
+DROP INDEX IF EXISTS public.idx_order_sender;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ "Order" is unique per (sender, getter)';
+END $$;
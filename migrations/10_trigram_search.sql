@@ -0,0 +1,117 @@
+-- ========================================
+-- 10_trigram_search.sql
+-- חיפוש בטבלאות עם אינדקס trigram (pg_trgm)
+-- ========================================
+
+-- החיפוש בצפייה בטבלאות הוא ILIKE '%מילה%' על כל עמודות הטקסט, ולכן
+-- תמיד סריקה מלאה. כאן לכל טבלה נבנה אינדקס GIN trigram אחד על ביטוי
+-- שמחבר את כל עמודות הטקסט שלה, והאפליקציה מחפשת על אותו ביטוי.
+-- אם pg_trgm לא מותקן בשרת – אין אינדקסים והחיפוש נשאר ILIKE רגיל.
+
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm not available (%) - table search stays on ILIKE', SQLERRM;
+END $$;
+
+
+-- ====================
+-- רישום אינדקסי החיפוש
+-- ====================
+
+CREATE TABLE IF NOT EXISTS public.search_index (
+    table_name TEXT PRIMARY KEY,
+    columns TEXT[] NOT NULL,
+    index_name TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.search_index IS 'אינדקסי trigram לחיפוש בצפייה בטבלאות (ensure_search_index)';
+
+
+-- ====================
+-- הביטוי המאונדקס
+-- ====================
+
+-- מחבר את העמודות עם תו מפריד (0x1F) כדי שמילת חיפוש לא "תדלג" בין עמודות.
+-- האפליקציה מקבלת את הביטוי מכאן, כך שהוא זהה תמיד לביטוי של האינדקס.
+CREATE OR REPLACE FUNCTION public.search_expression(p_columns TEXT[]) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE
+    AS $$
+    SELECT '(' || string_agg(format('COALESCE(%I::text, '''')', col), ' || E''\x1f'' || ' ORDER BY ord) || ')'
+    FROM unnest(p_columns) WITH ORDINALITY AS c(col, ord);
+$$;
+
+ALTER FUNCTION public.search_expression(TEXT[]) OWNER TO postgres;
+
+
+-- ====================
+-- יצירה / רענון של אינדקס חיפוש לטבלה
+-- ====================
+
+-- מחזירה את שם האינדקס, או NULL אם pg_trgm לא זמין או שאין עמודות טקסט.
+-- יש להריץ שוב אחרי הוספת עמודות טקסט לטבלה; עד אז העמודות החדשות
+-- נבדקות ב-ILIKE רגיל.
+CREATE OR REPLACE FUNCTION public.ensure_search_index(p_table TEXT) RETURNS TEXT
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_columns TEXT[];
+    v_index TEXT := 'trgm_search_' || p_table;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT array_agg(a.attname::TEXT ORDER BY a.attnum)
+    INTO v_columns
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public'
+      AND c.relname = p_table
+      AND a.attnum > 0
+      AND NOT a.attisdropped
+      AND a.atttypid IN ('text'::regtype, 'varchar'::regtype, 'bpchar'::regtype);
+
+    IF v_columns IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('DROP INDEX IF EXISTS public.%I', v_index);
+    EXECUTE format(
+        'CREATE INDEX %I ON public.%I USING gin (%s gin_trgm_ops)',
+        v_index, p_table, public.search_expression(v_columns)
+    );
+
+    INSERT INTO public.search_index(table_name, columns, index_name)
+    VALUES (p_table, v_columns, v_index)
+    ON CONFLICT (table_name) DO UPDATE SET
+        columns = EXCLUDED.columns,
+        index_name = EXCLUDED.index_name,
+        created_at = NOW();
+
+    RETURN v_index;
+END;
+$$;
+
+ALTER FUNCTION public.ensure_search_index(TEXT) OWNER TO postgres;
+
+
+-- ====================
+-- הטבלאות הנצפות / שגדלות
+-- ====================
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['person', 'person_archive', 'outerapporder',
+                             'outerapporder_error_log', 'street']
+    LOOP
+        IF public.ensure_search_index(t) IS NOT NULL THEN
+            RAISE NOTICE '✅ trigram search index on %', t;
+        END IF;
+    END LOOP;
+END $$;
@@ -0,0 +1,50 @@
+-- ========================================
+-- 11_schema_change_notify.sql
+-- התראה על שינויי סכמה (event trigger)
+-- ========================================
+
+-- האפליקציה שומרת בזיכרון את רשימות הטבלאות, התצוגות, הפונקציות
+-- והעמודות (app/schema_cache.py). אחרי כל פקודת DDL על אובייקט שאינו
+-- זמני נשלח NOTIFY בערוץ schema_changed, והאפליקציה מרוקנת את המטמון.
+-- ההתראה נשלחת רק ב-COMMIT, כך ש-DDL שבוטל לא מרוקן את המטמון.
+-- טבלאות זמניות (למשל prc_rows ב-process_residents_csv) לא נחשבות.
+
+CREATE OR REPLACE FUNCTION public.notify_schema_change() RETURNS event_trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_EVENT = 'sql_drop' THEN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_event_trigger_dropped_objects() WHERE NOT is_temporary
+        ) THEN
+            RETURN;
+        END IF;
+    ELSIF NOT EXISTS (
+        SELECT 1 FROM pg_event_trigger_ddl_commands()
+        WHERE schema_name IS NULL OR schema_name NOT LIKE 'pg\_temp%'
+    ) THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_notify('schema_changed', TG_TAG);
+END;
+$$;
+
+ALTER FUNCTION public.notify_schema_change() OWNER TO postgres;
+
+
+-- יצירת event trigger דורשת superuser. בלעדיו המטמון מתרענן רק לפי TTL.
+DO $$
+BEGIN
+    DROP EVENT TRIGGER IF EXISTS schema_change_notify;
+    DROP EVENT TRIGGER IF EXISTS schema_drop_notify;
+
+    CREATE EVENT TRIGGER schema_change_notify ON ddl_command_end
+        EXECUTE FUNCTION public.notify_schema_change();
+    CREATE EVENT TRIGGER schema_drop_notify ON sql_drop
+        EXECUTE FUNCTION public.notify_schema_change();
+
+    RAISE NOTICE '✅ Schema changes are announced on channel schema_changed';
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Cannot create event triggers (%) - schema cache refreshes by TTL only', SQLERRM;
+END $$;
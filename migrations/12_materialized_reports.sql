@@ -0,0 +1,139 @@
+-- ========================================
+-- 12_materialized_reports.sql
+-- שכבת דוחות מחושבת מראש (materialized views)
+-- ========================================
+
+-- דוחות הסיכום מחשבים מחדש את כל טבלת "Order" (לפעמים פעמיים – נשלחו
+-- והתקבלו) בכל פתיחה של דף הדוחות. כאן לכל אחד מהם יש עותק mv_* שמתרענן
+-- ב-REFRESH ... CONCURRENTLY אחרי כל ריצת הפצה / ייבוא (או מ-cron דרך
+-- scripts/refresh_reports.py). הקריאה לא נחסמת בזמן הרענון.
+-- ההגדרה נשארת בתצוגה החיה (v_*); העותק הוא SELECT * ממנה.
+
+
+-- ====================
+-- העותקים
+-- ====================
+
+-- ל-REFRESH CONCURRENTLY נדרש אינדקס ייחודי על כל השורות
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_families_balance AS
+    SELECT * FROM public.v_families_balance;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_families_balance
+    ON public.mv_families_balance(personid);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_accounts_summary AS
+    SELECT * FROM public.v_accounts_summary;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_accounts_summary
+    ON public.mv_accounts_summary(sender_id);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_packages_per_building AS
+    SELECT * FROM public.v_packages_per_building;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_packages_per_building
+    ON public.mv_packages_per_building(streetname, buildingnumber);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.mv_family_receipts AS
+    SELECT * FROM public.v_family_receipts;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_family_receipts
+    ON public.mv_family_receipts(personid);
+
+
+-- ====================
+-- רישום ורענון אחרון
+-- ====================
+
+CREATE TABLE IF NOT EXISTS public.report_materialized (
+    view_name TEXT PRIMARY KEY,
+    mv_name TEXT NOT NULL,
+    refreshed_at TIMESTAMP,
+    duration_ms NUMERIC(12,2),
+    row_count BIGINT
+);
+
+COMMENT ON TABLE public.report_materialized IS 'עותקי mv_* של תצוגות הדוחות וזמן הרענון האחרון שלהם';
+
+INSERT INTO public.report_materialized(view_name, mv_name, refreshed_at)
+VALUES
+    ('v_families_balance', 'mv_families_balance', NOW()),
+    ('v_accounts_summary', 'mv_accounts_summary', NOW()),
+    ('v_packages_per_building', 'mv_packages_per_building', NOW()),
+    ('v_family_receipts', 'mv_family_receipts', NOW())
+ON CONFLICT (view_name) DO NOTHING;
+
+
+-- ====================
+-- רענון
+-- ====================
+
+-- מרעננת את כל העותקים (או רק את p_view) ומחזירה זמן ומספר שורות לכל אחד.
+-- CONCURRENTLY לא חוסם קריאות, אבל איטי יותר מרענון רגיל.
+CREATE OR REPLACE FUNCTION public.refresh_report_views(
+    p_view TEXT DEFAULT NULL,
+    p_concurrently BOOLEAN DEFAULT TRUE
+) RETURNS TABLE(view_name TEXT, duration_ms NUMERIC, row_count BIGINT)
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    r RECORD;
+    v_started TIMESTAMP;
+BEGIN
+    FOR r IN
+        SELECT rm.view_name, rm.mv_name
+        FROM public.report_materialized rm
+        WHERE p_view IS NULL OR rm.view_name = p_view
+        ORDER BY rm.view_name
+    LOOP
+        v_started := clock_timestamp();
+
+        EXECUTE format(
+            'REFRESH MATERIALIZED VIEW %s public.%I',
+            CASE WHEN p_concurrently THEN 'CONCURRENTLY' ELSE '' END,
+            r.mv_name
+        );
+
+        view_name := r.view_name;
+        duration_ms := round((extract(epoch FROM clock_timestamp() - v_started) * 1000)::numeric, 2);
+        EXECUTE format('SELECT COUNT(*) FROM public.%I', r.mv_name) INTO row_count;
+
+        UPDATE public.report_materialized rm
+        SET refreshed_at = v_started,
+            duration_ms = refresh_report_views.duration_ms,
+            row_count = refresh_report_views.row_count
+        WHERE rm.view_name = r.view_name;
+
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+ALTER FUNCTION public.refresh_report_views(TEXT, BOOLEAN) OWNER TO postgres;
+
+-- REFRESH MATERIALIZED VIEW הוא פקודת DDL מבחינת event triggers, אבל לא
+-- משנה את הסכמה – אין סיבה לרוקן את מטמון הסכמה בכל רענון דוחות.
+CREATE OR REPLACE FUNCTION public.notify_schema_change() RETURNS event_trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_TAG = 'REFRESH MATERIALIZED VIEW' THEN
+        RETURN;
+    END IF;
+
+    IF TG_EVENT = 'sql_drop' THEN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_event_trigger_dropped_objects() WHERE NOT is_temporary
+        ) THEN
+            RETURN;
+        END IF;
+    ELSIF NOT EXISTS (
+        SELECT 1 FROM pg_event_trigger_ddl_commands()
+        WHERE schema_name IS NULL OR schema_name NOT LIKE 'pg\_temp%'
+    ) THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_notify('schema_changed', TG_TAG);
+END;
+$$;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Materialized report views created (refresh_report_views)';
+END $$;
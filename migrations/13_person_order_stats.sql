@@ -0,0 +1,204 @@
+-- ========================================
+-- 13_person_order_stats.sql
+-- מונים לכל משפחה (נשלחו / התקבלו) שמתעדכנים בטריגר
+-- ========================================
+
+-- v_families_balance, v_family_receipts ו-v_accounts_summary קיבצו את כל
+-- טבלת "Order" בכל שאילתה. כאן המונים נשמרים בטבלה person_order_stats
+-- שמתעדכנת בטריגרים ברמת פקודה (transition tables) על INSERT / UPDATE /
+-- DELETE, והתצוגות הופכות לחיפוש לפי מפתח.
+-- rebuild_person_order_stats() מחשבת את הטבלה מחדש מאפס.
+
+CREATE TABLE IF NOT EXISTS public.person_order_stats (
+    personid INTEGER PRIMARY KEY REFERENCES public.person(personid) ON DELETE CASCADE,
+    sent_count BIGINT NOT NULL DEFAULT 0,
+    sent_price NUMERIC NOT NULL DEFAULT 0,             -- סכום המחירים שאינם NULL
+    received_count BIGINT NOT NULL DEFAULT 0,
+    received_regular BIGINT NOT NULL DEFAULT 0,        -- origin_type <> 'autoreturn'
+    received_autoreturn BIGINT NOT NULL DEFAULT 0      -- origin_type = 'autoreturn'
+);
+
+COMMENT ON TABLE public.person_order_stats IS 'מונים לכל תושב מתוך "Order" – מתעדכן בטריגר (rebuild_person_order_stats לחישוב מחדש)';
+
+
+-- ====================
+-- עדכון המונים
+-- ====================
+
+-- שורות שנוספו נספרות ב-+1 ושורות שנמחקו ב--1 (ב-UPDATE שניהם), ב-upsert
+-- אחד לכל צד. המיון לפי personid קובע סדר נעילה קבוע בין טרנזקציות במקביל.
+CREATE OR REPLACE FUNCTION public.trigger_person_order_stats() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    -- %1$I = transition table, %2$s = +1 / -1
+    v_upsert CONSTANT TEXT := $sql$
+        INSERT INTO public.person_order_stats AS s (
+            personid, sent_count, sent_price, received_count, received_regular, received_autoreturn
+        )
+        SELECT personid,
+               %2$s * SUM(sent), %2$s * SUM(price), %2$s * SUM(received),
+               %2$s * SUM(regular), %2$s * SUM(auto)
+        FROM (
+            SELECT delivery_sender_id AS personid, 1 AS sent, COALESCE(price, 0) AS price,
+                   0 AS received, 0 AS regular, 0 AS auto
+            FROM %1$I
+            UNION ALL
+            SELECT delivery_getter_id, 0, 0, 1,
+                   COALESCE((origin_type <> 'autoreturn')::int, 0),
+                   COALESCE((origin_type = 'autoreturn')::int, 0)
+            FROM %1$I
+        ) delta
+        WHERE personid IS NOT NULL
+        GROUP BY personid
+        ORDER BY personid
+        ON CONFLICT (personid) DO UPDATE SET
+            sent_count = s.sent_count + EXCLUDED.sent_count,
+            sent_price = s.sent_price + EXCLUDED.sent_price,
+            received_count = s.received_count + EXCLUDED.received_count,
+            received_regular = s.received_regular + EXCLUDED.received_regular,
+            received_autoreturn = s.received_autoreturn + EXCLUDED.received_autoreturn
+    $sql$;
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        EXECUTE format(v_upsert, 'old_orders', -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format(v_upsert, 'new_orders', 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.trigger_person_order_stats() OWNER TO postgres;
+
+DROP TRIGGER IF EXISTS order_stats_insert ON public."Order";
+DROP TRIGGER IF EXISTS order_stats_update ON public."Order";
+DROP TRIGGER IF EXISTS order_stats_delete ON public."Order";
+
+CREATE TRIGGER order_stats_insert
+    AFTER INSERT ON public."Order"
+    REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trigger_person_order_stats();
+
+CREATE TRIGGER order_stats_update
+    AFTER UPDATE ON public."Order"
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trigger_person_order_stats();
+
+CREATE TRIGGER order_stats_delete
+    AFTER DELETE ON public."Order"
+    REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION public.trigger_person_order_stats();
+
+
+-- ====================
+-- חישוב מחדש
+-- ====================
+
+-- נועלת את "Order" לכתיבה בזמן החישוב כדי שלא יתפספסו שינויים במקביל.
+-- מחזירה את מספר התושבים עם הזמנות.
+CREATE OR REPLACE FUNCTION public.rebuild_person_order_stats() RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    LOCK TABLE public."Order" IN SHARE MODE;
+
+    DELETE FROM public.person_order_stats;
+
+    INSERT INTO public.person_order_stats (
+        personid, sent_count, sent_price, received_count, received_regular, received_autoreturn
+    )
+    SELECT personid,
+           SUM(sent_count), SUM(sent_price), SUM(received_count),
+           SUM(received_regular), SUM(received_autoreturn)
+    FROM (
+        SELECT delivery_sender_id AS personid,
+               COUNT(*) AS sent_count,
+               COALESCE(SUM(price), 0) AS sent_price,
+               0 AS received_count, 0 AS received_regular, 0 AS received_autoreturn
+        FROM public."Order"
+        WHERE delivery_sender_id IS NOT NULL
+        GROUP BY delivery_sender_id
+        UNION ALL
+        SELECT delivery_getter_id, 0, 0,
+               COUNT(*),
+               COUNT(*) FILTER (WHERE origin_type <> 'autoreturn'),
+               COUNT(*) FILTER (WHERE origin_type = 'autoreturn')
+        FROM public."Order"
+        WHERE delivery_getter_id IS NOT NULL
+        GROUP BY delivery_getter_id
+    ) counts
+    GROUP BY personid;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+ALTER FUNCTION public.rebuild_person_order_stats() OWNER TO postgres;
+
+SELECT public.rebuild_person_order_stats();
+
+
+-- ====================
+-- התצוגות
+-- ====================
+
+-- אותן עמודות ואותם ערכים כמו קודם (mv_* תלויים בהן)
+CREATE OR REPLACE VIEW public.v_families_balance AS
+SELECT
+    p.personid,
+    p.lastname,
+    COALESCE(s.sent_count, 0::bigint) AS sent,
+    COALESCE(s.received_count, 0::bigint) AS received,
+    COALESCE(s.sent_count, 0::bigint) - COALESCE(s.received_count, 0::bigint) AS balance
+FROM public.person p
+LEFT JOIN public.person_order_stats s ON s.personid = p.personid;
+
+CREATE OR REPLACE VIEW public.v_family_receipts AS
+SELECT
+    p.personid,
+    p.lastname,
+    p.autoreturn,
+    COALESCE(s.received_count, 0::bigint) AS total_received,
+    COALESCE(s.received_regular, 0::bigint) AS received_regular,
+    COALESCE(s.received_autoreturn, 0::bigint) AS received_autoreturn
+FROM public.person p
+LEFT JOIN public.person_order_stats s ON s.personid = p.personid
+ORDER BY p.lastname;
+
+CREATE OR REPLACE VIEW public.v_accounts_summary AS
+SELECT
+    p.personid AS sender_id,
+    p.lastname AS sender_name,
+    s.sent_count AS total_orders,
+    s.sent_price AS total_amount,
+    CASE
+        WHEN s.sent_price > 360 THEN 20
+        WHEN s.sent_price > 180 THEN 10
+        ELSE 5
+    END AS discount_percent,
+    round(s.sent_price *
+        CASE
+            WHEN s.sent_price > 360 THEN 0.20
+            WHEN s.sent_price > 180 THEN 0.10
+            ELSE 0.05
+        END, 2) AS discount_amount,
+    round(s.sent_price *
+        CASE
+            WHEN s.sent_price > 360 THEN 0.80
+            WHEN s.sent_price > 180 THEN 0.90
+            ELSE 0.95
+        END, 2) AS final_amount
+FROM public.person_order_stats s
+JOIN public.person p ON p.personid = s.personid
+WHERE s.sent_count > 0
+ORDER BY p.lastname;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ person_order_stats maintained by triggers on "Order"';
+END $$;
@@ -0,0 +1,42 @@
+-- ========================================
+-- 14_jobs.sql
+-- עבודות רקע (העלאות והרצת פונקציות ארוכות)
+-- ========================================
+
+-- ההעלאות ו"הרצת פונקציות" רצו בתוך בקשת ה-HTTP. עכשיו הבקשה שומרת את
+-- הקובץ, יוצרת שורה ב-jobs ומחזירה מיד; השלבים רצים ב-thread ברקע
+-- (app/jobs.py, app/pipelines.py) ומעדכנים כאן שלב, התקדמות ותוצאה.
+
+CREATE TABLE IF NOT EXISTS public.jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,                          -- residents_upload / orders_upload / ...
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    stage TEXT,                                  -- השלב הנוכחי
+    progress NUMERIC(5,2) NOT NULL DEFAULT 0,    -- אחוז 0-100
+    rows_total BIGINT,
+    rows_done BIGINT,
+    filename TEXT,
+    params JSONB,
+    messages JSONB NOT NULL DEFAULT '[]',        -- [{"category": ..., "text": ...}]
+    stats JSONB,                                 -- תוצאה סופית
+    error TEXT,
+    worker TEXT,                                 -- host:pid שמריץ את העבודה
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON public.jobs(created_at DESC);
+
+-- עבודות שלא הסתיימו (לזיהוי עבודות שנקטעו כשהתהליך נפל)
+CREATE INDEX IF NOT EXISTS idx_jobs_active ON public.jobs(status)
+    WHERE status IN ('queued', 'running');
+
+COMMENT ON TABLE public.jobs IS 'עבודות רקע: העלאות קבצים והרצת פונקציות (app/jobs.py)';
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ jobs table created';
+END $$;
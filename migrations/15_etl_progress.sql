@@ -0,0 +1,570 @@
+-- ========================================
+-- 15_etl_progress.sql
+-- התקדמות ETL בזמן אמת (NOTIFY) לעבודות רקע
+-- ========================================
+
+-- שלבי ה-ETL שולחים pg_notify בערוץ etl_progress, ועדכוני טבלת jobs
+-- נשלחים בערוץ job_events. app/events.py מאזין לשני הערוצים ומעביר אותם
+-- לדף העבודה ב-Server-Sent Events (/api/jobs/<id>/events).
+--
+-- NOTIFY נמסר רק ב-COMMIT, ולכן process_residents_csv מקבלת p_limit:
+-- app/pipelines.py קוראת לה שוב ושוב עם ETL_BATCH_SIZE שורות ומבצעת COMMIT
+-- אחרי כל קריאה, וכך כל N שורות מגיעה הודעה. בלי פרמטר ההתנהגות זהה
+-- לקודם (הכל בקריאה אחת).
+-- distribute_all_outer_orders נשארת קריאה אחת (הודעה בסוף השלב): בחלוקה
+-- לקבוצות, הזמנת autoreturn מקבוצה קודמת הייתה "תופסת" זוג שהזמנה
+-- מקבוצה מאוחרת יותר יוצרת כיום בעצמה.
+
+
+-- ====================
+-- etl_progress
+-- ====================
+
+-- payload: {"job_id", "stage", "rows", "remaining", "ts"}
+--   rows      – שורות שעובדו בקריאה הזו
+--   remaining – שורות שעדיין ממתינות לשלב
+--   job_id    – מתוך set_config('etl.job_id', ..., true) של הקורא (או null)
+CREATE OR REPLACE FUNCTION public.etl_progress(p_stage TEXT, p_rows BIGINT, p_remaining BIGINT) RETURNS VOID
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    PERFORM pg_notify('etl_progress', json_build_object(
+        'job_id', NULLIF(current_setting('etl.job_id', true), '')::BIGINT,
+        'stage', p_stage,
+        'rows', p_rows,
+        'remaining', p_remaining,
+        'ts', extract(epoch FROM clock_timestamp())
+    )::TEXT);
+END;
+$$;
+
+ALTER FUNCTION public.etl_progress(TEXT, BIGINT, BIGINT) OWNER TO postgres;
+
+
+-- ====================
+-- raw_to_temp_stage
+-- ====================
+
+-- פקודת INSERT ... SELECT אחת – הודעה אחת בסוף השלב
+CREATE OR REPLACE FUNCTION "public"."raw_to_temp_stage"() RETURNS INTEGER
+    LANGUAGE "plpgsql"
+    AS $_$
+DECLARE
+    rows_inserted INTEGER;
+BEGIN
+  -- ניקוי טבלת TEMP לפני טעינה חדשה
+  TRUNCATE TABLE public.temp_residents_csv RESTART IDENTITY;
+
+  -- שלב 1: רישום רחובות חדשים שלא קיימים בטבלת street ללוג
+  INSERT INTO public.missing_streets_log (streetname)
+  SELECT DISTINCT TRIM(r.streetname)
+  FROM public.raw_residents_csv r
+  WHERE NOT EXISTS (
+      SELECT 1 FROM public.street s
+      WHERE LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname))
+  )
+  AND TRIM(r.streetname) IS NOT NULL
+  AND TRIM(r.streetname) != '';
+
+  -- שלב 2: הוספת רחובות חדשים אוטומטית
+  INSERT INTO public.street (streetname)
+  SELECT DISTINCT TRIM(r.streetname)
+  FROM public.raw_residents_csv r
+  WHERE TRIM(r.streetname) IS NOT NULL 
+    AND TRIM(r.streetname) != ''
+    AND NOT EXISTS (
+        SELECT 1 FROM public.street s 
+        WHERE LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname))
+    )
+  ON CONFLICT (streetcode) DO NOTHING;
+  
+  -- שלב 3: העתקת נתונים ל-TEMP עם ה-streetcode הנכון
+  INSERT INTO public.temp_residents_csv (
+      code, lastname, father_name, mother_name,
+      streetcode, streetname, buildingnumber, entrance, apartmentnumber,
+      phone, mobile, mobile2, email, standing_order
+  )
+  SELECT
+      CASE 
+          WHEN r.code IS NOT NULL AND TRIM(r.code) != '' 
+          THEN CAST(TRIM(r.code) AS INTEGER)
+          ELSE NULL 
+      END,
+      TRIM(r.lastname),
+      TRIM(r.father_name),
+      TRIM(r.mother_name),
+      COALESCE(s.streetcode, 999),  -- ✅ Fallback ל-999 אם הרחוב לא נמצא
+      TRIM(r.streetname),
+      TRIM(r.buildingnumber),
+      TRIM(r.entrance),
+      TRIM(r.apartmentnumber),
+      TRIM(r.phone),
+      TRIM(r.mobile),
+      TRIM(r.mobile2),
+      normalize_email(r.email),
+      COALESCE(r.standing_order, 0)
+  FROM public.raw_residents_csv r
+  LEFT JOIN public.street s  -- ✅ LEFT JOIN במקום INNER JOIN כדי למנוע אובדן נתונים!
+      ON LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname));
+
+  GET DIAGNOSTICS rows_inserted = ROW_COUNT;
+
+  PERFORM public.etl_progress('raw_to_temp_stage', rows_inserted, 0);
+
+  RETURN rows_inserted;
+END;
+$_$;
+
+ALTER FUNCTION "public"."raw_to_temp_stage"() OWNER TO postgres;
+
+
+-- ====================
+-- process_residents_csv(p_limit)
+-- ====================
+
+-- עיבוד בקבוצות לפי temp_id שומר על אותה תוצאה: כל שורה רואה את כל
+-- השורות שלפניה, בין אם עובדו באותה קריאה ובין אם בקריאה קודמת.
+DROP FUNCTION IF EXISTS public.process_residents_csv();
+
+CREATE FUNCTION public.process_residents_csv(p_limit INTEGER DEFAULT NULL) RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_round INTEGER := 0;
+    v_classified INTEGER;
+    v_remaining BIGINT;
+    rows_processed INTEGER;
+BEGIN
+    ------------------------------------------------------------------
+    -- שלב 1: שורות ממתינות + מפתחות מנורמלים (format_il_phone פעם אחת לשורה)
+    --        עם p_limit – רק p_limit השורות הממתינות הראשונות לפי temp_id
+    ------------------------------------------------------------------
+    DROP TABLE IF EXISTS pg_temp.prc_rows;
+
+    CREATE TEMP TABLE prc_rows ON COMMIT DROP AS
+    SELECT
+        t.temp_id, t.code, t.lastname, t.father_name, t.mother_name,
+        t.streetcode, t.buildingnumber, t.entrance, t.apartmentnumber,
+        t.email, t.standing_order,
+        format_il_phone(t.phone)         AS clean_phone,
+        format_il_phone(t.mobile)        AS clean_mobile,
+        format_il_phone(t.mobile2)       AS clean_mobile2,
+        LOWER(TRIM(t.lastname))          AS lastname_key,
+        LOWER(TRIM(t.father_name))       AS father_key,
+        COALESCE(t.streetcode, 0)        AS street_key,
+        COALESCE(t.buildingnumber, '')   AS building_key,
+        COALESCE(t.apartmentnumber, '')  AS apartment_key,
+        -- דרישות חובה: lastname, father_name, streetname, buildingnumber, apartmentnumber
+        concat_ws(', ',
+            CASE WHEN t.lastname IS NULL OR TRIM(t.lastname) = '' THEN 'שם משפחה' END,
+            CASE WHEN t.father_name IS NULL OR TRIM(t.father_name) = '' THEN 'שם פרטי' END,
+            CASE WHEN t.streetname IS NULL OR TRIM(t.streetname) = '' THEN 'רחוב' END,
+            CASE WHEN t.buildingnumber IS NULL OR TRIM(t.buildingnumber) = '' THEN 'מספר בניין' END,
+            CASE WHEN t.apartmentnumber IS NULL OR TRIM(t.apartmentnumber) = '' THEN 'מספר דירה' END
+        )                                AS missing_fields,
+        NULL::TEXT                       AS result,
+        NULL::INTEGER                    AS personid_target,
+        NULL::INTEGER                    AS new_personid,
+        NULL::INTEGER                    AS round_no
+    FROM public.temp_residents_csv t
+    WHERE t.status IS NULL OR t.status = '' OR t.status = 'ממתין'
+    ORDER BY t.temp_id
+    LIMIT p_limit;
+
+    GET DIAGNOSTICS rows_processed = ROW_COUNT;
+    ANALYZE prc_rows;
+
+    ------------------------------------------------------------------
+    -- שלב 2: סבבי סיווג
+    ------------------------------------------------------------------
+    LOOP
+        v_round := v_round + 1;
+
+        WITH pending AS (
+            SELECT * FROM prc_rows WHERE result IS NULL
+        ),
+        -- 🔍 התאמה מלאה: שם + כתובת + אחד הטלפונים
+        full_match AS (
+            SELECT r.temp_id, MIN(k.personid) AS personid
+            FROM pending r
+            JOIN public.person_match_keys k
+              ON k.lastname_key = r.lastname_key
+             AND k.father_key = r.father_key
+             AND k.street_key = r.street_key
+             AND k.building_key = r.building_key
+             AND k.apartment_key = r.apartment_key
+            WHERE k.phone_norm = r.clean_phone
+               OR k.mobile_norm = r.clean_mobile
+               OR k.mobile2_norm = r.clean_mobile2
+            GROUP BY r.temp_id
+        ),
+        -- 🔍 התאמה חלקית: טלפון או כתובת
+        partial_match AS (
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.phone_norm = r.clean_phone
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.mobile_norm = r.clean_mobile
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k ON k.mobile2_norm = r.clean_mobile2
+            UNION
+            SELECT r.temp_id FROM pending r
+            JOIN public.person_match_keys k
+              ON k.street_key = r.street_key
+             AND k.building_key = r.building_key
+             AND k.apartment_key = r.apartment_key
+        ),
+        classified AS (
+            SELECT
+                r.*,
+                fm.personid AS full_personid,
+                (fm.personid IS NOT NULL OR pm.temp_id IS NOT NULL) AS matches_person,
+                -- שורה שעשויה להפוך לתושב חדש בסבב זה
+                (fm.personid IS NULL AND pm.temp_id IS NULL AND r.missing_fields = '') AS can_insert,
+                EXISTS (SELECT 1 FROM public.person p WHERE p.code = r.code) AS code_exists
+            FROM pending r
+            LEFT JOIN full_match fm ON fm.temp_id = r.temp_id
+            LEFT JOIN (SELECT DISTINCT temp_id FROM partial_match) pm ON pm.temp_id = r.temp_id
+        ),
+        -- שורות שתלויות בתוצאה של שורה מוקדמת יותר בסבב זה
+        dependent AS (
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_phone = r.clean_phone
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_mobile = r.clean_mobile
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.clean_mobile2 = r.clean_mobile2
+            WHERE (q.can_insert OR q.full_personid IS NOT NULL) AND q.temp_id < r.temp_id
+            UNION
+            -- איחוד מחליף את mobile2 של התושב – גם מי שהתאים לערך הישן ממתין
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.full_personid IS NOT NULL AND q.clean_mobile2 IS NOT NULL
+            JOIN public.person_match_keys k ON k.personid = q.full_personid
+            WHERE k.mobile2_norm = r.clean_mobile2 AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q
+              ON q.street_key = r.street_key
+             AND q.building_key = r.building_key
+             AND q.apartment_key = r.apartment_key
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            SELECT r.temp_id FROM classified r
+            JOIN classified q ON q.code = r.code
+            WHERE q.can_insert AND q.temp_id < r.temp_id
+            UNION
+            -- קוד קיים: ה-INSERT יעדכן תושב קיים (ON CONFLICT) ולכן משנה את מפתחותיו
+            SELECT r.temp_id FROM classified r
+            WHERE r.temp_id > (SELECT MIN(q.temp_id) FROM classified q
+                               WHERE q.can_insert AND q.code_exists)
+        )
+        UPDATE prc_rows t
+        SET result = CASE
+                WHEN c.full_personid IS NOT NULL THEN 'merged'
+                WHEN c.matches_person THEN 'partial_match'
+                WHEN c.missing_fields <> '' THEN 'skipped'
+                ELSE 'inserted'
+            END,
+            personid_target = c.full_personid,
+            round_no = v_round
+        FROM classified c
+        WHERE t.temp_id = c.temp_id
+          AND c.temp_id < COALESCE((SELECT MIN(d.temp_id) FROM dependent d), 2147483647);
+
+        GET DIAGNOSTICS v_classified = ROW_COUNT;
+        EXIT WHEN v_classified = 0;
+
+        -- ✅ איחוד: עדכון התושב הקיים (הערך האחרון שאינו NULL קובע, כמו בלולאה)
+        UPDATE public.person p
+        SET
+            mother_name = COALESCE(m.mother_name, p.mother_name),
+            entrance = COALESCE(m.entrance, p.entrance),
+            mobile2 = COALESCE(m.clean_mobile2, p.mobile2),
+            email = COALESCE(m.email, p.email),
+            standing_order = COALESCE(m.standing_order, p.standing_order)
+        FROM (
+            SELECT
+                personid_target,
+                (array_agg(mother_name ORDER BY temp_id DESC) FILTER (WHERE mother_name IS NOT NULL))[1] AS mother_name,
+                (array_agg(entrance ORDER BY temp_id DESC) FILTER (WHERE entrance IS NOT NULL))[1] AS entrance,
+                (array_agg(clean_mobile2 ORDER BY temp_id DESC) FILTER (WHERE clean_mobile2 IS NOT NULL))[1] AS clean_mobile2,
+                (array_agg(email ORDER BY temp_id DESC) FILTER (WHERE email IS NOT NULL))[1] AS email,
+                (array_agg(standing_order ORDER BY temp_id DESC) FILTER (WHERE standing_order IS NOT NULL))[1] AS standing_order
+            FROM prc_rows
+            WHERE round_no = v_round AND result = 'merged'
+            GROUP BY personid_target
+        ) m
+        WHERE p.personid = m.personid_target;
+
+        -- ✅ רשומות חדשות: מזהה מוקצה מראש כדי למפות כל שורה לתושב שנוצר
+        UPDATE prc_rows
+        SET new_personid = nextval('public.person_personid_seq')
+        WHERE round_no = v_round AND result = 'inserted';
+
+        WITH ins AS (
+            INSERT INTO public.person(
+                personid, code, lastname, father_name, mother_name,
+                streetcode, buildingnumber, entrance, apartmentnumber,
+                phone, mobile, mobile2, email, standing_order
+            )
+            SELECT
+                r.new_personid, r.code, r.lastname, r.father_name, r.mother_name,
+                r.streetcode, r.buildingnumber, r.entrance, r.apartmentnumber,
+                r.clean_phone, r.clean_mobile, r.clean_mobile2, r.email, r.standing_order
+            FROM prc_rows r
+            WHERE r.round_no = v_round AND r.result = 'inserted'
+            ORDER BY r.temp_id
+            ON CONFLICT (code) DO UPDATE SET
+                lastname = EXCLUDED.lastname,
+                father_name = EXCLUDED.father_name,
+                mother_name = EXCLUDED.mother_name,
+                streetcode = EXCLUDED.streetcode,
+                buildingnumber = EXCLUDED.buildingnumber,
+                entrance = EXCLUDED.entrance,
+                apartmentnumber = EXCLUDED.apartmentnumber,
+                phone = EXCLUDED.phone,
+                mobile = EXCLUDED.mobile,
+                mobile2 = EXCLUDED.mobile2,
+                email = EXCLUDED.email,
+                standing_order = EXCLUDED.standing_order
+            RETURNING personid, code
+        )
+        UPDATE prc_rows r
+        SET personid_target = ins.personid
+        FROM ins
+        WHERE r.round_no = v_round
+          AND r.result = 'inserted'
+          AND (r.code = ins.code OR (r.code IS NULL AND r.new_personid = ins.personid));
+    END LOOP;
+
+    ------------------------------------------------------------------
+    -- שלב 3: תיעוד לארכיון ועדכון סטטוס – פעולה אחת לכל טבלה
+    ------------------------------------------------------------------
+    INSERT INTO public.person_archive(
+        temp_id, personid_target, status, status_note,
+        lastname, father_name, mother_name,
+        streetcode, buildingnumber, entrance, apartmentnumber,
+        phone, mobile, mobile2, email, standing_order
+    )
+    SELECT
+        r.temp_id,
+        r.personid_target,
+        r.result,
+        CASE r.result
+            WHEN 'merged' THEN 'אוחדה עם רשומה קיימת'
+            WHEN 'partial_match' THEN 'התאמה חלקית – טלפון או כתובת קיימים'
+            WHEN 'skipped' THEN 'חסרים נתונים חיוניים: ' || r.missing_fields
+            ELSE 'נוספה רשומה חדשה'
+        END,
+        r.lastname, r.father_name, r.mother_name,
+        r.streetcode, r.buildingnumber, r.entrance, r.apartmentnumber,
+        r.clean_phone, r.clean_mobile, r.clean_mobile2, r.email, r.standing_order
+    FROM prc_rows r
+    ORDER BY r.temp_id;
+
+    UPDATE public.temp_residents_csv t
+    SET status = CASE r.result
+            WHEN 'merged' THEN 'אוחד'
+            WHEN 'partial_match' THEN 'התאמה חלקית'
+            WHEN 'skipped' THEN 'נדחה'
+            ELSE 'הופץ'
+        END,
+        processed_at = now()
+    FROM prc_rows r
+    WHERE t.temp_id = r.temp_id;
+
+    SELECT COUNT(*) INTO v_remaining
+    FROM public.temp_residents_csv t
+    WHERE t.status IS NULL OR t.status = '' OR t.status = 'ממתין';
+
+    PERFORM public.etl_progress('process_residents_csv', rows_processed, v_remaining);
+
+    RETURN rows_processed;
+END;
+$$;
+
+ALTER FUNCTION public.process_residents_csv(INTEGER) OWNER TO postgres;
+
+
+-- ====================
+-- distribute_all_outer_orders
+-- ====================
+
+CREATE OR REPLACE FUNCTION public.distribute_all_outer_orders() RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $_$
+DECLARE
+    v_delivery_price NUMERIC(10,2);
+    v_total_inserted INTEGER := 0;
+    v_processed INTEGER;
+BEGIN
+    -- 🧩 שלב 1: שלוף מחיר משלוח או קבע ברירת מחדל 10.00
+    SELECT COALESCE(
+        (SELECT setting_value::NUMERIC(10,2)
+         FROM public.delivery_settings
+         WHERE setting_name = 'delivery_price'
+         LIMIT 1),
+        10.00
+    ) INTO v_delivery_price;
+
+    -- 🧩 שלב 2: כל ההזמנות הממתינות + שולח מנורמל
+    -- (כמו normalize_sender_code: קוד שאינו מספר שלם → NULL)
+    DROP TABLE IF EXISTS pg_temp.dao_outer;
+
+    CREATE TEMP TABLE dao_outer ON COMMIT DROP AS
+    SELECT
+        o.id,
+        o.sender_code,
+        o.invitees,
+        o.package_size,
+        s.personid AS sender_id,
+        0 AS rows_inserted
+    FROM public.outerapporder o
+    LEFT JOIN public.person s
+      ON s.code = CASE
+            WHEN o.sender_code ~ '^\s*[+-]?\d{1,10}\s*$' THEN
+                CASE WHEN btrim(o.sender_code, E' \t\n\r\v\f')::BIGINT
+                          BETWEEN -2147483648 AND 2147483647
+                     THEN btrim(o.sender_code, E' \t\n\r\v\f')::INT
+                END
+         END
+    WHERE o.status = 'waiting';
+
+    GET DIAGNOSTICS v_processed = ROW_COUNT;
+
+    -- 🧩 שלב 3: הכנסת כל ההזמנות בפקודה אחת
+    WITH tokens AS (
+        SELECT d.id, d.sender_id, d.package_size,
+               NULLIF(trim(t.token), '') AS token_trim
+        FROM dao_outer d
+        CROSS JOIN LATERAL regexp_split_to_table(d.invitees, '\|') AS t(token)
+        WHERE d.invitees IS NOT NULL AND d.invitees <> ''
+          AND d.sender_id IS NOT NULL
+    ),
+    ints AS (
+        SELECT DISTINCT id, sender_id, package_size, token_trim::INT AS invitee_id
+        FROM tokens
+        WHERE token_trim ~ '^\d{1,9}$'
+    ),
+    inserted AS (
+        INSERT INTO public."Order"(
+            delivery_sender_id,
+            delivery_getter_id,
+            order_date,
+            excel_import_id,
+            origin_type,
+            origin_outer_id,
+            price,
+            package_size
+        )
+        SELECT
+            i.sender_id,
+            i.invitee_id,
+            CURRENT_DATE,
+            i.id,
+            'invitees',
+            i.id,
+            v_delivery_price,
+            i.package_size
+        FROM ints i
+        JOIN public.person p ON p.personid = i.invitee_id
+        ORDER BY i.id, i.invitee_id
+        ON CONFLICT DO NOTHING
+        RETURNING origin_outer_id
+    ),
+    counts AS (
+        SELECT origin_outer_id AS id, COUNT(*)::INT AS n
+        FROM inserted
+        GROUP BY origin_outer_id
+    )
+    UPDATE dao_outer d
+    SET rows_inserted = c.n
+    FROM counts c
+    WHERE d.id = c.id;
+
+    -- הערה: autoreturn מופעל באמצעות טריגר על טבלת Order
+
+    -- 🧩 שלב 4: יומן שגיאות בפקודה אחת
+    INSERT INTO public.outerapporder_error_log(outer_id, severity, reason_code, message, details)
+    SELECT
+        d.id,
+        'error',
+        CASE WHEN d.invitees IS NULL OR d.invitees = '' THEN 'no_invitees' ELSE 'missing_sender' END,
+        CASE WHEN d.invitees IS NULL OR d.invitees = ''
+             THEN 'אין מוזמנים להזמנה זו (invitees ריק)'
+             ELSE format('שולח %s לא קיים בטבלת person', d.sender_id)
+        END,
+        jsonb_build_object('sender_code', d.sender_code)
+    FROM dao_outer d
+    WHERE d.invitees IS NULL OR d.invitees = '' OR d.sender_id IS NULL
+    ORDER BY d.id;
+
+    -- 🧩 שלב 5: עדכון סטטוס לכל ההזמנות בפקודה אחת
+    UPDATE public.outerapporder o
+    SET status = CASE WHEN d.rows_inserted > 0 THEN 'distributed' ELSE 'error' END,
+        processed_at = NOW(),
+        error_message = CASE
+            WHEN d.invitees IS NULL OR d.invitees = '' THEN 'אין מוזמנים להזמנה זו'
+            WHEN d.sender_id IS NULL THEN 'שולח לא קיים בטבלת person'
+            WHEN d.rows_inserted = 0 THEN 'לא נוצרו הזמנות חדשות - כנראה כפילות או חוסר נתונים'
+            ELSE NULL
+        END
+    FROM dao_outer d
+    WHERE o.id = d.id;
+
+    SELECT COALESCE(SUM(rows_inserted), 0) INTO v_total_inserted FROM dao_outer;
+
+    PERFORM public.etl_progress('distribute_all_outer_orders', v_processed, 0);
+
+    RETURN v_total_inserted;
+END;
+$_$;
+
+ALTER FUNCTION public.distribute_all_outer_orders() OWNER TO postgres;
+
+
+-- ====================
+-- job_events
+-- ====================
+
+-- כל עדכון של שורה ב-jobs (שלב, התקדמות, הודעה, סיום) נשלח ללקוחות
+-- שמאזינים. ההודעה האחרונה נשלחת רק כשנוספה הודעה חדשה.
+CREATE OR REPLACE FUNCTION public.notify_job_event() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    PERFORM pg_notify('job_events', json_build_object(
+        'job_id', NEW.id,
+        'status', NEW.status,
+        'stage', NEW.stage,
+        'progress', NEW.progress,
+        'rows_done', NEW.rows_done,
+        'rows_total', NEW.rows_total,
+        'error', NEW.error,
+        'message', CASE
+            WHEN TG_OP = 'UPDATE' AND NEW.messages IS DISTINCT FROM OLD.messages
+            THEN NEW.messages -> -1
+        END,
+        'ts', extract(epoch FROM clock_timestamp())
+    )::TEXT);
+    RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.notify_job_event() OWNER TO postgres;
+
+DROP TRIGGER IF EXISTS jobs_notify ON public.jobs;
+
+CREATE TRIGGER jobs_notify
+    AFTER INSERT OR UPDATE ON public.jobs
+    FOR EACH ROW EXECUTE FUNCTION public.notify_job_event();
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ ETL progress notifications (etl_progress, job_events)';
+END $$;
@@ -0,0 +1,62 @@
+-- ========================================
+-- 16_etl_runs.sql
+-- יומן הרצות ETL: שלבים, זמנים וכמויות שורות
+-- ========================================
+
+-- כל מסלול ייבוא (עבודות ההעלאה ב-app/pipelines.py והסקריפטים
+-- scripts/etl_*.py) רושם כאן הרצה אחת ושורה לכל שלב: זמן כולל, זמן SQL,
+-- שורות נכנסות / יוצאות ופילוח לפי סטטוס (app/etl_ledger.py).
+-- עמוד "היסטוריית ETL" משווה כל שלב להרצות קודמות מאותו סוג, כך ששלב
+-- שמאט ככל שהעיר גדלה בולט מיד.
+
+CREATE TABLE IF NOT EXISTS public.etl_runs (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,                          -- residents / orders / orders_import
+    source TEXT NOT NULL CHECK (source IN ('web', 'cli')),
+    status TEXT NOT NULL DEFAULT 'running'
+        CHECK (status IN ('running', 'succeeded', 'failed')),
+    job_id BIGINT REFERENCES public.jobs(id) ON DELETE SET NULL,
+    filename TEXT,
+    file_hash TEXT,                              -- sha256 של הקובץ
+    file_size BIGINT,
+    persons_before BIGINT,                       -- גודל העיר בתחילת ההרצה
+    persons_after BIGINT,
+    duration_ms NUMERIC(12,1),
+    db_ms NUMERIC(12,1),                         -- סכום זמני ה-SQL של השלבים
+    stats JSONB,
+    error TEXT,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_runs_kind_started
+    ON public.etl_runs(kind, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_etl_runs_file_hash ON public.etl_runs(file_hash);
+
+CREATE TABLE IF NOT EXISTS public.etl_run_stages (
+    id BIGSERIAL PRIMARY KEY,
+    run_id BIGINT NOT NULL REFERENCES public.etl_runs(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,                        -- סדר השלב בהרצה
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('succeeded', 'failed')),
+    rows_in BIGINT,
+    rows_out BIGINT,
+    status_counts JSONB,                         -- {"הופץ": 10, "אוחד": 2, ...}
+    duration_ms NUMERIC(12,1) NOT NULL,
+    db_ms NUMERIC(12,1) NOT NULL,
+    queries INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP NOT NULL,
+    UNIQUE (run_id, seq)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_run_stages_stage ON public.etl_run_stages(stage, run_id);
+
+COMMENT ON TABLE public.etl_runs IS 'הרצות ETL מכל מסלולי הייבוא (app/etl_ledger.py)';
+COMMENT ON TABLE public.etl_run_stages IS 'שלבי הרצת ETL: זמנים, זמן SQL ושורות לפי סטטוס';
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ etl_runs / etl_run_stages tables created';
+END $$;
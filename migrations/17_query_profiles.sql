@@ -0,0 +1,37 @@
+-- ========================================
+-- 17_query_profiles.sql
+-- פרופילים של פונקציות ודוחות (EXPLAIN ANALYZE)
+-- ========================================
+
+-- מצב "פרופיל" בעמוד הרצת הפונקציות ובעמוד הדוחות מריץ את הפקודה תחת
+-- EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) בתוך טרנזקציה שתמיד מבוטלת
+-- (app/profiling.py), ושומר כאן את התוכנית, הזמנים וסיכום הצמתים היקרים.
+
+CREATE TABLE IF NOT EXISTS public.query_profiles (
+    id BIGSERIAL PRIMARY KEY,
+    target_type TEXT NOT NULL CHECK (target_type IN ('function', 'view')),
+    target TEXT NOT NULL,                        -- שם הפונקציה / התצוגה
+    relation TEXT,                               -- היחס שנקרא בפועל (תצוגה / mv_*)
+    query TEXT NOT NULL,
+    params JSONB,
+    volatility CHAR(1),                          -- v = משנה נתונים (הכל בוטל)
+    planning_ms NUMERIC(12,3),
+    execution_ms NUMERIC(12,3),
+    total_ms NUMERIC(12,3),                      -- זמן הקיר כולל EXPLAIN
+    plan JSONB NOT NULL,                         -- פלט EXPLAIN המלא
+    nested JSONB,                                -- תוכניות הפקודות שבתוך הפונקציה (auto_explain)
+    functions JSONB,                             -- pg_stat_xact_user_functions
+    top_nodes JSONB NOT NULL DEFAULT '[]',       -- הצמתים עם הזמן העצמי הגבוה ביותר
+    created_by TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_query_profiles_target
+    ON public.query_profiles(target, created_at DESC);
+
+COMMENT ON TABLE public.query_profiles IS 'EXPLAIN ANALYZE של פונקציות ודוחות, בטרנזקציה מבוטלת (app/profiling.py)';
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ query_profiles table created';
+END $$;
@@ -0,0 +1,136 @@
+-- ========================================
+-- 18_idempotent_uploads.sql
+-- העלאות אידמפוטנטיות: hash לקובץ ולכל שורה, והמשך הרצה שנקטעה
+-- ========================================
+
+-- 1. קובץ זהה (sha256 ב-etl_runs.file_hash) שכבר יובא בהצלחה לא מורץ שוב:
+--    ההרצה נרשמת כ-skipped עם הפניה להרצה הקודמת.
+-- 2. שורות שכבר נטענו מדולגות:
+--    • תושבים – hash לכל שורת raw; שורות שאוחדו / נוספו נשמרות ב-resident_row_hashes,
+--      ושורות raw עם hash מוכר נמחקות לפני raw_to_temp_stage.
+--    • הזמנות – outerapporder.row_hash ייחודי, INSERT ... ON CONFLICT DO NOTHING.
+-- 3. הרצת תושבים שנקטעה (התהליך נהרג באמצע process_residents_csv) ממשיכה
+--    מה-batch האחרון שנשמר ב-COMMIT במקום לרוקן את raw ולהתחיל מחדש.
+
+-- ====================
+-- etl_runs
+-- ====================
+
+ALTER TABLE public.etl_runs
+    ADD COLUMN IF NOT EXISTS worker TEXT,                                  -- host:pid שמריץ את ההרצה
+    ADD COLUMN IF NOT EXISTS resumed_from BIGINT REFERENCES public.etl_runs(id) ON DELETE SET NULL;
+
+ALTER TABLE public.etl_runs DROP CONSTRAINT IF EXISTS etl_runs_status_check;
+ALTER TABLE public.etl_runs ADD CONSTRAINT etl_runs_status_check
+    CHECK (status IN ('running', 'succeeded', 'failed', 'skipped'));
+
+-- ====================
+-- Residents
+-- ====================
+
+ALTER TABLE public.raw_residents_csv ADD COLUMN IF NOT EXISTS row_hash TEXT;
+
+CREATE TABLE IF NOT EXISTS public.resident_row_hashes (
+    row_hash TEXT PRIMARY KEY,                   -- md5 של ערכי שורת raw (app/ingest.py row_hash)
+    run_id BIGINT REFERENCES public.etl_runs(id) ON DELETE SET NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE public.resident_row_hashes IS 'שורות קובץ תושבים שכבר אוחדו / נוספו - מדולגות בהעלאה הבאה';
+
+-- raw_to_temp_stage – כמו במיגרציה 15, ה-hash של שורת raw עובר ל-temp_residents_csv.src_row_id
+CREATE OR REPLACE FUNCTION public.raw_to_temp_stage() RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    rows_inserted INTEGER;
+BEGIN
+  -- ניקוי טבלת TEMP לפני טעינה חדשה
+  TRUNCATE TABLE public.temp_residents_csv RESTART IDENTITY;
+
+  -- שלב 1: רישום רחובות חדשים שלא קיימים בטבלת street ללוג
+  INSERT INTO public.missing_streets_log (streetname)
+  SELECT DISTINCT TRIM(r.streetname)
+  FROM public.raw_residents_csv r
+  WHERE NOT EXISTS (
+      SELECT 1 FROM public.street s
+      WHERE LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname))
+  )
+  AND TRIM(r.streetname) IS NOT NULL
+  AND TRIM(r.streetname) != '';
+
+  -- שלב 2: הוספת רחובות חדשים אוטומטית
+  INSERT INTO public.street (streetname)
+  SELECT DISTINCT TRIM(r.streetname)
+  FROM public.raw_residents_csv r
+  WHERE TRIM(r.streetname) IS NOT NULL
+    AND TRIM(r.streetname) != ''
+    AND NOT EXISTS (
+        SELECT 1 FROM public.street s
+        WHERE LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname))
+    )
+  ON CONFLICT (streetcode) DO NOTHING;
+
+  -- שלב 3: העתקת נתונים ל-TEMP עם ה-streetcode הנכון
+  INSERT INTO public.temp_residents_csv (
+      code, lastname, father_name, mother_name,
+      streetcode, streetname, buildingnumber, entrance, apartmentnumber,
+      phone, mobile, mobile2, email, standing_order, src_row_id
+  )
+  SELECT
+      CASE
+          WHEN r.code IS NOT NULL AND TRIM(r.code) != ''
+          THEN CAST(TRIM(r.code) AS INTEGER)
+          ELSE NULL
+      END,
+      TRIM(r.lastname),
+      TRIM(r.father_name),
+      TRIM(r.mother_name),
+      COALESCE(s.streetcode, 999),  -- Fallback ל-999 אם הרחוב לא נמצא
+      TRIM(r.streetname),
+      TRIM(r.buildingnumber),
+      TRIM(r.entrance),
+      TRIM(r.apartmentnumber),
+      TRIM(r.phone),
+      TRIM(r.mobile),
+      TRIM(r.mobile2),
+      normalize_email(r.email),
+      COALESCE(r.standing_order, 0),
+      r.row_hash
+  FROM public.raw_residents_csv r
+  LEFT JOIN public.street s  -- LEFT JOIN כדי למנוע אובדן נתונים
+      ON LOWER(TRIM(s.streetname)) = LOWER(TRIM(r.streetname));
+
+  GET DIAGNOSTICS rows_inserted = ROW_COUNT;
+
+  PERFORM public.etl_progress('raw_to_temp_stage', rows_inserted, 0);
+
+  RETURN rows_inserted;
+END;
+$$;
+
+-- ====================
+-- Outer orders
+-- ====================
+
+ALTER TABLE public.outerapporder ADD COLUMN IF NOT EXISTS row_hash TEXT;
+
+-- שורות קיימות: רק המופע הראשון של כל הזמנה מקבל hash (כפילויות ישנות נשארות בלי)
+UPDATE public.outerapporder o
+SET row_hash = h.row_hash
+FROM (
+    SELECT MIN(id) AS id,
+           md5(concat_ws(chr(31), sender_code, invitees, package_size, origin)) AS row_hash
+    FROM public.outerapporder
+    GROUP BY 2
+) h
+WHERE o.id = h.id AND o.row_hash IS NULL
+  AND NOT EXISTS (SELECT 1 FROM public.outerapporder x WHERE x.row_hash = h.row_hash);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_outerapporder_row_hash
+    ON public.outerapporder(row_hash) WHERE row_hash IS NOT NULL;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ idempotent uploads: row hashes, resident_row_hashes, resumable runs';
+END $$;
@@ -0,0 +1,164 @@
+-- ========================================
+-- 19_invitee_overflow_log.sql
+-- distribute_all_outer_orders: מוזמן מחוץ לטווח נרשם ביומן השגיאות
+-- ========================================
+
+-- ב-01_schema.sql מוזמן מספרי גדול מ-INTEGER הפיל את כל ההרצה (integer out of range).
+-- מאז 07_set_based_distribute_outer_orders.sql מוזמן כזה פשוט נעלם מההתאמה, בלי שום
+-- רישום (וגם קודים בני 10 ספרות שכן נכנסים ל-INTEGER נעלמו).
+-- עכשיו כל מוזמן מספרי עד 2147483647 מותאם, ומוזמן גדול יותר נרשם ב-outerapporder_error_log
+-- (reason_code = 'invalid_invitee'); שאר המוזמנים של ההזמנה מופצים כרגיל.
+-- שאר הפונקציה זהה לגרסה ב-15_etl_progress.sql.
+
+CREATE OR REPLACE FUNCTION public.distribute_all_outer_orders() RETURNS INTEGER
+    LANGUAGE plpgsql
+    AS $_$
+DECLARE
+    v_delivery_price NUMERIC(10,2);
+    v_total_inserted INTEGER := 0;
+    v_processed INTEGER;
+BEGIN
+    -- 🧩 שלב 1: שלוף מחיר משלוח או קבע ברירת מחדל 10.00
+    SELECT COALESCE(
+        (SELECT setting_value::NUMERIC(10,2)
+         FROM public.delivery_settings
+         WHERE setting_name = 'delivery_price'
+         LIMIT 1),
+        10.00
+    ) INTO v_delivery_price;
+
+    -- 🧩 שלב 2: כל ההזמנות הממתינות + שולח מנורמל
+    -- (כמו normalize_sender_code: קוד שאינו מספר שלם → NULL)
+    DROP TABLE IF EXISTS pg_temp.dao_outer;
+
+    CREATE TEMP TABLE dao_outer ON COMMIT DROP AS
+    SELECT
+        o.id,
+        o.sender_code,
+        o.invitees,
+        o.package_size,
+        s.personid AS sender_id,
+        0 AS rows_inserted
+    FROM public.outerapporder o
+    LEFT JOIN public.person s
+      ON s.code = CASE
+            WHEN o.sender_code ~ '^\s*[+-]?\d{1,10}\s*$' THEN
+                CASE WHEN btrim(o.sender_code, E' \t\n\r\v\f')::BIGINT
+                          BETWEEN -2147483648 AND 2147483647
+                     THEN btrim(o.sender_code, E' \t\n\r\v\f')::INT
+                END
+         END
+    WHERE o.status = 'waiting';
+
+    GET DIAGNOSTICS v_processed = ROW_COUNT;
+
+    -- 🧩 שלב 3: הכנסת כל ההזמנות בפקודה אחת
+    WITH tokens AS (
+        SELECT d.id, d.sender_id, d.package_size,
+               NULLIF(trim(t.token), '') AS token_trim
+        FROM dao_outer d
+        CROSS JOIN LATERAL regexp_split_to_table(d.invitees, '\|') AS t(token)
+        WHERE d.invitees IS NOT NULL AND d.invitees <> ''
+          AND d.sender_id IS NOT NULL
+    ),
+    ints AS (
+        SELECT DISTINCT id, sender_id, package_size, token_trim::INT AS invitee_id
+        FROM tokens
+        WHERE CASE WHEN token_trim ~ '^\d+$' THEN token_trim::NUMERIC <= 2147483647 ELSE false END
+    ),
+    inserted AS (
+        INSERT INTO public."Order"(
+            delivery_sender_id,
+            delivery_getter_id,
+            order_date,
+            excel_import_id,
+            origin_type,
+            origin_outer_id,
+            price,
+            package_size
+        )
+        SELECT
+            i.sender_id,
+            i.invitee_id,
+            CURRENT_DATE,
+            i.id,
+            'invitees',
+            i.id,
+            v_delivery_price,
+            i.package_size
+        FROM ints i
+        JOIN public.person p ON p.personid = i.invitee_id
+        ORDER BY i.id, i.invitee_id
+        ON CONFLICT DO NOTHING
+        RETURNING origin_outer_id
+    ),
+    counts AS (
+        SELECT origin_outer_id AS id, COUNT(*)::INT AS n
+        FROM inserted
+        GROUP BY origin_outer_id
+    )
+    UPDATE dao_outer d
+    SET rows_inserted = c.n
+    FROM counts c
+    WHERE d.id = c.id;
+
+    -- הערה: autoreturn מופעל באמצעות טריגר על טבלת Order
+
+    -- 🧩 שלב 4: יומן שגיאות בפקודה אחת
+    INSERT INTO public.outerapporder_error_log(outer_id, severity, reason_code, message, details)
+    SELECT
+        d.id,
+        'error',
+        CASE WHEN d.invitees IS NULL OR d.invitees = '' THEN 'no_invitees' ELSE 'missing_sender' END,
+        CASE WHEN d.invitees IS NULL OR d.invitees = ''
+             THEN 'אין מוזמנים להזמנה זו (invitees ריק)'
+             ELSE format('שולח %s לא קיים בטבלת person', d.sender_id)
+        END,
+        jsonb_build_object('sender_code', d.sender_code)
+    FROM dao_outer d
+    WHERE d.invitees IS NULL OR d.invitees = '' OR d.sender_id IS NULL
+    ORDER BY d.id;
+
+    -- מוזמנים מספריים מחוץ לטווח INTEGER (היו מפילים את כל ההרצה ב-01_schema.sql)
+    INSERT INTO public.outerapporder_error_log(outer_id, severity, reason_code, message, details)
+    SELECT
+        d.id,
+        'error',
+        'invalid_invitee',
+        format('מוזמן %s מחוץ לטווח מספרי האנשים', x.token_trim),
+        jsonb_build_object('sender_code', d.sender_code, 'invitee', x.token_trim)
+    FROM dao_outer d
+    CROSS JOIN LATERAL regexp_split_to_table(d.invitees, '\|') AS t(token)
+    CROSS JOIN LATERAL (SELECT trim(t.token) AS token_trim) x
+    WHERE d.invitees IS NOT NULL AND d.invitees <> ''
+      AND d.sender_id IS NOT NULL
+      AND CASE WHEN x.token_trim ~ '^\d+$' THEN x.token_trim::NUMERIC > 2147483647 ELSE false END
+    ORDER BY d.id;
+
+    -- 🧩 שלב 5: עדכון סטטוס לכל ההזמנות בפקודה אחת
+    UPDATE public.outerapporder o
+    SET status = CASE WHEN d.rows_inserted > 0 THEN 'distributed' ELSE 'error' END,
+        processed_at = NOW(),
+        error_message = CASE
+            WHEN d.invitees IS NULL OR d.invitees = '' THEN 'אין מוזמנים להזמנה זו'
+            WHEN d.sender_id IS NULL THEN 'שולח לא קיים בטבלת person'
+            WHEN d.rows_inserted = 0 THEN 'לא נוצרו הזמנות חדשות - כנראה כפילות או חוסר נתונים'
+            ELSE NULL
+        END
+    FROM dao_outer d
+    WHERE o.id = d.id;
+
+    SELECT COALESCE(SUM(rows_inserted), 0) INTO v_total_inserted FROM dao_outer;
+
+    PERFORM public.etl_progress('distribute_all_outer_orders', v_processed, 0);
+
+    RETURN v_total_inserted;
+END;
+$_$;
+
+ALTER FUNCTION public.distribute_all_outer_orders() OWNER TO postgres;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ distribute_all_outer_orders logs out-of-range invitees';
+END $$;
@@ -0,0 +1,50 @@
+-- ========================================
+-- 20_job_events_payload.sql
+-- job_events: payload מוגבל באורכו
+-- ========================================
+
+-- NOTIFY דוחה payload של 8000 בתים ומעלה, ואז נכשל גם ה-UPDATE על jobs שהפעיל
+-- את הטריגר: עבודה שנכשלה עם שגיאה ארוכה (או הודעה ארוכה, למשל תוצאה גדולה של
+-- פונקציה) נשארה 'running' לתמיד.
+-- עכשיו השגיאה וטקסט ההודעה נחתכים ל-1000 תווים (השורה המלאה נקראת מ-/api/jobs/<id>
+-- וב-snapshot הסופי), ו-NOTIFY שנכשל בכל זאת רק נרשם כאזהרה ולא מפיל את העדכון.
+
+CREATE OR REPLACE FUNCTION public.notify_job_event() RETURNS TRIGGER
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_message JSONB;
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.messages IS DISTINCT FROM OLD.messages THEN
+        v_message := NEW.messages -> -1;
+        v_message := jsonb_build_object(
+            'category', v_message ->> 'category',
+            'text', left(v_message ->> 'text', 1000)
+        );
+    END IF;
+
+    BEGIN
+        PERFORM pg_notify('job_events', json_build_object(
+            'job_id', NEW.id,
+            'status', NEW.status,
+            'stage', NEW.stage,
+            'progress', NEW.progress,
+            'rows_done', NEW.rows_done,
+            'rows_total', NEW.rows_total,
+            'error', left(NEW.error, 1000),
+            'message', v_message,
+            'ts', extract(epoch FROM clock_timestamp())
+        )::TEXT);
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'job_events notify for job % failed: %', NEW.id, SQLERRM;
+    END;
+    RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.notify_job_event() OWNER TO postgres;
+
+DO $$
+BEGIN
+    RAISE NOTICE '✅ job_events payloads are length-limited';
+END $$;
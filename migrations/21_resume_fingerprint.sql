@@ -0,0 +1,23 @@
+-- ========================================
+-- 21_resume_fingerprint.sql
+-- המשך הרצת תושבים רק כשטבלת temp עדיין שלה
+-- ========================================
+
+-- הרצה שנקטעה המשיכה מ-temp_residents_csv בלי לבדוק מה יש בה: אם בינתיים
+-- raw_to_temp_stage רץ מחוץ ל-ledger (bench, הרצה ידנית) על קובץ אחר, ההמשך
+-- עיבד את השורות שלו כאילו היו של הקובץ שנקטע.
+-- עכשיו כל הרצה שומרת ב-etl_runs.temp_fingerprint טביעה של temp מיד אחרי
+-- raw_to_temp_stage (או כשהיא ממשיכה הרצה קודמת), וההמשך מתבצע רק אם הטביעה
+-- של temp כרגע זהה לה. אחרת – טעינה מחדש של הקובץ.
+
+ALTER TABLE public.etl_runs
+    ADD COLUMN IF NOT EXISTS temp_fingerprint TEXT;   -- temp_residents_fingerprint() אחרי raw_to_temp_stage
+
+-- md5 של (temp_id, src_row_id) של כל השורות בסדר temp_id; NULL כש-temp ריקה.
+-- process_residents_csv משנה רק status, כך שהטביעה לא משתנה בזמן העיבוד.
+CREATE OR REPLACE FUNCTION public.temp_residents_fingerprint() RETURNS TEXT
+    LANGUAGE sql STABLE
+    AS $$
+  SELECT md5(string_agg(temp_id::TEXT || ':' || COALESCE(src_row_id, ''), ',' ORDER BY temp_id))
+  FROM public.temp_residents_csv;
+$$;
@@ -3,7 +3,6 @@ ETL Script for Outer Orders CSV Files
 מערכת ETL לקבצי הזמנות חיצוניות
 """
 
-import pandas as pd
 import psycopg2
 import sys
 import os
@@ -12,70 +11,45 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.config import Config
+from app.reports import refresh_reports_after_run
+from app.ingest import iter_upload_chunks
+from app.db import advisory_lock
+from app.etl_ledger import EtlRun
+from app.metrics import TimedTupleCursor
+from app.pipelines import ORDERS_LOCK, insert_outer_orders, outer_order_rows
 
 
-# Rating to package_size mapping
-RATING_MAP = {
-    1: 'סמלי',
-    2: 'מכובד',
-    3: 'מפואר',
-    '1': 'סמלי',
-    '2': 'מכובד',
-    '3': 'מפואר'
-}
+def load_orders_file(filepath):
+    """Read orders from CSV or Excel file in chunks (column names stripped)"""
+    return iter_upload_chunks(filepath)
 
 
-def load_orders_file(filepath):
-    """Load orders from CSV or Excel file"""
-    if filepath.endswith('.csv'):
-        df = pd.read_csv(filepath, encoding='utf-8-sig')
-    else:
-        df = pd.read_excel(filepath)
-    
-    # Clean column names
-    df.columns = df.columns.str.strip()
-    
-    return df
+def insert_orders(conn, chunks):
+    """
+    Insert orders into outerapporder table, one INSERT per chunk
 
+    Orders already in outerapporder (same row_hash) are skipped.
 
-def insert_orders(conn, df):
-    """Insert orders into outerapporder table"""
+    Returns:
+        (rows read, rows inserted)
+    """
     cur = conn.cursor()
     
-    rows_inserted = 0
-    for _, row in df.iterrows():
-        try:
-            # Extract sender_code (order_code)
-            sender_code = str(row.get('order_code', ''))
-            
-            # Extract invitees (guest_list)
-            invitees = str(row.get('guest_list', ''))
-            
-            # Map rating to package_size
-            rating = row.get('rating')
-            package_size = RATING_MAP.get(rating, RATING_MAP.get(str(rating), 'סמלי'))
-            
-            cur.execute("""
-                INSERT INTO outerapporder 
-                (sender_code, invitees, package_size, origin, created_at, status)
-                VALUES (%s, %s, %s, %s, NOW(), 'waiting')
-            """, (
-                sender_code,
-                invitees,
-                package_size,
-                'external_app'
-            ))
-            
-            rows_inserted += 1
-            
-        except Exception as e:
-            print(f"Error inserting order: {e}")
-            continue
-    
-    conn.commit()
-    cur.close()
+    rows_read = rows_inserted = 0
+    try:
+        for df in chunks:
+            rows = outer_order_rows(df)
+            rows_inserted += insert_outer_orders(cur, rows)
+            rows_read += len(rows)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
     
-    return rows_inserted
+    return rows_read, rows_inserted
 
 
 def distribute_orders(conn):
@@ -99,6 +73,28 @@ def distribute_orders(conn):
         cur.close()
 
 
+def get_run_status_counts(conn, after_id):
+    """outerapporder rows per status, for the rows with id > after_id"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT status, COUNT(*)
+        FROM outerapporder
+        WHERE id > %s
+        GROUP BY status
+    """, (after_id,))
+    counts = dict(cur.fetchall())
+    cur.close()
+    return counts
+
+
+def scalar(conn, sql):
+    cur = conn.cursor()
+    cur.execute(sql)
+    value = cur.fetchone()[0]
+    cur.close()
+    return value
+
+
 def get_distribution_stats(conn):
     """Get distribution statistics"""
     cur = conn.cursor()
@@ -131,28 +127,48 @@ def get_distribution_stats(conn):
     return stats, errors
 
 
-def main(filepath):
-    """Main ETL process"""
+def main(filepath, force=False):
+    """Main ETL process (force: import the file even if it was already imported)"""
     print(f"Starting ETL process for orders: {filepath}")
     
-    # Load file
-    print("Loading file...")
-    df = load_orders_file(filepath)
-    print(f"Loaded {len(df)} orders")
-    
-    # Connect to database
+    # Connect to database (timed cursors: the ledger records SQL time per stage)
     print("Connecting to database...")
-    conn = psycopg2.connect(Config.DATABASE_URL)
+    conn = psycopg2.connect(Config.DATABASE_URL, cursor_factory=TimedTupleCursor)
     
     try:
-        # Insert orders
-        print("Inserting orders...")
-        rows_inserted = insert_orders(conn, df)
-        print(f"Inserted {rows_inserted} orders")
-        
-        # Distribute orders
-        distributed = distribute_orders(conn)
-        print(f"Distributed {distributed} order items")
+        # One orders import at a time (web upload jobs take the same lock)
+        with advisory_lock(ORDERS_LOCK, on_wait=lambda: print("Waiting for another orders import to finish...")), \
+                EtlRun.start('orders', 'cli', path=filepath) as run:
+            previous = None if force else run.previous_import()
+            if previous:
+                run.skip(previous)
+                print(f"⏭️ File already imported by ETL run {previous['id']} "
+                      f"({previous['started_at']:%Y-%m-%d %H:%M}); use --force to import it again")
+                return
+            
+            # Insert orders, reading the file chunk by chunk
+            print("Inserting orders...")
+            with run.stage('load_orders') as stage:
+                last_id = scalar(conn, "SELECT COALESCE(MAX(id), 0) FROM outerapporder")
+                rows_read, rows_inserted = insert_orders(conn, load_orders_file(filepath))
+                stage.rows_in = rows_read
+                stage.rows_out = rows_inserted
+            print(f"Inserted {rows_inserted} orders"
+                  + (f" ({rows_read - rows_inserted} already loaded, skipped)" if rows_read > rows_inserted else ''))
+            
+            # Distribute orders
+            waiting = scalar(conn, "SELECT COUNT(*) FROM outerapporder WHERE status = 'waiting'")
+            with run.stage('distribute_all_outer_orders', rows_in=waiting) as stage:
+                distributed = stage.rows_out = distribute_orders(conn)
+                stage.status_counts = get_run_status_counts(conn, last_id)
+            print(f"Distributed {distributed} order items")
+            
+            # Bring the materialized reports up to date
+            with run.stage('refresh_reports'):
+                refresh_reports_after_run('orders distribution')
+            
+            run.stats = {'rows_loaded': rows_inserted, 'rows_already_loaded': rows_read - rows_inserted,
+                         'distributed': distributed}
         
         # Get stats
         stats, errors = get_distribution_stats(conn)
@@ -166,6 +182,10 @@ def main(filepath):
             for severity, reason_code, count in errors:
                 print(f"  {severity} - {reason_code}: {count}")
         
+        print(f"\nStage timings (ETL run {run.id}):")
+        for line in run.summary_lines():
+            print(line)
+        
         print("\n✅ ETL process completed successfully!")
         
     except Exception as e:
@@ -177,14 +197,15 @@ def main(filepath):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python etl_outer_orders.py <filepath>")
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    if len(args) != 1:
+        print("Usage: python etl_outer_orders.py [--force] <filepath>")
         sys.exit(1)
     
-    filepath = sys.argv[1]
+    filepath = args[0]
     
     if not os.path.exists(filepath):
         print(f"Error: File not found: {filepath}")
         sys.exit(1)
     
-    main(filepath)
+    main(filepath, force='--force' in sys.argv[1:])
@@ -3,9 +3,7 @@ ETL Script for Residents CSV/Excel Files
 מערכת ETL לקבצי תושבים
 """
 
-import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
 import sys
 import os
 
@@ -13,80 +11,65 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.config import Config
+from app.reports import refresh_reports_after_run
+from app.bulk_load import load_raw_residents, remember_loaded_rows
+from app.cleaning import clean_resident_values, map_resident_columns
+from app.ingest import iter_upload_chunks
+from app.db import advisory_lock
+from app.etl_ledger import EtlRun
+from app.metrics import TimedTupleCursor
+from app.pipelines import RESIDENTS_LOCK
 
 
 def load_residents_file(filepath):
-    """Load residents from CSV or Excel file"""
-    if filepath.endswith('.csv'):
-        df = pd.read_csv(filepath, encoding='utf-8-sig')
-    else:
-        df = pd.read_excel(filepath)
-    
-    # Clean column names
-    df.columns = df.columns.str.strip()
-    
-    return df
-
-
-def clear_raw_table(conn):
-    """Clear the raw_residents_csv table"""
-    cur = conn.cursor()
-    cur.execute("TRUNCATE TABLE raw_residents_csv RESTART IDENTITY")
-    conn.commit()
-    cur.close()
+    """Read residents from CSV or Excel file in chunks (columns mapped, values cleaned)"""
+    for df in iter_upload_chunks(filepath):
+        map_resident_columns(df)
+        clean_resident_values(df)
+        yield df
 
 
-def insert_to_raw(conn, df):
-    """Insert data into raw_residents_csv table"""
-    cur = conn.cursor()
-    
-    rows_inserted = 0
-    for _, row in df.iterrows():
-        try:
-            cur.execute("""
-                INSERT INTO raw_residents_csv 
-                (code, lastname, father_name, mother_name, streetname, 
-                 buildingnumber, entrance, apartmentnumber, phone, mobile, 
-                 mobile2, email, standing_order)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                str(row.get('code', '')),
-                str(row.get('lastname', '')),
-                str(row.get('father_name', '')),
-                str(row.get('mother_name', '')),
-                str(row.get('streetname', '')),
-                str(row.get('buildingnumber', '')),
-                str(row.get('entrance', '')),
-                str(row.get('apartmentnumber', '')),
-                str(row.get('phone', '')),
-                str(row.get('mobile', '')),
-                str(row.get('mobile2', '')),
-                str(row.get('email', '')),
-                int(row.get('standing_order', 0)) if pd.notna(row.get('standing_order')) else 0
-            ))
-            rows_inserted += 1
-        except Exception as e:
-            print(f"Error inserting row: {e}")
-            continue
-    
-    conn.commit()
-    cur.close()
-    
-    return rows_inserted
-
+def run_etl_procedures(conn, run, raw_rows, resume=False):
+    """
+    Run ETL procedures, one ledger stage each
 
-def run_etl_procedures(conn):
-    """Run ETL procedures"""
+    process_residents_csv runs Config.ETL_BATCH_SIZE rows per committed call,
+    so an interrupted run can resume (resume=True: temp_residents_csv
+    already holds the file, only its pending rows are processed).
+    """
     cur = conn.cursor()
     
     try:
-        print("Running raw_to_temp_stage...")
-        cur.execute("SELECT raw_to_temp_stage()")
-        conn.commit()
+        if resume:
+            cur.execute("""
+                SELECT COUNT(*) FROM temp_residents_csv
+                WHERE status IS NULL OR status = '' OR status = 'ממתין'
+            """)
+            pending = cur.fetchone()[0]
+        else:
+            print("Running raw_to_temp_stage...")
+            with run.stage('raw_to_temp_stage', rows_in=raw_rows) as stage:
+                cur.execute("SELECT raw_to_temp_stage()")
+                pending = stage.rows_out = cur.fetchone()[0]
+                conn.commit()
+            cur.execute("SELECT temp_residents_fingerprint()")
+            run.record_temp(cur.fetchone()[0])
+            conn.commit()
         
-        print("Running process_residents_csv...")
-        cur.execute("SELECT process_residents_csv()")
-        conn.commit()
+        print(f"Running process_residents_csv ({pending} rows)...")
+        with run.stage('process_residents_csv', rows_in=pending) as stage:
+            processed = 0
+            while True:
+                cur.execute("SELECT process_residents_csv(%s)", (Config.ETL_BATCH_SIZE,))
+                batch = cur.fetchone()[0]
+                conn.commit()
+                if not batch:
+                    break
+                processed += batch
+            stage.rows_out = processed
+            stage.status_counts = dict(get_processing_stats(conn))
+            remember_loaded_rows(cur, run.id)
+            conn.commit()
         
         print("ETL procedures completed successfully!")
         
@@ -98,16 +81,25 @@ def run_etl_procedures(conn):
         cur.close()
 
 
+def scalar(conn, sql):
+    cur = conn.cursor()
+    cur.execute(sql)
+    value = cur.fetchone()[0]
+    cur.close()
+    conn.commit()
+    return value
+
+
 def get_processing_stats(conn):
     """Get statistics about the processing"""
     cur = conn.cursor()
     
     cur.execute("""
         SELECT 
-            status,
+            COALESCE(NULLIF(status, ''), 'ממתין') AS status,
             COUNT(*) as count
         FROM temp_residents_csv
-        GROUP BY status
+        GROUP BY 1
     """)
     
     stats = cur.fetchall()
@@ -116,38 +108,70 @@ def get_processing_stats(conn):
     return stats
 
 
-def main(filepath):
-    """Main ETL process"""
+def main(filepath, force=False):
+    """
+    Main ETL process
+
+    Unless force is set, a file that was already imported is skipped, rows
+    an earlier import merged or inserted are not loaded again, and an
+    interrupted run of the same file is resumed.
+    """
     print(f"Starting ETL process for: {filepath}")
     
-    # Load file
-    print("Loading file...")
-    df = load_residents_file(filepath)
-    print(f"Loaded {len(df)} rows")
-    
-    # Connect to database
+    # Connect to database (timed cursors: the ledger records SQL time per stage)
     print("Connecting to database...")
-    conn = psycopg2.connect(Config.DATABASE_URL)
+    conn = psycopg2.connect(Config.DATABASE_URL, cursor_factory=TimedTupleCursor)
     
     try:
-        # Clear raw table
-        print("Clearing raw table...")
-        clear_raw_table(conn)
+        # One residents import at a time (web upload jobs take the same lock)
+        with advisory_lock(RESIDENTS_LOCK, on_wait=lambda: print("Waiting for another residents import to finish...")), \
+                EtlRun.start('residents', 'cli', path=filepath) as run:
+            previous = None if force else run.previous_import()
+            if previous:
+                run.skip(previous)
+                print(f"⏭️ File already imported by ETL run {previous['id']} "
+                      f"({previous['started_at']:%Y-%m-%d %H:%M}); use --force to import it again")
+                return
+            
+            interrupted = None if force else run.interrupted_run()
+            if interrupted and scalar(conn, "SELECT temp_residents_fingerprint()") != interrupted['temp_fingerprint']:
+                print(f"⚠️ temp_residents_csv no longer holds the rows of interrupted ETL run "
+                      f"{interrupted['id']}; loading the file again")
+                interrupted = None
+            if interrupted:
+                run.resume(interrupted)
+                print(f"↩️ Resuming interrupted ETL run {interrupted['id']}")
+                load_stats = {'rows': 0, 'skipped': 0}
+                run_etl_procedures(conn, run, 0, resume=True)
+            else:
+                # Clear raw table and bulk load the file chunk by chunk
+                print("Loading file to raw table...")
+                with run.stage('load_raw') as stage:
+                    load_stats = load_raw_residents(conn, load_residents_file(filepath), skip_loaded=not force)
+                    stage.rows_out = load_stats['rows']
+                print(f"Inserted {load_stats['rows']} rows in {load_stats['chunks']} chunks "
+                      f"({load_stats['rows_per_sec']} rows/sec)")
+                
+                # Run ETL procedures
+                run_etl_procedures(conn, run, load_stats['rows'])
+            
+            # Bring the materialized reports up to date
+            with run.stage('refresh_reports'):
+                refresh_reports_after_run('residents ETL')
+            
+            # Get stats
+            stats = get_processing_stats(conn)
+            run.stats = {'rows_loaded': load_stats['rows'], 'rows_already_loaded': load_stats['skipped'],
+                         'resumed_from': run.resumed_from, **dict(stats)}
         
-        # Insert to raw table
-        print("Inserting data to raw table...")
-        rows_inserted = insert_to_raw(conn, df)
-        print(f"Inserted {rows_inserted} rows")
-        
-        # Run ETL procedures
-        run_etl_procedures(conn)
-        
-        # Get stats
-        stats = get_processing_stats(conn)
         print("\nProcessing Statistics:")
         for status, count in stats:
             print(f"  {status}: {count}")
         
+        print(f"\nStage timings (ETL run {run.id}):")
+        for line in run.summary_lines():
+            print(line)
+        
         print("\n✅ ETL process completed successfully!")
         
     except Exception as e:
@@ -159,14 +183,15 @@ def main(filepath):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python etl_residents.py <filepath>")
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    if len(args) != 1:
+        print("Usage: python etl_residents.py [--force] <filepath>")
         sys.exit(1)
     
-    filepath = sys.argv[1]
+    filepath = args[0]
     
     if not os.path.exists(filepath):
         print(f"Error: File not found: {filepath}")
         sys.exit(1)
     
-    main(filepath)
+    main(filepath, force='--force' in sys.argv[1:])
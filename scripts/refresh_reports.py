@@ -0,0 +1,26 @@
+"""
+Refresh the materialized report views (mv_*)
+רענון שכבת הדוחות
+
+Run from cron for a scheduled refresh, e.g. every 10 minutes:
+    */10 * * * * cd /app && python scripts/refresh_reports.py
+"""
+
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.reports import refresh_reports
+
+
+def main(view_name=None):
+    """Refresh all report copies (or one) and print the timings"""
+    for row in refresh_reports(view_name):
+        print(f"  {row['view_name']}: {row['row_count']} rows in {row['duration_ms']}ms")
+    print("\n✅ Reports refreshed")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -2,8 +2,13 @@
 API Tests for Mishloach Manot System
 """
 
+import csv
+import io
+
 import pytest
 
+from app.utils import stream_view_csv
+
 
 def test_home_redirect(client):
     """Test homepage redirects to login"""
@@ -100,6 +105,47 @@ def test_api_table_data(authenticated_client):
     assert 'total' in data
 
 
+def test_api_table_data_keyset(authenticated_client):
+    """Keyset pages follow next_cursor / prev_cursor without overlap"""
+    first = authenticated_client.get('/api/table-data/Order?limit=5&order_by=package_size desc').get_json()
+    assert first['pagination'] == 'keyset'
+    assert first['prev_cursor'] is None
+    assert first['next_cursor']
+
+    second = authenticated_client.get(
+        '/api/table-data/Order',
+        query_string={'limit': 5, 'order_by': 'package_size desc', 'cursor': first['next_cursor']}
+    ).get_json()
+    assert not {row['id'] for row in first['data']} & {row['id'] for row in second['data']}
+
+    back = authenticated_client.get(
+        '/api/table-data/Order',
+        query_string={'limit': 5, 'order_by': 'package_size desc', 'before': second['prev_cursor']}
+    ).get_json()
+    assert [row['id'] for row in back['data']] == [row['id'] for row in first['data']]
+
+
+def test_api_table_data_estimated_count(authenticated_client, monkeypatch):
+    """Large tables report reltuples unless an exact count is requested"""
+    import app.utils
+    monkeypatch.setattr(app.utils, 'APPROX_COUNT_THRESHOLD', 0)
+
+    data = authenticated_client.get('/api/table-data/person?limit=1').get_json()
+    assert data['total_is_estimate'] is True
+
+    data = authenticated_client.get('/api/table-data/person?limit=1&exact_count=1').get_json()
+    assert data['total_is_estimate'] is False
+
+
+def test_api_table_data_rejects_bad_input(authenticated_client):
+    """Unknown sort columns and tampered cursors are rejected"""
+    response = authenticated_client.get('/api/table-data/person?order_by=personid;drop')
+    assert response.status_code == 400
+
+    response = authenticated_client.get('/api/table-data/person?cursor=bm90LWEtY3Vyc29y')
+    assert response.status_code == 400
+
+
 def test_api_view_data(authenticated_client):
     """Test view data API"""
     response = authenticated_client.get('/api/view-data/v_families_balance')
@@ -124,3 +170,108 @@ def test_invalid_view_data(authenticated_client):
     """Test API with invalid view"""
     response = authenticated_client.get('/api/view-data/nonexistent_view')
     assert response.status_code == 400
+
+
+def test_api_pool_stats(authenticated_client):
+    """Test connection pool statistics API"""
+    response = authenticated_client.get('/api/pool-stats')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['initialized'] is True
+    assert data['checkouts'] > 0
+    assert data['in_use'] == 0
+
+
+def test_export_view_streams_csv(authenticated_client, db_connection):
+    """Test view export streams every row with a BOM and header"""
+    response = authenticated_client.get('/api/export-view/v_orders_details')
+    assert response.status_code == 200
+    assert response.is_streamed
+    body = response.get_data()
+    assert body.startswith(b'\xef\xbb\xbf')
+
+    cur = db_connection.cursor()
+    cur.execute('SELECT COUNT(*) FROM v_orders_details')
+    total = cur.fetchone()[0]
+    cur.close()
+    rows = list(csv.reader(io.StringIO(body.decode('utf-8-sig'))))
+    assert len(rows) == total + 1
+
+
+def test_stream_view_csv_batches():
+    """Test batches of the streamed export add up to the whole view"""
+    chunks = list(stream_view_csv('v_orders_details', batch_size=100))
+    rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+    # One chunk per batch; only the first carries the BOM
+    assert len(chunks) == -(-(len(rows) - 1) // 100)
+    assert not any(chunk.startswith(b'\xef\xbb\xbf') for chunk in chunks[1:])
+
+    with pytest.raises(ValueError):
+        next(stream_view_csv('nonexistent_view'))
+
+
+def test_view_data_keyset_pages(authenticated_client, db_connection):
+    """Test keyset pages of a keyed view cover every row exactly once"""
+    ids = []
+    params = {'limit': 100}
+    while True:
+        data = authenticated_client.get('/api/view-data/v_orders_details', query_string=params).get_json()
+        assert data['pagination'] == 'keyset'
+        assert [col['name'] for col in data['columns']][0] == 'id'
+        ids.extend(row['id'] for row in data['data'])
+        if not data['next_cursor']:
+            break
+        params = {'limit': 100, 'cursor': data['next_cursor']}
+
+    cur = db_connection.cursor()
+    cur.execute('SELECT id FROM v_orders_details')
+    assert sorted(ids) == sorted(row[0] for row in cur.fetchall())
+    cur.close()
+
+
+def test_view_data_offset_and_filter(authenticated_client):
+    """Test views without a key page by offset, and column filters apply"""
+    data = authenticated_client.get('/api/view-data/v_packages_per_building?limit=5').get_json()
+    assert data['pagination'] == 'offset'
+    assert len(data['data']) <= 5
+    assert data['has_more'] == (data['total'] > 5)
+
+    data = authenticated_client.get(
+        '/api/view-data/v_orders_details?filter[origin_type]=autoreturn&limit=20'
+    ).get_json()
+    assert data['data']
+    assert {row['origin_type'] for row in data['data']} == {'autoreturn'}
+
+    response = authenticated_client.get('/api/view-data/v_orders_details?filter[nope]=1')
+    assert response.status_code == 400
+
+
+def test_view_data_estimated_total(authenticated_client, monkeypatch):
+    """Test large views report the planner's row estimate unless exact_count is asked"""
+    monkeypatch.setattr('app.utils.APPROX_COUNT_THRESHOLD', 1)
+    data = authenticated_client.get('/api/view-data/v_orders_details?limit=1').get_json()
+    assert data['total_is_estimate'] is True
+    assert data['total'] > 0
+
+    data = authenticated_client.get('/api/view-data/v_orders_details?limit=1&exact_count=1').get_json()
+    assert data['total_is_estimate'] is False
+
+
+def test_dashboard_stats_cached(authenticated_client, monkeypatch):
+    """Test dashboard counters come from one cached query until invalidated"""
+    from app import dashboard
+
+    calls = []
+    load = dashboard._load_stats
+    monkeypatch.setattr(dashboard, '_load_stats', lambda: calls.append(1) or load())
+    dashboard.invalidate_dashboard_stats()
+
+    assert authenticated_client.get('/dashboard').status_code == 200
+    stats = dashboard.get_dashboard_stats()
+    assert len(calls) == 1
+    assert {'total_residents', 'total_orders', 'pending_orders', 'autoreturn_count',
+            'raw_count', 'temp_count', 'skipped', 'pending'} <= stats.keys()
+
+    dashboard.invalidate_dashboard_stats()
+    dashboard.get_dashboard_stats()
+    assert len(calls) == 2
@@ -0,0 +1,47 @@
+"""
+Tests for the benchmark helpers (synthetic data, result comparison)
+"""
+
+from app.cleaning import clean_resident_values, map_resident_columns
+from app.ingest import iter_upload_chunks
+from app.pipelines import outer_order_rows
+from benchmarks.compare import compare
+from benchmarks.synthetic import generate_city
+
+
+def test_generate_city_files(tmp_path):
+    """Generated files go through the upload readers like the real exports"""
+    city = generate_city(str(tmp_path), 300, seed=7)
+    again = generate_city(str(tmp_path / 'again'), 300, seed=7)
+    assert open(city['residents_path'], 'rb').read() == open(again['residents_path'], 'rb').read()
+
+    residents = next(iter_upload_chunks(city['residents_path']))
+    map_resident_columns(residents)
+    clean_resident_values(residents)
+    assert len(residents) == city['resident_rows'] >= 300
+    assert residents['code'].nunique() == 300
+    assert residents['entrance'].isna().mean() > 0.5          # "אין" became None
+    assert residents.drop_duplicates('code')[['streetname', 'buildingnumber', 'apartmentnumber']] \
+        .dropna().duplicated().sum() == 0                      # one household per apartment
+
+    orders = next(iter_upload_chunks(city['orders_path']))
+    rows = outer_order_rows(orders)
+    assert len(rows) == city['order_rows'] > 0
+    assert all(set(invitees.split('|')) <= set(residents['code']) for _, invitees, _, _ in rows)
+    assert {size for _, _, size, _ in rows} <= {'סמלי', 'מכובד', 'מפואר'}
+
+
+def test_compare_flags_regressions():
+    """Slower stages over the threshold are regressions; tiny stages are ignored"""
+    def result(**stages):
+        return {'runs': [{'households': 1000,
+                          'stages': {k: {'seconds': v} for k, v in stages.items()}}]}
+
+    rows = compare(result(raw_load=1.0, distribute=2.0, parse=0.01),
+                   result(raw_load=1.5, distribute=2.1, parse=0.03, extra=1.0))
+
+    by_stage = {r['stage']: r for r in rows}
+    assert set(by_stage) == {'raw_load', 'distribute', 'parse'}
+    assert by_stage['raw_load']['regression']
+    assert not by_stage['distribute']['regression']
+    assert not by_stage['parse']['regression']
@@ -0,0 +1,76 @@
+"""
+Bulk Loader Tests for raw_residents_csv
+"""
+
+import pandas as pd
+import pytest
+from app.bulk_load import load_raw_residents, iter_raw_rows, safe_int
+from app.ingest import row_hash
+
+
+@pytest.fixture
+def residents_df():
+    """Small cleaned residents frame with pandas-style numeric columns"""
+    return pd.DataFrame({
+        'code': [101.0, None, 103.0],
+        'lastname': ['כהן', 'לוי', 'tab\there'],
+        'father_name': ['משה', None, 'דוד'],
+        'streetname': ['באר שבע', 'הירקון', 'הרב קוק'],
+        'buildingnumber': ['1', '2', '3'],
+        'apartmentnumber': ['4', '5', '6'],
+        'mobile': [501234567.0, None, 521111111.0],
+        'standing_order': [1, 'אין', None],
+    })
+
+
+def test_iter_raw_rows(residents_df):
+    """Test rows are converted to raw_residents_csv text values"""
+    rows = list(iter_raw_rows(residents_df))
+    assert len(rows) == 3
+    assert rows[0][0] == '101'
+    assert rows[1][0] is None
+    assert rows[0][9] == '501234567'
+    assert rows[0][2] == 'משה'
+    assert rows[1][2] is None
+    assert [row[-2] for row in rows] == [1, 0, 0]
+    assert rows[0][-1] == row_hash(rows[0][:-1])
+
+
+def test_safe_int():
+    """Test standing_order conversion"""
+    assert safe_int('2') == 2
+    assert safe_int(' ללא ') == 0
+    assert safe_int(float('nan')) == 0
+    assert safe_int('abc', default=3) == 3
+
+
+def test_load_raw_residents_copy(db_connection, residents_df):
+    """Test COPY load into raw_residents_csv"""
+    stats = load_raw_residents(db_connection, residents_df)
+    assert stats['rows'] == 3
+    assert stats['method'] == 'copy'
+
+    cur = db_connection.cursor()
+    cur.execute("SELECT code, lastname, mobile, entrance FROM raw_residents_csv ORDER BY raw_id")
+    rows = cur.fetchall()
+    assert rows[0] == ('101', 'כהן', '501234567', None)
+    assert rows[2][1] == 'tab\there'
+    cur.close()
+
+
+def test_load_raw_residents_fallback(db_connection, residents_df, monkeypatch):
+    """Test execute_values fallback when COPY fails"""
+    import app.bulk_load as bulk_load
+
+    def failing_copy(cur, rows):
+        cur.execute("SELECT 1/0")
+
+    monkeypatch.setattr(bulk_load, '_copy_rows', failing_copy)
+    stats = load_raw_residents(db_connection, residents_df)
+    assert stats['method'] == 'execute_values'
+    assert stats['rows'] == 3
+
+    cur = db_connection.cursor()
+    cur.execute("SELECT COUNT(*) FROM raw_residents_csv")
+    assert cur.fetchone()[0] == 3
+    cur.close()
@@ -0,0 +1,46 @@
+"""
+Tests for resident file cleaning (app/cleaning.py)
+"""
+
+import pandas as pd
+
+from app.bulk_load import safe_int
+from app.cleaning import clean_resident_values, map_resident_columns, standing_order_values
+
+
+def test_map_resident_columns():
+    """Known spellings are renamed, unknown columns kept"""
+    df = pd.DataFrame(columns=[' Last_Name ', 'rating', 'notes'])
+    mapped = map_resident_columns(df)
+    assert list(df.columns) == ['lastname', 'standing_order', 'notes']
+    assert mapped == {'Last_Name': 'lastname', 'rating': 'standing_order'}
+
+
+def test_clean_resident_values():
+    """"No value" spellings become None in text columns only"""
+    df = pd.DataFrame({
+        'lastname': ['כהן', ' אין ', 'NONE', '', None, float('nan')],
+        'phone': ['0501234567', 'ללא דירה', 'Nan', 5, 'אין מספר', '  '],
+        'notes': ['אין'] * 6,
+    })
+    clean_resident_values(df)
+
+    assert df['lastname'].tolist() == ['כהן', None, None, None, None, None]
+    assert df['phone'].tolist() == ['0501234567', None, None, 5, 'אין מספר', None]
+    assert df['notes'].tolist() == ['אין'] * 6
+
+
+def test_clean_numeric_column_untouched():
+    """Columns pandas read as numbers keep their values (NaN is handled by to_text)"""
+    df = pd.DataFrame({'mobile': [501234567.0, None]})
+    clean_resident_values(df)
+    assert df['mobile'].iloc[0] == 501234567.0
+    assert pd.isna(df['mobile'].iloc[1])
+
+
+def test_standing_order_values_match_safe_int():
+    """Whole-column conversion gives what safe_int gives per cell"""
+    values = [1, '2', ' 3 ', '2.7', 2.9, 'ללא', ' אין ', 'abc', '', None, float('nan'), True]
+    series = pd.Series(values, dtype=object)
+    assert standing_order_values(series) == [safe_int(v) for v in values]
+    assert standing_order_values(pd.Series([1.0, None])) == [1, 0]
@@ -0,0 +1,55 @@
+"""
+Connection Pool Tests
+"""
+
+import pytest
+from app.config import Config
+from app.db import ConnectionPool, PoolTimeoutError
+
+
+@pytest.fixture
+def small_pool():
+    """Pool with a single connection for exhaustion tests"""
+    pool = ConnectionPool(Config.DATABASE_URL, minconn=1, maxconn=1,
+                          timeout=0.2, healthcheck_interval=0)
+    yield pool
+    pool.closeall()
+
+
+def test_connection_is_reused(small_pool):
+    """Test a returned connection is handed out again"""
+    conn = small_pool.getconn()
+    small_pool.putconn(conn)
+    assert small_pool.getconn() is conn
+
+
+def test_pool_timeout(small_pool):
+    """Test checkout waits and then fails when the pool is exhausted"""
+    conn = small_pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        small_pool.getconn()
+    small_pool.putconn(conn)
+    assert small_pool.stats()['timeouts'] == 1
+
+
+def test_dead_connection_replaced(small_pool):
+    """Test a closed connection fails the health check and is replaced"""
+    conn = small_pool.getconn()
+    conn.close()
+    small_pool.putconn(conn)
+    fresh = small_pool.getconn()
+    assert not fresh.closed
+    cur = fresh.cursor()
+    cur.execute('SELECT 1 AS one')
+    assert cur.fetchone()['one'] == 1
+    small_pool.putconn(fresh)
+
+
+def test_open_transaction_rolled_back(small_pool):
+    """Test connections come back from the pool outside a transaction"""
+    conn = small_pool.getconn()
+    conn.cursor().execute('SELECT 1')
+    small_pool.putconn(conn)
+    conn = small_pool.getconn()
+    assert conn.info.transaction_status == 0
+    small_pool.putconn(conn)
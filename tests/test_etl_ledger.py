@@ -0,0 +1,115 @@
+"""
+Tests for the ETL run ledger (app/etl_ledger.py)
+"""
+
+import hashlib
+import io
+
+import pytest
+
+from app.db import get_cursor
+from app.etl_ledger import EtlRun, history
+from app.jobs import wait_for_job
+
+
+def stages_of(run_id):
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM etl_run_stages WHERE run_id = %s ORDER BY seq", (run_id,))
+        return cur.fetchall()
+
+
+def run_row(run_id):
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM etl_runs WHERE id = %s", (run_id,))
+        return cur.fetchone()
+
+
+def test_run_records_stages(tmp_path):
+    """File hash, stage timings, SQL time and rows per status end up in the ledger"""
+    path = tmp_path / 'residents.csv'
+    path.write_bytes('lastname\nכהן\n'.encode('utf-8'))
+
+    with EtlRun.start('test_ledger', 'cli', path=str(path)) as run:
+        with run.stage('count', rows_in=3) as stage:
+            with get_cursor() as cur:
+                cur.execute("SELECT pg_sleep(0.01), 2 AS n")
+                stage.rows_out = cur.fetchone()['n']
+            stage.status_counts = {'הופץ': 2}
+        run.stats = {'rows': 2}
+
+    row = run_row(run.id)
+    assert row['status'] == 'succeeded'
+    assert row['source'] == 'cli'
+    assert row['filename'] == 'residents.csv'
+    assert row['file_hash'] == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert row['file_size'] == path.stat().st_size
+    assert row['stats'] == {'rows': 2}
+    assert row['persons_before'] is not None and row['persons_after'] is not None
+
+    [stage] = stages_of(run.id)
+    assert (stage['stage'], stage['rows_in'], stage['rows_out']) == ('count', 3, 2)
+    assert stage['status_counts'] == {'הופץ': 2}
+    assert stage['queries'] == 1
+    assert 10 <= float(stage['db_ms']) <= float(stage['duration_ms'])
+
+
+def test_failed_stage_fails_run():
+    """An exception marks the stage and the run failed and is re-raised"""
+    with pytest.raises(ValueError):
+        with EtlRun.start('test_ledger', 'web') as run:
+            with run.stage('explode'):
+                raise ValueError('bad row')
+
+    assert run_row(run.id)['status'] == 'failed'
+    assert run_row(run.id)['error'] == 'bad row'
+    [stage] = stages_of(run.id)
+    assert (stage['status'], stage['error']) == ('failed', 'bad row')
+
+
+def test_history_flags_slower_stage():
+    """A stage whose time per 1000 rows jumps against earlier runs is flagged"""
+    kind = 'test_history'
+    with get_cursor(commit=True) as cur:
+        cur.execute("DELETE FROM etl_runs WHERE kind = %s", (kind,))
+        for i, (rows, ms) in enumerate([(1000, 100), (2000, 210), (4000, 390), (4000, 1600)]):
+            cur.execute("""
+                INSERT INTO etl_runs (kind, source, status, started_at)
+                VALUES (%s, 'cli', 'succeeded', NOW() - make_interval(mins => %s))
+                RETURNING id
+            """, (kind, 10 - i))
+            run_id = cur.fetchone()['id']
+            cur.execute("""
+                INSERT INTO etl_run_stages
+                (run_id, seq, stage, status, rows_in, duration_ms, db_ms, started_at, finished_at)
+                VALUES (%s, 1, 'process', 'succeeded', %s, %s, %s, NOW(), NOW())
+            """, (run_id, rows, ms, ms))
+
+    runs, names = history(kind)
+    assert names == ['process']
+    latest, *earlier = [run['stage_map']['process'] for run in runs]
+    assert latest['regressed'] and latest['ratio'] == 4.0
+    assert not any(stage['regressed'] for stage in earlier)
+
+
+def test_orders_import_job_records_run(authenticated_client):
+    """Web uploads record their run, linked to the job, and show on the history page"""
+    response = authenticated_client.post(
+        '/import-orders-direct',
+        # force: the same file is uploaded by other tests (unchanged files are skipped)
+        data={'file': (io.BytesIO('order_code,guest_list\n93997,93996\n'.encode('utf-8-sig')), 'הזמנות.csv'),
+              'force': '1'},
+        content_type='multipart/form-data',
+        headers={'Accept': 'application/json'}
+    )
+    job_id = response.get_json()['job_id']
+    assert wait_for_job(job_id)['status'] == 'succeeded'
+
+    runs = authenticated_client.get('/api/etl-runs?kind=orders_import').get_json()['runs']
+    run = next(run for run in runs if run['job_id'] == job_id)
+    assert (run['source'], run['status'], run['filename']) == ('web', 'succeeded', 'הזמנות.csv')
+    assert [stage['stage'] for stage in run['stages']] == ['import_orders', 'refresh_reports']
+    assert run['stages'][0]['rows_in'] == 1
+
+    page = authenticated_client.get('/etl-history?kind=orders_import')
+    assert page.status_code == 200
+    assert 'import_orders'.encode('utf-8') in page.data
@@ -0,0 +1,138 @@
+"""
+ETL Tests for Outer Orders Distribution
+"""
+
+import pytest
+
+
+@pytest.fixture
+def outer_people(db_connection):
+    """Two residents with codes used as sender / invitee"""
+    cur = db_connection.cursor()
+    cur.execute("""
+        DELETE FROM "Order" o USING person p
+        WHERE p.code IN (90001, 90002)
+          AND p.personid IN (o.delivery_sender_id, o.delivery_getter_id)
+    """)
+    cur.execute("DELETE FROM person WHERE code IN (90001, 90002)")
+    cur.execute("""
+        INSERT INTO person (code, lastname, father_name, streetcode, buildingnumber,
+                            apartmentnumber, phone, autoreturn)
+        VALUES (90001, 'שולח', 'אב', 1, '91', '1', '025559101', false),
+               (90002, 'מקבל', 'אב', 1, '92', '1', '025559201', false)
+        RETURNING personid
+    """)
+    ids = [row[0] for row in cur.fetchall()]
+    cur.execute("UPDATE outerapporder SET status = 'distributed' WHERE status = 'waiting'")
+    db_connection.commit()
+    cur.close()
+    return ids
+
+
+def test_distribute_all_outer_orders(db_connection, outer_people):
+    """Waiting outer orders are distributed or marked as errors"""
+    sender_id, getter_id = outer_people
+    cur = db_connection.cursor()
+
+    cur.execute("""
+        INSERT INTO outerapporder (sender_code, invitees, package_size)
+        VALUES ('90001', %s, 'S'),
+               ('90001', '', 'S'),
+               ('no-such-code', %s, 'S'),
+               ('90001', '999999999|x', 'S')
+        RETURNING id
+    """, (f'{getter_id}| {getter_id} |x', str(getter_id)))
+    ok_id, empty_id, no_sender_id, no_rows_id = [row[0] for row in cur.fetchall()]
+    db_connection.commit()
+
+    cur.execute("SELECT distribute_all_outer_orders()")
+    total = cur.fetchone()[0]
+    db_connection.commit()
+
+    assert total == 1
+
+    cur.execute("""
+        SELECT id, status FROM outerapporder WHERE id = ANY(%s) ORDER BY id
+    """, ([ok_id, empty_id, no_sender_id, no_rows_id],))
+    assert cur.fetchall() == [
+        (ok_id, 'distributed'),
+        (empty_id, 'error'),
+        (no_sender_id, 'error'),
+        (no_rows_id, 'error'),
+    ]
+
+    cur.execute("""
+        SELECT delivery_sender_id, delivery_getter_id, origin_type
+        FROM "Order" WHERE origin_outer_id = %s AND origin_type = 'invitees'
+    """, (ok_id,))
+    assert cur.fetchall() == [(sender_id, getter_id, 'invitees')]
+
+    cur.execute("""
+        SELECT outer_id, reason_code FROM outerapporder_error_log
+        WHERE outer_id = ANY(%s) ORDER BY outer_id
+    """, ([empty_id, no_sender_id, no_rows_id],))
+    assert cur.fetchall() == [(empty_id, 'no_invitees'), (no_sender_id, 'missing_sender')]
+
+    cur.close()
+
+
+def test_out_of_range_invitee_is_logged(db_connection, outer_people):
+    """An invitee too large for a person id is logged; the order's other invitees are distributed"""
+    sender_id, getter_id = outer_people
+    cur = db_connection.cursor()
+
+    cur.execute("""
+        INSERT INTO outerapporder (sender_code, invitees, package_size)
+        VALUES ('90001', %s, 'S')
+        RETURNING id
+    """, (f'{getter_id}|99999999999',))
+    outer_id = cur.fetchone()[0]
+    db_connection.commit()
+
+    cur.execute("SELECT distribute_all_outer_orders()")
+    assert cur.fetchone()[0] == 1
+    db_connection.commit()
+
+    cur.execute("SELECT status FROM outerapporder WHERE id = %s", (outer_id,))
+    assert cur.fetchone()[0] == 'distributed'
+    cur.execute("""
+        SELECT severity, reason_code, details ->> 'invitee' FROM outerapporder_error_log
+        WHERE outer_id = %s
+    """, (outer_id,))
+    assert cur.fetchall() == [('error', 'invalid_invitee', '99999999999')]
+
+    cur.close()
+
+
+def test_autoreturn_statement_trigger(db_connection, outer_people):
+    """A bulk insert creates reverse orders only where the pair is new"""
+    sender_id, getter_id = outer_people
+    cur = db_connection.cursor()
+
+    cur.execute("UPDATE person SET autoreturn = true WHERE personid = %s", (getter_id,))
+    cur.execute("""
+        INSERT INTO "Order" (delivery_sender_id, delivery_getter_id, order_date,
+                             origin_type, package_size, price)
+        VALUES (%s, %s, CURRENT_DATE, 'manual', 'S', 10)
+        RETURNING id
+    """, (sender_id, getter_id))
+    to_getter = cur.fetchone()[0]
+
+    cur.execute("""
+        SELECT origin_outer_id, delivery_sender_id, delivery_getter_id
+        FROM "Order"
+        WHERE origin_type = 'autoreturn' AND origin_outer_id = %s
+    """, (to_getter,))
+    assert cur.fetchall() == [(to_getter, getter_id, sender_id)]
+
+    # The reverse pair already exists, so a second insert adds nothing
+    cur.execute("""
+        INSERT INTO "Order" (delivery_sender_id, delivery_getter_id, order_date,
+                             origin_type, package_size, price)
+        VALUES (%s, %s, CURRENT_DATE, 'manual', 'S', 10)
+        ON CONFLICT DO NOTHING
+    """, (getter_id, sender_id))
+    assert cur.rowcount == 0
+
+    db_connection.rollback()
+    cur.close()
@@ -2,8 +2,13 @@
 ETL Tests for Residents Processing
 """
 
+import json
+
+import psycopg2
 import pytest
 
+from app.config import Config
+
 
 def test_raw_to_temp_stage(db_connection):
     """Test raw_to_temp_stage function"""
@@ -155,3 +160,105 @@ def test_person_archive(db_connection):
     assert count > 0
     
     cur.close()
+
+
+def test_process_residents_csv_duplicates_in_file(db_connection):
+    """Rows later in the file see residents inserted by earlier rows"""
+    cur = db_connection.cursor()
+
+    cur.execute("TRUNCATE TABLE temp_residents_csv RESTART IDENTITY CASCADE")
+    cur.execute("DELETE FROM person WHERE lastname = 'כפול'")
+    cur.execute("""
+        INSERT INTO temp_residents_csv
+        (lastname, father_name, mother_name, streetname, streetcode, buildingnumber,
+         apartmentnumber, phone, mobile, mobile2, standing_order)
+        VALUES
+        ('כפול', 'אב', NULL, 'באר שבע', 1, '77', '7', '025557701', NULL, NULL, 0),
+        ('כפול', 'אב', 'אם', 'באר שבע', 1, '77', '7', '025557701', NULL, '0527770001', 2),
+        ('אחר', NULL, NULL, 'באר שבע', 1, '78', '8', '025557801', NULL, NULL, 0)
+    """)
+    db_connection.commit()
+
+    cur.execute("SELECT process_residents_csv()")
+    processed = cur.fetchone()[0]
+    db_connection.commit()
+
+    assert processed == 3
+
+    cur.execute("SELECT status FROM temp_residents_csv ORDER BY temp_id")
+    assert [row[0] for row in cur.fetchall()] == ['הופץ', 'אוחד', 'נדחה']
+
+    cur.execute("""
+        SELECT status, personid_target FROM person_archive
+        WHERE temp_id IN (1, 2) ORDER BY archive_id DESC LIMIT 2
+    """)
+    merged, inserted = cur.fetchall()
+    assert (inserted[0], merged[0]) == ('inserted', 'merged')
+    assert inserted[1] == merged[1]
+
+    cur.execute("""
+        SELECT mother_name, mobile2, standing_order FROM person WHERE personid = %s
+    """, (inserted[1],))
+    assert cur.fetchone() == ('אם', '0527770001', 2)
+
+    cur.close()
+
+
+def test_person_phone_norm_columns(db_connection):
+    """Normalized phone columns follow format_il_phone"""
+    cur = db_connection.cursor()
+
+    cur.execute("""
+        INSERT INTO person (lastname, father_name, streetcode, buildingnumber,
+                            apartmentnumber, phone, mobile, mobile2)
+        VALUES ('נרמול', 'אב', 1, '88', '8', '5558801', '972-52-7778801', NULL)
+        RETURNING phone_norm, mobile_norm, mobile2_norm
+    """)
+    assert cur.fetchone() == ('025558801', '0527778801', None)
+
+    db_connection.rollback()
+    cur.close()
+
+
+def test_process_residents_csv_in_batches(db_connection):
+    """p_limit processes the oldest pending rows and reports them on etl_progress"""
+    listener = psycopg2.connect(Config.DATABASE_URL)
+    listener.autocommit = True
+    listener.cursor().execute("LISTEN etl_progress")
+
+    cur = db_connection.cursor()
+    cur.execute("TRUNCATE temp_residents_csv RESTART IDENTITY")
+    cur.execute("DELETE FROM person WHERE lastname = 'באצ''ים'")
+    cur.execute("""
+        INSERT INTO temp_residents_csv
+        (lastname, father_name, streetname, streetcode, buildingnumber, apartmentnumber, phone)
+        SELECT 'באצ''ים', 'אב' || g, 'באר שבע', 1, '7' || g, '1', '0277700' || g
+        FROM generate_series(1, 3) g
+    """)
+    db_connection.commit()
+
+    batches = []
+    while True:
+        cur.execute("SELECT set_config('etl.job_id', '42', true)")
+        cur.execute("SELECT process_residents_csv(2)")
+        batches.append(cur.fetchone()[0])
+        db_connection.commit()
+        if not batches[-1]:
+            break
+    assert batches == [2, 1, 0]
+
+    cur.execute("SELECT COUNT(*) FROM person WHERE lastname = 'באצ''ים'")
+    assert cur.fetchone()[0] == 3
+
+    listener.poll()
+    events = [json.loads(n.payload) for n in listener.notifies]
+    assert [(e['job_id'], e['stage'], e['rows'], e['remaining']) for e in events] == [
+        (42, 'process_residents_csv', 2, 1),
+        (42, 'process_residents_csv', 1, 0),
+        (42, 'process_residents_csv', 0, 0),
+    ]
+
+    cur.execute("DELETE FROM person WHERE lastname = 'באצ''ים'")
+    db_connection.commit()
+    cur.close()
+    listener.close()
@@ -0,0 +1,47 @@
+"""
+Tests for live job events (app/events.py)
+"""
+
+import json
+import threading
+import time
+
+from app import events
+from app.events import _publish, stream_job_events
+
+JOB_ID = -25
+
+
+def events_of(chunks):
+    return [(chunk.split('\n', 1)[0][len('event: '):], json.loads(chunk.split('data: ', 1)[1]))
+            for chunk in chunks if not chunk.startswith(':')]
+
+
+def test_two_streams_follow_one_job():
+    """Every stream of a job gets each event in full (a second tab, a reconnect)"""
+    job = {'id': JOB_ID, 'status': 'running'}
+    streams = [stream_job_events(JOB_ID, lambda job_id: dict(job)) for _ in range(2)]
+    for stream in streams:
+        assert next(stream).startswith('event: snapshot\n')
+
+    _publish('etl_progress', json.dumps({'job_id': JOB_ID, 'stage': 'process_residents_csv', 'rows': 500}))
+    _publish('job_events', json.dumps({'job_id': JOB_ID + 1, 'status': 'succeeded'}))
+    job['status'] = 'succeeded'
+    _publish('job_events', json.dumps({'job_id': JOB_ID, 'status': 'succeeded'}))
+
+    for stream in streams:
+        events = events_of(stream)
+        assert [kind for kind, _ in events] == ['etl', 'job', 'snapshot']
+        assert events[0][1] == {'job_id': JOB_ID, 'stage': 'process_residents_csv', 'rows': 500}
+        assert events[1][1] == {'job_id': JOB_ID, 'status': 'succeeded'}
+        assert events[2][1]['status'] == 'succeeded'
+
+
+def test_subscribe_does_not_wait_for_a_running_listener(monkeypatch):
+    """Once the listener thread exists, subscribers do not block while it reconnects"""
+    monkeypatch.setattr(events, '_listener', threading.Thread(target=lambda: None))
+    monkeypatch.setattr(events, '_listening', threading.Event())
+    started = time.monotonic()
+    q = events.subscribe()
+    events.unsubscribe(q)
+    assert time.monotonic() - started < 1
@@ -0,0 +1,173 @@
+"""
+Tests for idempotent, resumable uploads (migrations/18_idempotent_uploads.sql)
+"""
+
+import io
+import random
+import socket
+import subprocess
+
+import pandas as pd
+
+from app.bulk_load import load_raw_residents
+from app.cleaning import clean_resident_values, map_resident_columns
+from app.db import get_cursor
+from app.ingest import row_hash
+from app.jobs import wait_for_job
+
+
+def upload(client, url, content, filename, force=False):
+    data = {'file': (io.BytesIO(content.encode('utf-8-sig')), filename)}
+    if force:
+        data['force'] = '1'
+    response = client.post(url, data=data, content_type='multipart/form-data',
+                           headers={'Accept': 'application/json'})
+    job = wait_for_job(response.get_json()['job_id'])
+    assert job['status'] == 'succeeded', job['error']
+    return job
+
+
+def etl_run(job_id):
+    with get_cursor() as cur:
+        cur.execute("SELECT * FROM etl_runs WHERE job_id = %s", (job_id,))
+        return cur.fetchone()
+
+
+def residents_csv(rows):
+    return 'lastname,father_name,streetname,buildingnumber,apartmentnumber\n' + ''.join(
+        f'{lastname},{father},באר שבע,{building},{apartment}\n'
+        for lastname, father, building, apartment in rows
+    )
+
+
+def new_residents(count):
+    tag = random.randrange(10**6, 10**7)
+    return [(f'אידמ{tag}', f'אב{i}', str(tag % 1000 + 100), str(i + 1)) for i in range(count)]
+
+
+def test_row_hash_matches_sql(db_connection):
+    """row_hash() is the md5(concat_ws(chr(31), ...)) the migration backfills with"""
+    values = ('93990', '93991|93992', 'מכובד', 'external_app')
+    cur = db_connection.cursor()
+    cur.execute("SELECT md5(concat_ws(chr(31), %s, %s, %s, %s))", values)
+    assert cur.fetchone()[0] == row_hash(values)
+    cur.close()
+    assert row_hash(('a', None)) == row_hash(('a', ''))
+    assert row_hash(('ab', 'c')) != row_hash(('a', 'bc'))
+
+
+def test_same_orders_file_is_skipped(authenticated_client):
+    """An unchanged file is not imported again; with force its orders are still not duplicated"""
+    sender = random.randrange(10**8, 10**9)
+    content = f'order_code,guest_list,rating\n{sender},{sender + 1},2\n{sender},{sender + 2},1\n'
+
+    first = upload(authenticated_client, '/upload-orders', content, 'orders.csv')
+    assert first['stats']['rows_loaded'] == 2
+
+    second = upload(authenticated_client, '/upload-orders', content, 'orders.csv')
+    assert second['stats'] == {'skipped': True, 'previous_run_id': etl_run(first['id'])['id']}
+    assert etl_run(second['id'])['status'] == 'skipped'
+
+    forced = upload(authenticated_client, '/upload-orders',
+                    content + f'{sender},{sender + 3},3\n', 'orders.csv', force=True)
+    assert (forced['stats']['rows_loaded'], forced['stats']['rows_already_loaded']) == (1, 2)
+
+    with get_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS count FROM outerapporder WHERE sender_code = %s", (str(sender),))
+        assert cur.fetchone()['count'] == 3
+
+
+def test_residents_rows_already_loaded_are_skipped(authenticated_client):
+    """Rows an earlier upload inserted are dropped from the next file's load"""
+    rows = new_residents(3)
+
+    first = upload(authenticated_client, '/upload-residents', residents_csv(rows[:2]), 'residents.csv')
+    assert (first['stats']['rows_loaded'], first['stats']['inserted']) == (2, 2)
+
+    second = upload(authenticated_client, '/upload-residents', residents_csv(rows), 'residents.csv')
+    assert (second['stats']['rows_loaded'], second['stats']['rows_already_loaded']) == (1, 2)
+    assert second['stats']['inserted'] == 1
+
+    forced = upload(authenticated_client, '/upload-residents', residents_csv(rows), 'residents.csv', force=True)
+    assert (forced['stats']['rows_loaded'], forced['stats']['rows_already_loaded']) == (3, 0)
+    assert (forced['stats']['processed'], forced['stats']['inserted']) == (3, 0)
+
+
+def stage_residents(db_connection, path):
+    """Load path through raw_to_temp_stage, as an upload does before processing"""
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype=str)
+    map_resident_columns(df)
+    clean_resident_values(df)
+    load_raw_residents(db_connection, df)
+    cur = db_connection.cursor()
+    cur.execute("SELECT raw_to_temp_stage()")
+    db_connection.commit()
+    cur.close()
+
+
+def interrupt_residents_run(db_connection, path):
+    """An etl_runs row for path whose worker died after staging and one processed batch"""
+    stage_residents(db_connection, path)
+    cur = db_connection.cursor()
+    cur.execute("SELECT process_residents_csv(1)")
+    db_connection.commit()
+
+    dead = subprocess.Popen(['true'])
+    dead.wait()
+    cur.execute("""
+        INSERT INTO etl_runs (kind, source, file_hash, worker, temp_fingerprint)
+        VALUES ('residents', 'web', encode(sha256(%s), 'hex'), %s, temp_residents_fingerprint())
+        RETURNING id
+    """, (path.read_bytes(), f'{socket.gethostname()}:{dead.pid}'))
+    run_id = cur.fetchone()[0]
+    db_connection.commit()
+    cur.close()
+    return run_id
+
+
+def test_interrupted_residents_run_is_resumed(authenticated_client, tmp_path, db_connection):
+    """A run whose worker died after raw_to_temp_stage continues from its last committed batch"""
+    content = residents_csv(new_residents(3))
+    path = tmp_path / 'residents.csv'
+    path.write_bytes(content.encode('utf-8-sig'))
+    interrupted_id = interrupt_residents_run(db_connection, path)
+
+    job = upload(authenticated_client, '/upload-residents', content, 'residents.csv')
+    assert job['stats']['resumed_from'] == interrupted_id
+    assert (job['stats']['rows_loaded'], job['stats']['processed'], job['stats']['inserted']) == (0, 3, 3)
+
+    run = etl_run(job['id'])
+    assert run['resumed_from'] == interrupted_id
+    with get_cursor() as cur:
+        cur.execute("SELECT stage, rows_in, rows_out FROM etl_run_stages WHERE run_id = %s ORDER BY seq",
+                    (run['id'],))
+        stages = [tuple(row.values()) for row in cur.fetchall()]
+    assert stages[0] == ('process_residents_csv', 2, 2)
+
+    with get_cursor() as cur:
+        cur.execute("SELECT status, error FROM etl_runs WHERE id = %s", (interrupted_id,))
+        assert tuple(cur.fetchone().values()) == ('failed', 'interrupted (worker process exited)')
+
+
+def test_interrupted_run_with_replaced_temp_is_loaded_again(authenticated_client, tmp_path, db_connection):
+    """Once another file went through raw_to_temp_stage, the interrupted run's file is loaded afresh"""
+    content = residents_csv(new_residents(3))
+    path = tmp_path / 'residents.csv'
+    path.write_bytes(content.encode('utf-8-sig'))
+    interrupted_id = interrupt_residents_run(db_connection, path)
+
+    other = tmp_path / 'other.csv'
+    other.write_bytes(residents_csv(new_residents(2)).encode('utf-8-sig'))
+    stage_residents(db_connection, other)
+
+    job = upload(authenticated_client, '/upload-residents', content, 'residents.csv')
+    assert job['stats']['resumed_from'] is None
+    assert (job['stats']['rows_loaded'], job['stats']['processed']) == (3, 3)
+    # the row the interrupted run processed is already in person
+    assert job['stats']['inserted'] == 2
+    assert etl_run(job['id'])['resumed_from'] is None
+    assert any('נטען מחדש' in message['text'] for message in job['messages'])
+
+    with get_cursor() as cur:
+        cur.execute("SELECT status FROM etl_runs WHERE id = %s", (interrupted_id,))
+        assert cur.fetchone()['status'] == 'failed'
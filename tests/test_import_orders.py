@@ -0,0 +1,90 @@
+"""
+Tests for importing orders from CSV (order_code + guest_list)
+"""
+
+import io
+
+import pytest
+
+from app.import_orders import import_orders_from_csv
+
+
+def make_upload(text, filename='orders.csv'):
+    """File-like object shaped like a werkzeug upload"""
+    upload = io.BytesIO(text.encode('utf-8-sig'))
+    upload.filename = filename
+    return upload
+
+
+@pytest.fixture
+def coded_people(db_connection):
+    """Three residents with codes 93001-93003 and no orders"""
+    cur = db_connection.cursor()
+    cur.execute("""
+        DELETE FROM "Order" o USING person p
+        WHERE p.code BETWEEN 93001 AND 93003
+          AND p.personid IN (o.delivery_sender_id, o.delivery_getter_id)
+    """)
+    cur.execute("DELETE FROM person WHERE code BETWEEN 93001 AND 93003")
+    cur.execute("""
+        INSERT INTO person (code, lastname, father_name, streetcode, buildingnumber,
+                            apartmentnumber, phone, autoreturn)
+        SELECT g, 'ייבוא', 'אב', 1, g::text, '1', '02' || g, false
+        FROM generate_series(93001, 93003) g
+        RETURNING code, personid
+    """)
+    ids = dict(cur.fetchall())
+    db_connection.commit()
+    cur.close()
+    return ids
+
+
+def test_import_orders_from_csv(db_connection, coded_people):
+    """Pairs are resolved by code, duplicates and unknown codes are counted"""
+    upload = make_upload(
+        "order_code,guest_list\n"
+        "93001,93002|93003|93999|abc\n"
+        "93001,93002\n"
+        "93998,93001\n"
+    )
+
+    stats = import_orders_from_csv(upload, db_connection)
+
+    assert stats == {
+        'total_orders': 3,
+        'total_pairs': 4,
+        'successful_pairs': 2,
+        'failed_pairs': 3,
+        'missing_senders': [93998],
+        'missing_receivers': [93999],
+    }
+
+    cur = db_connection.cursor()
+    cur.execute("""
+        SELECT delivery_getter_id FROM "Order"
+        WHERE delivery_sender_id = %s AND origin_type = 'csv_import'
+        ORDER BY delivery_getter_id
+    """, (coded_people[93001],))
+    assert [row[0] for row in cur.fetchall()] == [coded_people[93002], coded_people[93003]]
+    cur.close()
+
+    # Importing the same file again creates nothing new
+    stats = import_orders_from_csv(make_upload("order_code,guest_list\n93001,93002\n"), db_connection)
+    assert stats['successful_pairs'] == 0
+    assert stats['failed_pairs'] == 1
+
+
+def test_import_orders_across_chunks(db_connection, coded_people):
+    """Small chunks give the same result; duplicates across chunks are still skipped"""
+    upload = make_upload(
+        "order_code,guest_list\n"
+        "93001,93002\n"
+        "93002,93003\n"
+        "93001,93002|93003\n"
+    )
+
+    stats = import_orders_from_csv(upload, db_connection, chunksize=1)
+
+    assert stats['total_orders'] == 3
+    assert stats['successful_pairs'] == 3
+    assert stats['failed_pairs'] == 1
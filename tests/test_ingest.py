@@ -0,0 +1,89 @@
+"""
+Tests for chunked upload reading (app/ingest.py)
+"""
+
+import io
+
+import pandas as pd
+from openpyxl import Workbook
+
+from app.bulk_load import load_raw_residents
+from app.ingest import iter_upload_chunks
+
+
+def csv_upload(text):
+    return io.BytesIO(text.encode('utf-8-sig'))
+
+
+def xlsx_upload(rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_csv_chunks_keep_text():
+    """CSV is read chunksize rows at a time, cells as text (leading zeros kept)"""
+    chunks = list(iter_upload_chunks(
+        csv_upload(' code ,phone\n1,0501234567\n2,025551234\n3,\n'),
+        'residents.csv', chunksize=2
+    ))
+
+    assert [len(c) for c in chunks] == [2, 1]
+    assert list(chunks[0].columns) == ['code', 'phone']
+    assert chunks[0]['phone'].tolist() == ['0501234567', '025551234']
+    assert pd.isna(chunks[1]['phone'].iloc[0])
+
+
+def test_header_only_file_yields_empty_chunk():
+    """Callers can still check the columns of a file without rows"""
+    chunks = list(iter_upload_chunks(csv_upload('order_code,guest_list\n'), 'orders.csv'))
+    assert len(chunks) == 1
+    assert chunks[0].empty
+    assert list(chunks[0].columns) == ['order_code', 'guest_list']
+
+
+def test_xlsx_chunks():
+    """XLSX rows are streamed with openpyxl; blank rows are skipped, short rows padded"""
+    upload = xlsx_upload([
+        ['lastname ', 'code', None],
+        ['כהן', 101, 'x'],
+        [None, None, None],
+        ['לוי'],
+        ['מזרחי', 103, None],
+    ])
+
+    chunks = list(iter_upload_chunks(upload, 'residents.xlsx', chunksize=2))
+
+    assert [len(c) for c in chunks] == [2, 1]
+    assert list(chunks[0].columns) == ['lastname', 'code', 'Unnamed: 2']
+    assert chunks[0]['lastname'].tolist() == ['כהן', 'לוי']
+    assert chunks[0]['code'].iloc[0] == 101 and pd.isna(chunks[0]['code'].iloc[1])
+    assert chunks[0]['Unnamed: 2'].tolist() == ['x', None]
+    assert chunks[1]['code'].tolist() == [103]
+
+
+def test_load_raw_residents_from_chunks(db_connection):
+    """Chunks are loaded one after the other in one transaction"""
+    chunks = iter_upload_chunks(
+        csv_upload('code,lastname,phone\n' + ''.join(f'{i},טסט{i},0501234{i:03d}\n' for i in range(5))),
+        'residents.csv', chunksize=2
+    )
+    seen = []
+
+    stats = load_raw_residents(db_connection, chunks, on_chunk=seen.append)
+
+    assert stats['rows'] == 5
+    assert stats['chunks'] == 3
+    assert seen == [2, 4, 5]
+
+    cur = db_connection.cursor()
+    cur.execute("SELECT code, phone FROM raw_residents_csv ORDER BY raw_id")
+    rows = cur.fetchall()
+    assert rows[0] == ('0', '0501234000')
+    assert len(rows) == 5
+    cur.close()
@@ -0,0 +1,165 @@
+"""
+Tests for background jobs (app/jobs.py)
+"""
+
+import io
+import json
+import threading
+import time
+
+from app.jobs import submit_job, wait_for_job
+
+
+def counting_job(ctx, n):
+    ctx.stage('count', 10)
+    ctx.progress(rows_total=n, rows_done=0, force=True)
+    ctx.progress(rows_done=n, force=True)
+    ctx.message(f'✅ {n} rows counted', 'success')
+    return {'rows': n}
+
+
+def failing_job(ctx):
+    ctx.stage('explode')
+    raise ValueError('bad file')
+
+
+def test_job_reports_progress_and_stats():
+    """A finished job keeps its counters, messages and returned stats"""
+    job = wait_for_job(submit_job('test', counting_job, 7, params={'n': 7}))
+
+    assert job['status'] == 'succeeded'
+    assert job['stage'] == 'done'
+    assert float(job['progress']) == 100
+    assert (job['rows_done'], job['rows_total']) == (7, 7)
+    assert job['messages'] == [{'category': 'success', 'text': '✅ 7 rows counted'}]
+    assert job['stats'] == {'rows': 7}
+    assert job['params'] == {'n': 7}
+    assert job['started_at'] is not None and job['finished_at'] is not None
+
+
+def test_failed_job_records_error(tmp_path):
+    """Errors end up on the job row and the saved upload is removed"""
+    upload = tmp_path / 'upload.csv'
+    upload.write_text('x')
+
+    job = wait_for_job(submit_job('test', failing_job, cleanup_path=str(upload)))
+
+    assert job['status'] == 'failed'
+    assert job['stage'] == 'explode'
+    assert job['error'] == 'bad file'
+    assert not upload.exists()
+
+
+def test_import_orders_upload_returns_job(authenticated_client):
+    """Uploading returns a job id at once; /api/jobs/<id> has the result"""
+    response = authenticated_client.post(
+        '/import-orders-direct',
+        # force: the same file is uploaded by other tests (unchanged files are skipped)
+        data={'file': (io.BytesIO('order_code,guest_list\n93997,93996\n'.encode('utf-8-sig')), 'הזמנות.csv'),
+              'force': '1'},
+        content_type='multipart/form-data',
+        headers={'Accept': 'application/json'}
+    )
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert response.get_json()['status_url'] == f'/api/jobs/{job_id}'
+
+    wait_for_job(job_id)
+    job = authenticated_client.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'succeeded'
+    assert job['kind'] == 'orders_import'
+    assert job['filename'] == 'הזמנות.csv'
+    assert job['stats']['missing_senders'] == [93997]
+    assert any('שולחים חסרים' in m['text'] for m in job['messages'])
+
+
+def test_upload_form_redirects_to_job_page(authenticated_client):
+    """A browser form post lands on the job progress page"""
+    response = authenticated_client.post(
+        '/import-orders-direct',
+        data={'file': (io.BytesIO(b'order_code,guest_list\n'), 'orders.csv')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 302
+    assert '/jobs/' in response.location
+
+    wait_for_job(int(response.location.rsplit('/', 1)[1]))
+    page = authenticated_client.get(response.location)
+    assert page.status_code == 200
+
+
+def test_long_error_and_message(app):
+    """Errors and messages of any length are stored; the job does not stay running"""
+    def long_job(ctx):
+        ctx.message('תוצאה: ' + 'א' * 9000, 'success')
+        raise ValueError('x' * 9000)
+
+    job = wait_for_job(submit_job('test', long_job))
+    assert job['status'] == 'failed'
+    assert job['error'] == 'x' * 9000
+    assert len(job['messages'][-1]['text']) == 9007
+
+
+def test_imports_of_a_kind_wait_for_each_other(authenticated_client, db_connection):
+    """An upload waits while another session (a script, another job) holds its kind's lock"""
+    from app.jobs import get_job
+    from app.pipelines import ORDERS_LOCK
+
+    cur = db_connection.cursor()
+    cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (ORDERS_LOCK,))
+    db_connection.commit()
+    try:
+        response = authenticated_client.post(
+            '/upload-orders',
+            data={'file': (io.BytesIO(b'order_code,guest_list,rating\n93980,93981,1\n'), 'orders.csv'),
+                  'force': '1'},
+            content_type='multipart/form-data',
+            headers={'Accept': 'application/json'}
+        )
+        job_id = response.get_json()['job_id']
+        deadline = time.monotonic() + 10
+        while get_job(job_id)['stage'] != 'waiting for another import' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+        job = get_job(job_id)
+        assert (job['status'], job['stage']) == ('running', 'waiting for another import')
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (ORDERS_LOCK,))
+        db_connection.commit()
+        cur.close()
+
+    assert wait_for_job(job_id)['status'] == 'succeeded'
+
+
+def test_unknown_job(authenticated_client):
+    """Missing jobs are a 404 on the API"""
+    assert authenticated_client.get('/api/jobs/999999999').status_code == 404
+
+
+def test_job_events_stream(app):
+    """The SSE stream starts with a snapshot and relays job updates until the end"""
+    from app.app import job_json
+    from app.events import stream_job_events
+
+    release = threading.Event()
+
+    def waiting_job(ctx):
+        ctx.stage('waiting', 20)
+        release.wait(10)
+        ctx.message('✅ released', 'success')
+        return {'ok': True}
+
+    job_id = submit_job('test', waiting_job)
+    stream = stream_job_events(job_id, job_json)
+    first = next(stream)
+    assert first.startswith('event: snapshot\n')
+
+    release.set()
+    chunks = [chunk for chunk in stream if not chunk.startswith(':')]
+    kinds = [chunk.split('\n', 1)[0] for chunk in chunks]
+    assert 'event: job' in kinds
+    assert kinds[-1] == 'event: snapshot'
+
+    final = json.loads(chunks[-1].split('data: ', 1)[1])
+    assert final['status'] == 'succeeded'
+    assert final['messages'][-1]['text'] == '✅ released'
@@ -0,0 +1,69 @@
+"""
+Tests for request / query timing (app/metrics.py)
+"""
+
+from app import metrics
+from app.config import Config
+from app.db import get_cursor
+
+
+def test_fingerprint():
+    """Literals, numbers and IN lists collapse to one shape"""
+    assert metrics.fingerprint("SELECT *  FROM person\n WHERE code = 12 AND lastname = 'כהן''ס'") == \
+        'SELECT * FROM person WHERE code = ? AND lastname = ?'
+    assert metrics.fingerprint('SELECT * FROM t2 WHERE id IN (%s, %s, %s) LIMIT %s') == \
+        'SELECT * FROM t2 WHERE id IN (...) LIMIT ?'
+    # execute_values pages of any size share one entry
+    assert metrics.fingerprint("INSERT INTO o (a, b) VALUES (1, NOW()),(2, NOW())") == \
+        metrics.fingerprint("INSERT INTO o (a, b) VALUES (7, NOW())") + ', ...'
+
+
+def test_pooled_queries_are_recorded(monkeypatch):
+    """Every pooled cursor statement is timed; slow ones are logged with their call site"""
+    metrics.reset()
+    monkeypatch.setattr(Config, 'SLOW_QUERY_MS', 0)
+
+    with get_cursor() as cur:
+        cur.execute("SELECT generate_series(1, %s) AS n", (3,))
+        assert cur.fetchall()[0] == {'n': 1}
+
+    stats = [q for q in metrics.query_stats() if q['query'] == 'SELECT generate_series(?, ?) AS n']
+    assert len(stats) == 1
+    assert stats[0]['calls'] == 1
+    assert stats[0]['rows'] == 3
+    site = next(iter(stats[0]['call_sites']))
+    assert site.startswith('tests/test_metrics.py:') and site.endswith('test_pooled_queries_are_recorded')
+
+    slow = metrics.slow_queries()[0]
+    assert slow['id'] == stats[0]['id']
+    assert slow['call_site'] == site
+
+
+def test_request_timing_and_prometheus(authenticated_client):
+    """Requests get a Server-Timing header and show up on /metrics"""
+    metrics.reset()
+    response = authenticated_client.get('/api/query-stats')
+    assert response.status_code == 200
+    assert 'db;dur=' in response.headers['Server-Timing']
+
+    authenticated_client.get('/dashboard')
+    body = authenticated_client.get('/metrics').get_data(as_text=True)
+
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_count{endpoint="dashboard",method="GET",status="200"} 1' in body
+    assert 'db_query_duration_seconds_bucket{fingerprint=' in body
+    assert 'db_pool_in_use ' in body
+
+
+def test_metrics_token(client, app, monkeypatch):
+    """/metrics takes a bearer token instead of a session; without a token configured it needs a login"""
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', '')
+    response = client.get('/metrics')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics').status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
@@ -0,0 +1,93 @@
+"""
+Tests for EXPLAIN ANALYZE profiles (app/profiling.py)
+"""
+
+from app.db import get_cursor
+from app.jobs import wait_for_job
+from app.profiling import get_profile, profile_function, top_nodes
+
+
+def test_top_nodes_use_exclusive_time():
+    """A node's own time excludes its children; loops multiply per-loop times"""
+    plan = {
+        'Node Type': 'Nested Loop', 'Join Type': 'Inner',
+        'Actual Total Time': 10.0, 'Actual Loops': 1, 'Actual Rows': 5, 'Plan Rows': 4,
+        'Plans': [
+            {'Node Type': 'Seq Scan', 'Relation Name': 'person', 'Alias': 'p',
+             'Actual Total Time': 2.0, 'Actual Loops': 1, 'Actual Rows': 5},
+            {'Node Type': 'Index Scan', 'Relation Name': 'street', 'Alias': 's', 'Index Name': 'street_pkey',
+             'Actual Total Time': 1.5, 'Actual Loops': 5, 'Actual Rows': 1},
+        ],
+    }
+    nodes = top_nodes({0: plan})
+    assert [node['node'] for node in nodes] == [
+        'Index Scan using street_pkey on street s', 'Seq Scan on person p', 'Nested Loop (Inner)'
+    ]
+    assert [node['exclusive_ms'] for node in nodes] == [7.5, 2.0, 0.5]
+    assert nodes[0]['rows'] == 5 and nodes[0]['pct'] == 75.0
+
+
+def test_mutating_function_is_rolled_back(db_connection):
+    """Profiling runs the function for real, then nothing it changed is kept"""
+    cur = db_connection.cursor()
+    cur.execute("""
+        INSERT INTO raw_residents_csv (lastname, streetname, buildingnumber, apartmentnumber, standing_order)
+        VALUES ('פרופיל', 'באר שבע', '7', '7', 0)
+    """)
+    db_connection.commit()
+    cur.execute("SELECT (SELECT COUNT(*) FROM raw_residents_csv), (SELECT COUNT(*) FROM temp_residents_csv)")
+    before = cur.fetchone()
+    # raw_to_temp_stage truncates temp_residents_csv: don't hold a lock on it
+    db_connection.commit()
+
+    profile = get_profile(profile_function('raw_to_temp_stage', created_by='tests'))
+
+    cur.execute("SELECT (SELECT COUNT(*) FROM raw_residents_csv), (SELECT COUNT(*) FROM temp_residents_csv)")
+    assert cur.fetchone() == before
+    cur.close()
+
+    assert profile['volatility'] == 'v'
+    assert profile['query'] == 'SELECT "raw_to_temp_stage"()'
+    assert profile['execution_ms'] > 0
+    assert profile['plan']['Plan']['Node Type'] == 'Result'
+    assert profile['top_nodes']
+    if profile['functions'] is not None:
+        assert 'raw_to_temp_stage' in [func['function'] for func in profile['functions']]
+
+
+def test_profile_report_view(authenticated_client):
+    """The reports page profile button stores a plan and links to it"""
+    response = authenticated_client.post('/api/reports/profile?view=v_families_balance')
+    assert response.status_code == 200
+    data = response.get_json()
+
+    profile = authenticated_client.get(f"/api/profiles/{data['profile_id']}").get_json()
+    assert (profile['target_type'], profile['target'], profile['relation']) == \
+        ('view', 'v_families_balance', 'v_families_balance')
+    assert profile['top_nodes'][0]['pct'] > 0
+
+    page = authenticated_client.get(data['url'])
+    assert page.status_code == 200
+    assert b'ROLLBACK' in page.data
+    assert b'v_families_balance' in authenticated_client.get('/profiles').data
+
+    assert authenticated_client.post('/api/reports/profile?view=no_such_view').status_code == 400
+
+
+def test_run_procedures_profile_mode(authenticated_client):
+    """The profile checkbox queues a profile job instead of running the function"""
+    with get_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS count FROM \"Order\"")
+        orders = cur.fetchone()['count']
+
+    response = authenticated_client.post('/run-procedures', data={
+        'function_name': 'distribute_all_outer_orders', 'profile': '1'
+    }, headers={'Accept': 'application/json'})
+    job = wait_for_job(response.get_json()['job_id'])
+
+    assert job['status'] == 'succeeded'
+    assert job['kind'] == 'function_profile'
+    assert get_profile(job['stats']['profile_id'])['target'] == 'distribute_all_outer_orders'
+    with get_cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS count FROM \"Order\"")
+        assert cur.fetchone()['count'] == orders
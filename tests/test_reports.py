@@ -0,0 +1,134 @@
+"""
+Tests for the materialized report layer
+"""
+
+import pytest
+
+from app.jobs import wait_for_job
+from app.reports import refresh_reports
+from app.utils import get_view_data
+
+
+@pytest.fixture
+def report_people(db_connection):
+    """Two residents (codes 94001/94002) without orders; removed afterwards"""
+    cur = db_connection.cursor()
+
+    def cleanup():
+        cur.execute("""
+            DELETE FROM "Order" o USING person p
+            WHERE p.code IN (94001, 94002)
+              AND p.personid IN (o.delivery_sender_id, o.delivery_getter_id)
+        """)
+        cur.execute("DELETE FROM person WHERE code IN (94001, 94002)")
+        db_connection.commit()
+
+    cleanup()
+    cur.execute("""
+        INSERT INTO person (code, lastname, father_name, streetcode, buildingnumber,
+                            apartmentnumber, phone, autoreturn)
+        SELECT g, 'דוח', 'אב', 1, g::text, '1', '02' || g, false
+        FROM generate_series(94001, 94002) g
+        RETURNING code, personid
+    """)
+    ids = dict(cur.fetchall())
+    db_connection.commit()
+    yield ids
+    cleanup()
+    refresh_reports()
+    cur.close()
+
+
+def balance(personid, live):
+    data = get_view_data('v_families_balance', filters={'personid': personid}, live=live)
+    return data['source'], [row['sent'] for row in data['data']]
+
+
+def test_materialized_report_refresh(db_connection, report_people):
+    """The mv_* copy changes only on refresh; live=True reads the view"""
+    refresh_reports()
+    sender = report_people[94001]
+
+    cur = db_connection.cursor()
+    cur.execute(
+        'INSERT INTO "Order" (delivery_sender_id, delivery_getter_id, origin_type) VALUES (%s, %s, %s)',
+        (sender, report_people[94002], 'test')
+    )
+    db_connection.commit()
+    cur.close()
+
+    assert balance(sender, live=False) == ('materialized', [0])
+    assert balance(sender, live=True) == ('live', [1])
+
+    refreshed = refresh_reports('v_families_balance')
+    assert [row['view_name'] for row in refreshed] == ['v_families_balance']
+    assert balance(sender, live=False) == ('materialized', [1])
+
+
+def test_run_procedures_refreshes_reports(authenticated_client, db_connection, report_people):
+    """A function run from the run-procedures page brings the mv_* copies up to date"""
+    refresh_reports()
+    sender = report_people[94001]
+
+    cur = db_connection.cursor()
+    cur.execute(
+        'INSERT INTO "Order" (delivery_sender_id, delivery_getter_id, origin_type) VALUES (%s, %s, %s)',
+        (sender, report_people[94002], 'test')
+    )
+    db_connection.commit()
+    cur.close()
+    assert balance(sender, live=False) == ('materialized', [0])
+
+    response = authenticated_client.post('/run-procedures', data={
+        'function_name': 'distribute_all_outer_orders'
+    }, headers={'Accept': 'application/json'})
+    job = wait_for_job(response.get_json()['job_id'])
+
+    assert job['status'] == 'succeeded'
+    assert balance(sender, live=False) == ('materialized', [1])
+
+
+def test_refresh_reports_endpoint(authenticated_client):
+    """Refreshing all reports reports timings per view"""
+    response = authenticated_client.post('/api/reports/refresh')
+    assert response.status_code == 200
+    names = {row['view_name'] for row in response.get_json()['refreshed']}
+    assert {'v_families_balance', 'v_accounts_summary',
+            'v_packages_per_building', 'v_family_receipts'} <= names
+
+    data = authenticated_client.get('/api/view-data/v_accounts_summary?limit=5').get_json()
+    assert data['source'] == 'materialized'
+    assert data['refreshed_at']
+
+
+def test_person_order_stats_follow_orders(db_connection, report_people):
+    """Insert / update / delete on "Order" keep person_order_stats equal to a rebuild"""
+    a, b = report_people[94001], report_people[94002]
+    cur = db_connection.cursor()
+
+    def stats(personid):
+        cur.execute("""
+            SELECT sent_count, sent_price, received_count, received_regular, received_autoreturn
+            FROM person_order_stats WHERE personid = %s
+        """, (personid,))
+        return cur.fetchone()
+
+    cur.execute("""
+        INSERT INTO "Order" (delivery_sender_id, delivery_getter_id, price, origin_type)
+        VALUES (%s, %s, 10, 'test'), (%s, %s, NULL, 'autoreturn')
+    """, (a, b, b, a))
+    assert stats(a) == (1, 10, 1, 0, 1)
+    assert stats(b) == (1, 0, 1, 1, 0)
+
+    cur.execute('UPDATE "Order" SET price = 25 WHERE delivery_sender_id = %s', (a,))
+    cur.execute('DELETE FROM "Order" WHERE delivery_sender_id = %s', (b,))
+    assert stats(a) == (1, 25, 0, 0, 0)
+    assert stats(b) == (0, 0, 1, 1, 0)
+
+    # Rebuilding from scratch gives the same counters (people without orders drop out)
+    cur.execute('SELECT rebuild_person_order_stats()')
+    assert stats(a) == (1, 25, 0, 0, 0)
+    assert stats(b) == (0, 0, 1, 1, 0)
+
+    db_connection.rollback()
+    cur.close()
@@ -0,0 +1,59 @@
+"""
+Tests for the schema metadata cache
+"""
+
+import time
+
+from app import schema_cache
+from app.cache import TTLCache
+
+
+def test_ttl_cache_expiry_and_invalidate():
+    """Values are served from memory until they expire or are invalidated"""
+    cache = TTLCache(ttl=0.2)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return len(loads)
+
+    assert cache.get('k', loader) == 1
+    assert cache.get('k', loader) == 1
+    time.sleep(0.25)
+    assert cache.get('k', loader) == 2
+    cache.invalidate()
+    assert cache.get('k', loader) == 3
+    assert cache.stats()['hits'] == 1
+
+
+def test_ddl_invalidates_cache(db_connection):
+    """Creating a table is picked up through the schema_changed notification"""
+    cur = db_connection.cursor()
+    cur.execute("DROP TABLE IF EXISTS test_schema_cache")
+    db_connection.commit()
+
+    names = [t['name'] for t in schema_cache.tables()]
+    assert 'test_schema_cache' not in names
+
+    cur.execute("CREATE TABLE test_schema_cache (id INTEGER PRIMARY KEY, note TEXT)")
+    db_connection.commit()
+    try:
+        deadline = time.monotonic() + 5
+        while 'test_schema_cache' not in [t['name'] for t in schema_cache.tables()]:
+            assert time.monotonic() < deadline, 'cache was not invalidated'
+            time.sleep(0.05)
+        assert schema_cache.table_meta('test_schema_cache')['primary_key'] == ['id']
+    finally:
+        cur.execute("DROP TABLE test_schema_cache")
+        db_connection.commit()
+        cur.close()
+
+
+def test_schema_cache_refresh_endpoint(authenticated_client):
+    """Manual refresh drops all entries"""
+    schema_cache.views()
+    response = authenticated_client.post('/api/schema-cache/refresh')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success']
+    assert data['entries'] == 0
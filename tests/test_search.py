@@ -0,0 +1,58 @@
+"""
+Tests for table browser search
+"""
+
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from app.search import build_search_condition, get_search_index
+from app.utils import get_table_columns
+
+
+def search_ids(cur, condition, params):
+    cur.execute(
+        sql.SQL('SELECT personid FROM person WHERE {} ORDER BY personid').format(condition),
+        params
+    )
+    return [row['personid'] for row in cur.fetchall()]
+
+
+def test_search_falls_back_to_ilike(db_connection):
+    """Without a registered index every text column is searched with ILIKE"""
+    cur = db_connection.cursor(cursor_factory=RealDictCursor)
+    cur.execute("DELETE FROM search_index WHERE table_name = 'person'")
+
+    columns = get_table_columns(cur, 'person')
+    condition, params, method = build_search_condition(columns, 'כהן', get_search_index(cur, 'person'))
+
+    assert method == 'ilike'
+    assert len(params) == len([c for c, t in columns if t == 'text'])
+
+    db_connection.rollback()
+    cur.close()
+
+
+def test_search_uses_indexed_expression(db_connection):
+    """A registered index is searched on its own expression with the same results"""
+    cur = db_connection.cursor(cursor_factory=RealDictCursor)
+    columns = get_table_columns(cur, 'person')
+    cur.execute("DELETE FROM search_index WHERE table_name = 'person'")
+    plain = search_ids(cur, *build_search_condition(columns, '05', get_search_index(cur, 'person'))[:2])
+
+    # Stand-in for the GIN trigram index (pg_trgm may be missing on the test server)
+    indexed = ['lastname', 'father_name', 'phone', 'mobile']
+    cur.execute("SELECT search_expression(%s) AS expression", (indexed,))
+    cur.execute(f"CREATE INDEX test_search_person ON person ({cur.fetchone()['expression']})")
+    cur.execute(
+        "INSERT INTO search_index (table_name, columns, index_name) VALUES ('person', %s, 'test_search_person')",
+        (indexed,)
+    )
+
+    condition, params, method = build_search_condition(columns, '05', get_search_index(cur, 'person'))
+    assert method == 'trigram'
+    # Expression plus the text columns that are not in the index
+    assert len(params) == 1 + len([c for c, t in columns if t == 'text' and c not in indexed])
+    assert search_ids(cur, condition, params) == plain
+
+    db_connection.rollback()
+    cur.close()